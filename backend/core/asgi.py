@@ -11,12 +11,17 @@ import os
 
 from django.core.asgi import get_asgi_application
 from channels.routing import ProtocolTypeRouter, URLRouter
-from terminal import routing
+from terminal import handoff, mirror, routing
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
 
 app = get_asgi_application()
 
+# Take over live sessions from the worker we are replacing, if any
+handoff.start()
+# Serve the offline lesson mirror, if enabled
+mirror.start()
+
 application = ProtocolTypeRouter(
     {
         "http": app,
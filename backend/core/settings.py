@@ -149,6 +149,105 @@ CHANNEL_LAYERS = {
     }
 }
 
+# PATH inside the sandbox; also what the completion service indexes
+SANDBOX_PATH = '/usr/local/bin:/usr/bin:/bin'
+
+# Terminal channels
+# Extra shells a single WebSocket connection may multiplex (including the first)
+TERMINAL_MAX_CHANNELS = 4
+
+# Shell startup
+# Seconds a new shell gets to print its first prompt before we stop waiting for it
+TERMINAL_SPAWN_TIMEOUT = 5
+# Directory to record raw PTY output of every channel as pty traces for bench_output (empty disables)
+TERMINAL_TRACE_DIR = os.getenv('TERMINAL_TRACE_DIR', '')
+
+# Connect tracing (optional)
+# Per-phase spans for connect, shell spawn and disconnect, batched as OTLP/JSON lines to a file
+# or a "unix:/path" collector socket (empty disables); summarize with `manage.py trace_report`
+TERMINAL_TRACE_EXPORT = os.getenv('TERMINAL_TRACE_EXPORT', '')
+TERMINAL_TRACE_SAMPLE_RATE = float(os.getenv('TERMINAL_TRACE_SAMPLE_RATE', '0.1'))  # Share of connects traced
+TRACE_FLUSH_INTERVAL = 2.0  # Seconds between batched writes
+TRACE_BATCH_SIZE = 256  # Spans per exported line
+TRACE_MAX_QUEUE = 10000  # Spans buffered before new ones are dropped
+
+# Scrollback search
+# Every channel's full output history, compressed on disk so clients can search past what
+# the browser keeps. Off unless set: it costs disk per channel on every worker (empty disables)
+TERMINAL_SCROLLBACK_DIR = os.getenv('TERMINAL_SCROLLBACK_DIR', '')
+SCROLLBACK_MAX_BYTES = 16 * 1024 * 1024  # Compressed history per channel; later output isn't recorded
+SCROLLBACK_SEARCH_PAGE_SIZE = 50  # Matches per search_results message
+SCROLLBACK_SEARCH_MAX_RESULTS = 1000  # Matches per search before the client has to ask for more
+SCROLLBACK_SEARCH_THREADS = 2  # Search threads per worker, separate from the sync_to_async executor
+
+# Output compression
+# Clients that ask for it (?compress=deflate) get large frames as one deflate stream per connection
+TERMINAL_COMPRESSION_ENABLED = True
+TERMINAL_COMPRESSION_MIN_BYTES = 256  # Smaller frames go out as plain text
+
+# Compile cache (optional)
+# Shared ccache seeded by the server with the shipped examples and mounted read-only into
+# every sandbox; sessions compile into their own cache layer (empty disables)
+TERMINAL_COMPILE_CACHE_DIR = os.getenv('TERMINAL_COMPILE_CACHE_DIR', '')
+SESSION_COMPILE_CACHE_SIZE = '64M'  # ccache max_size of each session's own layer
+
+# Lesson mirror (optional)
+# Offline HTTP(S) proxy that answers sandboxed curl/wget from a cache filled by
+# `manage.py seed_mirror` (empty disables)
+TERMINAL_MIRROR_DIR = os.getenv('TERMINAL_MIRROR_DIR', '')
+TERMINAL_MIRROR_URLS = [  # What seed_mirror fetches by default; the lessons in welcome.txt
+    'https://example.com/',
+    'http://example.com/',
+    'http://google.com/',
+    'https://google.com/',
+]
+TERMINAL_MIRROR_FETCH = False  # Fetch and cache misses instead of refusing them (needs outbound access)
+# Hosts misses may be fetched from; None means the hosts in TERMINAL_MIRROR_URLS
+TERMINAL_MIRROR_FETCH_HOSTS = None
+
+# Heartbeat
+TERMINAL_HEARTBEAT_INTERVAL = 20  # Seconds between server pings to each session
+TERMINAL_HEARTBEAT_TIMEOUT = 60  # Seconds without client traffic before a session is reclaimed
+
+# Instructor live view
+# Shared secret for observer WebSockets and the session dashboard; empty disables both
+TERMINAL_INSTRUCTOR_TOKEN = os.getenv('TERMINAL_INSTRUCTOR_TOKEN', '')
+OBSERVER_QUEUE_SIZE = 256  # Frames buffered per observer before dropping
+DASHBOARD_THUMBNAIL_INTERVAL = 5  # Seconds between thumbnail re-renders
+
+# Workspace import/export
+# Upper bound on the total size of an uploaded archive; individual files are
+# also capped at the sandbox --rlimit-fsize
+WORKSPACE_IMPORT_MAX_BYTES = 512 * 1024 * 1024  # 512MB
+
+# Workspace persistence (opt-in)
+# When enabled, clients that pass a stable ?identity= get their workspace
+# snapshotted on disconnect and restored on their next connect
+WORKSPACE_PERSISTENCE_ENABLED = os.getenv('WORKSPACE_PERSISTENCE', 'False').lower() == 'true'
+WORKSPACE_SNAPSHOT_DIR = os.getenv('WORKSPACE_SNAPSHOT_DIR', '/tmp/terminal_sessions/snapshots')
+# Snapshots untouched for this long are deleted, along with blobs only they used
+WORKSPACE_SNAPSHOT_RETENTION_DAYS = int(os.getenv('WORKSPACE_SNAPSHOT_RETENTION_DAYS', '30'))
+
+# Operations
+# Shared secret for operator-only endpoints such as the sampling profiler; empty disables them
+TERMINAL_ADMIN_TOKEN = os.getenv('TERMINAL_ADMIN_TOKEN', '')
+PROFILER_MAX_SECONDS = 60  # Longest profile a single request may run
+
+# Audit trail
+# SQLite database for blocked and monitored commands (empty disables auditing)
+TERMINAL_AUDIT_DB = os.getenv('TERMINAL_AUDIT_DB', '/tmp/terminal_sessions/audit.sqlite3')
+AUDIT_FLUSH_INTERVAL = 1.0  # Seconds between batched writes
+AUDIT_BATCH_SIZE = 500  # Buffered events that trigger an early write
+AUDIT_RETENTION_DAYS = 90
+
+# Rolling restarts
+# Unix socket a new worker uses to take live PTYs over from the one it replaces (empty disables).
+# Use one path per worker slot; old and new worker must run side by side, e.g. behind a proxy
+# or on a socket-activated listening fd, while clients reconnect.
+TERMINAL_HANDOFF_SOCKET = os.getenv('TERMINAL_HANDOFF_SOCKET', '')
+# Seconds a handed-off session waits for its client to reconnect before it is discarded
+TERMINAL_HANDOFF_CLAIM_TIMEOUT = 120
+
 # CORS settings
 CORS_ALLOWED_ORIGINS = [
     "http://localhost:5173",
@@ -20,5 +20,13 @@ from terminal import views
 
 urlpatterns = [
     # path('admin/', admin.site.urls),
-    path("", views.index, name="index")
+    path("", views.index, name="index"),
+    path("dashboard/", views.dashboard, name="dashboard"),
+    path("workspace/<str:session_id>/export/", views.workspace_export, name="workspace_export"),
+    path("workspace/<str:session_id>/import/", views.workspace_import, name="workspace_import"),
+    path("ops/stats/", views.ops_stats, name="ops_stats"),
+    path("ops/sessions/", views.session_list, name="session_list"),
+    path("ops/sessions/<str:session_id>/kill/", views.session_kill, name="session_kill"),
+    path("ops/audit/", views.audit_search, name="audit_search"),
+    path("ops/profile/", views.profile_worker, name="profile_worker"),
 ]
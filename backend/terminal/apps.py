@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class TerminalConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'terminal'
+
+    def ready(self):
+        # Index sandbox commands once at startup so completions never scan PATH
+        from .completion import get_command_index
+        get_command_index()
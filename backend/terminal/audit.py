@@ -0,0 +1,236 @@
+"""Searchable audit trail of security-relevant terminal events.
+
+Blocked commands and monitored network commands are buffered in memory and
+written by a background thread, one transaction per batch, to a SQLite
+database in WAL mode. Command text is indexed with FTS5 using the trigram
+tokenizer, so substring searches such as "who ran wget in the last week"
+use the index instead of scanning. Events older than the retention period
+are pruned by the same thread.
+"""
+import atexit
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY,
+    ts REAL NOT NULL,
+    session TEXT NOT NULL,
+    identity TEXT,
+    client TEXT,
+    action TEXT NOT NULL,
+    reason TEXT,
+    command TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS events_ts ON events (ts);
+CREATE INDEX IF NOT EXISTS events_session_ts ON events (session, ts);
+CREATE INDEX IF NOT EXISTS events_identity_ts ON events (identity, ts);
+CREATE TRIGGER IF NOT EXISTS events_fts_insert AFTER INSERT ON events BEGIN
+    INSERT INTO events_fts (rowid, command) VALUES (new.id, new.command);
+END;
+CREATE TRIGGER IF NOT EXISTS events_fts_delete AFTER DELETE ON events BEGIN
+    INSERT INTO events_fts (events_fts, rowid, command) VALUES ('delete', old.id, old.command);
+END;
+"""
+
+# Trigram matching finds any substring of 3+ characters; older SQLite builds fall back to words
+FTS_TABLES = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS events_fts USING fts5("
+    "command, content='events', content_rowid='id', tokenize='trigram')",
+    "CREATE VIRTUAL TABLE IF NOT EXISTS events_fts USING fts5("
+    "command, content='events', content_rowid='id')",
+)
+
+COLUMNS = ('id', 'ts', 'session', 'identity', 'client', 'action', 'reason', 'command')
+PRUNE_INTERVAL = 3600  # seconds
+PRUNE_CHUNK = 5000
+MAX_RESULTS = 1000
+
+ACTION_BLOCKED = 'blocked'
+ACTION_MONITORED = 'monitored'
+
+
+class AuditStore:
+    """The SQLite database itself; safe to share between threads"""
+
+    def __init__(self, path):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        for statement in FTS_TABLES:
+            try:
+                self._conn.execute(statement)
+                break
+            except sqlite3.OperationalError as e:
+                logger.warning(f"Audit full-text index option unavailable ({e}), trying the next one")
+        self._conn.executescript(SCHEMA)
+
+    def insert_many(self, rows):
+        """Write a batch of (ts, session, identity, client, action, reason, command) in one transaction"""
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(
+                    "INSERT INTO events (ts, session, identity, client, action, reason, command) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    rows,
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def prune(self, older_than):
+        """Delete events recorded before the given unix time; returns how many went"""
+        removed = 0
+        while True:
+            # Small transactions so searches and batch writes aren't held up behind a big delete
+            with self._lock:
+                cursor = self._conn.execute(
+                    "DELETE FROM events WHERE id IN (SELECT id FROM events WHERE ts < ? ORDER BY ts LIMIT ?)",
+                    (older_than, PRUNE_CHUNK),
+                )
+            removed += cursor.rowcount
+            if cursor.rowcount < PRUNE_CHUNK:
+                return removed
+
+    def search(self, text=None, session=None, identity=None, action=None, since=None, until=None, limit=100):
+        """Matching events, newest first"""
+        clauses = []
+        params = []
+        for column, value in (('session', session), ('identity', identity), ('action', action)):
+            if value:
+                clauses.append(f"e.{column} = ?")
+                params.append(value)
+        if since is not None:
+            clauses.append("e.ts >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("e.ts < ?")
+            params.append(until)
+        columns = ', '.join('e.' + c for c in COLUMNS)
+
+        if text and len(text) >= 3:
+            # Batches are written in time order, so rowid order is time order: walk the
+            # full-text matches newest first and stop at the limit, bounded below by the
+            # first row inside the time window. The phrase quoting keeps user input from
+            # being parsed as FTS query syntax.
+            clauses.insert(0, "events_fts MATCH ?")
+            params.insert(0, '"' + text.replace('"', '""') + '"')
+            if since is not None:
+                clauses.append("f.rowid >= coalesce((SELECT id FROM events WHERE ts >= ? ORDER BY ts LIMIT 1), 0)")
+                params.append(since)
+            query = (
+                f"SELECT {columns} FROM events_fts f JOIN events e ON e.id = f.rowid "
+                f"WHERE {' AND '.join(clauses)} ORDER BY f.rowid DESC LIMIT ?"
+            )
+        else:
+            if text:
+                # Too short for a trigram; fall back to a scan of the (time-bounded) rows
+                clauses.append("e.command LIKE ? ESCAPE '\\'")
+                escaped = text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+                params.append(f"%{escaped}%")
+            where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+            query = f"SELECT {columns} FROM events e {where} ORDER BY e.ts DESC LIMIT ?"
+
+        # SQLite treats a negative LIMIT as no limit at all
+        params.append(max(1, min(limit, MAX_RESULTS)))
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        return [dict(zip(COLUMNS, row)) for row in rows]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class AuditLog:
+    """In-memory buffer in front of an AuditStore, flushed by a background thread"""
+
+    def __init__(self, store, flush_interval=1.0, batch_size=500, retention_days=90):
+        self.store = store
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.retention_days = retention_days
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._last_prune = 0.0
+        self._thread = threading.Thread(target=self._run, name='terminal-audit', daemon=True)
+        self._thread.start()
+
+    def record(self, session, action, reason, command, identity=None, client=None):
+        """Queue an event; never blocks on the database"""
+        with self._lock:
+            self._buffer.append((time.time(), session, identity, client, action, reason, command))
+            full = len(self._buffer) >= self.batch_size
+        if full:
+            self._wake.set()
+
+    def flush(self):
+        """Write everything buffered so far; returns once it is committed"""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._buffer = self._buffer, []
+            if batch:
+                try:
+                    self.store.insert_many(batch)
+                except sqlite3.Error as e:
+                    logger.error(f"Failed to write {len(batch)} audit events: {e}")
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+            now = time.time()
+            if now - self._last_prune >= PRUNE_INTERVAL:
+                self._last_prune = now
+                try:
+                    removed = self.store.prune(now - self.retention_days * 86400)
+                    if removed:
+                        logger.info(f"Pruned {removed} audit events older than {self.retention_days} days")
+                except sqlite3.Error as e:
+                    logger.error(f"Failed to prune audit events: {e}")
+
+
+_log = None
+_log_lock = threading.Lock()
+
+
+def get_audit_log():
+    """The worker's audit log, or None when TERMINAL_AUDIT_DB is empty"""
+    global _log
+    from django.conf import settings
+    path = getattr(settings, 'TERMINAL_AUDIT_DB', '')
+    if not path:
+        return None
+    with _log_lock:
+        if _log is None:
+            _log = AuditLog(
+                AuditStore(path),
+                flush_interval=getattr(settings, 'AUDIT_FLUSH_INTERVAL', 1.0),
+                batch_size=getattr(settings, 'AUDIT_BATCH_SIZE', 500),
+                retention_days=getattr(settings, 'AUDIT_RETENTION_DAYS', 90),
+            )
+            # Don't lose the last unflushed second of events on shutdown
+            atexit.register(_log.flush)
+    return _log
+
+
+def record(session, action, reason, command, identity=None, client=None):
+    """Record an audit event if auditing is enabled"""
+    log = get_audit_log()
+    if log is not None:
+        log.record(session, action, reason, command, identity, client)
@@ -0,0 +1,183 @@
+"""Built-in trace corpus for the output pipeline benchmark.
+
+The traces are generated deterministically instead of being shipped as
+recordings, so they carry no host details and every run measures the same
+bytes. Each one imitates the shape of a real workload: how big its reads
+are, which escape sequences it uses and how often. Real captures made with
+``record_trace`` or TERMINAL_TRACE_DIR can be replayed alongside them.
+"""
+import random
+
+from ..ptytrace import Trace
+
+ESC = '\x1b'
+
+
+def _chunked(data, rng, low, high, start=0.0, step=0.0005):
+    """Split a byte string into reads of random size, as a busy PTY would deliver it"""
+    events = []
+    at = start
+    pos = 0
+    while pos < len(data):
+        size = rng.randint(low, high)
+        events.append((round(at, 6), data[pos:pos + size]))
+        pos += size
+        at += step
+    return events
+
+
+def vim_session(rng):
+    """Full-screen editor: alternate screen, syntax colours, cursor moves and per-keystroke redraws"""
+    events = []
+    at = 0.0
+    screen = [f"{ESC}[?1049h{ESC}[22;0;0t{ESC}[?1h{ESC}={ESC}[H{ESC}[2J"]
+    words = ['def', 'return', 'import', 'for', 'in', 'if', 'else', 'print', 'self', 'value']
+    for row in range(1, 23):
+        code = ' '.join(rng.choice(words) for _ in range(rng.randint(2, 8)))
+        screen.append(f"{ESC}[{row};1H{ESC}[33m{row:3d} {ESC}[m{ESC}[38;5;130m{code}{ESC}[m{ESC}[K")
+    screen.append(f"{ESC}[24;1H\"hello.py\" 22L, 640B{ESC}[24;63H1,1{ESC}[11CAll{ESC}[1;5H{ESC}[?25h")
+    events.append((at, ''.join(screen).encode()))
+    for _ in range(1500):
+        at += rng.uniform(0.03, 0.15)
+        row, col = rng.randint(1, 22), rng.randint(5, 70)
+        keystroke = rng.choice('abcdefghijklmnopqrstuvwxyz ')
+        events.append((round(at, 6), (
+            f"{ESC}[?25l{ESC}[{row};{col}H{ESC}[38;5;130m{keystroke}{ESC}[m"
+            f"{ESC}[24;63H{row},{col - 4}{ESC}[K{ESC}[{row};{col + 1}H{ESC}[?25h"
+        ).encode()))
+    at += 0.2
+    events.append((round(at, 6), f"{ESC}[24;1H{ESC}[K:wq\r\n{ESC}[?1l{ESC}>{ESC}[?1049l".encode()))
+    return Trace('vim', events)
+
+
+def top_refresh(rng):
+    """Periodic full redraws with bold and reverse video, like top's default 1s refresh"""
+    events = []
+    commands = ['bash', 'python3', 'node', 'gcc', 'cc1', 'make', 'top', 'sshd', 'vim', 'daphne']
+    for frame in range(60):
+        lines = [
+            f"{ESC}[H{ESC}[mtop - 10:{frame // 60:02d}:{frame % 60:02d} up 3 days,  1 user,  load average: "
+            f"{rng.uniform(0, 4):.2f}, {rng.uniform(0, 4):.2f}, {rng.uniform(0, 4):.2f}{ESC}[K",
+            f"Tasks:{ESC}[1m {rng.randint(80, 200)} {ESC}[mtotal,{ESC}[1m   1 {ESC}[mrunning{ESC}[K",
+            f"%Cpu(s):{ESC}[1m {rng.uniform(0, 100):4.1f} {ESC}[mus,{ESC}[1m  {rng.uniform(0, 10):3.1f} {ESC}[msy{ESC}[K",
+            f"MiB Mem :{ESC}[1m  15927.4 {ESC}[mtotal,{ESC}[1m   {rng.uniform(1000, 9000):6.1f} {ESC}[mfree{ESC}[K",
+            f"{ESC}[K",
+            f"{ESC}[7m    PID USER      PR  NI    VIRT    RES    SHR S  %CPU  %MEM     TIME+ COMMAND   {ESC}[m{ESC}[K",
+        ]
+        for _ in range(17):
+            bold = ESC + '[1m' if rng.random() < 0.2 else ''
+            lines.append(
+                f"{bold}{rng.randint(1, 99999):7d} learner   20   0 {rng.randint(1000, 900000):7d} "
+                f"{rng.randint(100, 90000):6d} {rng.randint(100, 9000):6d} S {rng.uniform(0, 50):5.1f} "
+                f"{rng.uniform(0, 5):5.1f}   0:{rng.randint(0, 59):02d}.{rng.randint(0, 99):02d} "
+                f"{rng.choice(commands):<9}{ESC}[m{ESC}[K"
+            )
+        events.extend(_chunked(('\r\n'.join(lines) + f"{ESC}[J").encode(), rng, 1024, 4096, start=float(frame)))
+    return Trace('top', events)
+
+
+def compiler_errors(rng):
+    """gcc diagnostics with colour, source excerpts and caret lines"""
+    parts = []
+    for i in range(400):
+        line, col = rng.randint(1, 400), rng.randint(1, 40)
+        kind, colour = rng.choice([('error', '01;31'), ('warning', '01;35'), ('note', '01;36')])
+        message = rng.choice([
+            "expected ';' before '}' token",
+            "implicit declaration of function 'prinf'; did you mean 'printf'?",
+            "unused variable 'tmp' [-Wunused-variable]",
+            "'count' undeclared (first use in this function)",
+            "passing argument 1 of 'strlen' makes pointer from integer without a cast",
+        ])
+        parts.append(
+            f"{ESC}[01m{ESC}[Ksrc/module{i % 7}.c:{line}:{col}:{ESC}[m{ESC}[K "
+            f"{ESC}[{colour}m{ESC}[K{kind}: {ESC}[m{ESC}[K{message}\n"
+            f"  {line:3d} |     int count = compute(value{ESC}[01;31m{ESC}[K){ESC}[m{ESC}[K\n"
+            f"      |     {' ' * col}{ESC}[01;31m{ESC}[K^{ESC}[m{ESC}[K\n"
+        )
+    parts.append("make: *** [Makefile:12: all] Error 1\n")
+    return Trace('compiler_errors', _chunked(''.join(parts).encode(), rng, 512, 4096, step=0.002))
+
+
+def utf8_heavy(rng):
+    """Multi-byte text (CJK, emoji, combining marks, box drawing) cut at arbitrary byte offsets"""
+    alphabet = (
+        '日本語のテキスト中文字符한국어текст'
+        '😀🚀🐧✨🔥'
+        'éäô'
+        '─│┌┐└┘├┤┬┴┼'
+    )
+    lines = []
+    for _ in range(4000):
+        lines.append(''.join(rng.choice(alphabet) for _ in range(rng.randint(10, 60))))
+    return Trace('utf8_heavy', _chunked('\n'.join(lines).encode('utf-8'), rng, 1, 4096))
+
+
+def shell_session(rng):
+    """Everyday prompt work: coloured ls -la listings, git status, grep hits and cat'd logs"""
+    events = []
+    at = 0.0
+    names = ['main.py', 'notes.txt', 'Makefile', 'README.md', 'script.sh', 'data.csv', 'src', 'tests', 'build', '.git']
+    months = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
+    for _ in range(200):
+        at += rng.uniform(0.5, 3.0)
+        command = rng.choice(['ls -la', 'git status', 'grep -rn TODO .', 'tail log.txt'])
+        lines = [command]
+        if command == 'ls -la':
+            lines.append(f"total {rng.randint(8, 200)}")
+            for name in rng.sample(names, rng.randint(3, len(names))):
+                is_dir = '.' not in name.strip('.')
+                mode = 'drwxr-xr-x' if is_dir else rng.choice(['-rw-r--r--', '-rwxr-xr-x'])
+                colour = '01;34' if is_dir else ('01;32' if 'x' in mode[3] else '00')
+                lines.append(
+                    f"{mode} {rng.randint(1, 4)} learner learner {rng.randint(0, 99999):5d} "
+                    f"{rng.choice(months)} {rng.randint(1, 28):2d} {rng.randint(0, 23):02d}:{rng.randint(0, 59):02d} "
+                    f"{ESC}[{colour}m{name}{ESC}[0m"
+                )
+        elif command == 'git status':
+            lines += ["On branch main", "Changes not staged for commit:",
+                      '  (use "git add <file>..." to update what will be committed)', ""]
+            for name in rng.sample(names[:6], rng.randint(1, 4)):
+                lines.append(f"\t{ESC}[31mmodified:   {name}{ESC}[m")
+        elif command.startswith('grep'):
+            for _ in range(rng.randint(1, 12)):
+                lines.append(
+                    f"{ESC}[35m{ESC}[K./{rng.choice(names[:6])}{ESC}[m{ESC}[K{ESC}[36m{ESC}[K:{ESC}[m{ESC}[K"
+                    f"{ESC}[32m{ESC}[K{rng.randint(1, 500)}{ESC}[m{ESC}[K{ESC}[36m{ESC}[K:{ESC}[m{ESC}[K"
+                    f"    # {ESC}[01;31m{ESC}[KTODO{ESC}[m{ESC}[K: handle the empty case"
+                )
+        else:
+            for _ in range(10):
+                lines.append(
+                    f"2024-05-{rng.randint(1, 28):02d} {rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}:"
+                    f"{rng.randint(0, 59):02d} {rng.choice(['INFO', 'INFO', 'WARNING', 'ERROR'])} "
+                    f"worker-{rng.randint(1, 4)}: processed {rng.randint(1, 900)} items"
+                )
+        events.append((round(at, 6), ('\r\n'.join(lines) + '\r\n$ ').encode()))
+    return Trace('shell', events)
+
+
+def yes_flood(rng, size=4 * 1024 * 1024):
+    """`yes` at full speed: the PTY hands over full reads of 'y' lines back to back"""
+    data = b'y\r\n' * (size // 3)
+    return Trace('yes_flood', _chunked(data, rng, 4096, 4096, step=0.0001))
+
+
+GENERATORS = {
+    'shell': shell_session,
+    'vim': vim_session,
+    'top': top_refresh,
+    'compiler_errors': compiler_errors,
+    'utf8_heavy': utf8_heavy,
+    'yes_flood': yes_flood,
+}
+
+
+def builtin_traces(names=None, seed=1234):
+    """Generate the built-in corpus (or the named subset) from a fixed seed"""
+    traces = []
+    for name, generate in GENERATORS.items():
+        if names and name not in names:
+            continue
+        traces.append(generate(random.Random(f"{seed}-{name}")))
+    return traces
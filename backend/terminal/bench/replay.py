@@ -0,0 +1,190 @@
+"""Replay pty traces through TerminalConsumer's output pipeline.
+
+Each captured read goes through ``TerminalConsumer.handle_output_bytes``,
+the same decode, filter, frame and send path ``read_output`` uses. Sends go
+to a stub socket instead of a real WebSocket. Traces are replayed as fast as
+possible, and each recorded read is re-split to PTY_READ_SIZE as os.read
+would deliver it.
+
+Timing and memory are measured in separate passes because tracemalloc
+slows execution. CPython has no cumulative allocation counter, so the
+memory figure is bytes allocated per KB of input. It is taken from
+tracemalloc's peak above the starting point for each read, which makes it
+a lower bound on the real churn.
+
+A third pass runs each frame through a FrameCompressor with the shipped
+dictionary. That gives the bytes a compressing client would receive.
+
+Absolute MB/s and milliseconds depend on the machine, so each trace is also
+replayed through a baseline in the same run. The baseline does only the
+unavoidable work: decode, chunk, JSON-frame, send and yield between chunks.
+``speed_ratio`` is baseline time over pipeline time and ``p99_ratio`` is the
+pipeline's 99th-percentile read over the baseline's mean read. Thresholds
+are written against those ratios; allocations per KB do not depend on
+machine speed and stay absolute. A slower CI runner slows
+both passes alike.
+"""
+import asyncio
+import codecs
+import json
+import time
+import tracemalloc
+
+from ..compression import FrameCompressor, load_dictionary
+from ..consumers import DEFAULT_CHANNEL, MAX_OUTPUT_CHUNK, PTY_READ_SIZE, ShellChannel, TerminalConsumer
+
+# Baseline passes are cheap, so the fastest of a few is kept to damp scheduler noise
+BASELINE_REPEATS = 3
+
+
+class StubSocket:
+    """Stands in for the WebSocket: counts frames and bytes, optionally keeping or compressing them"""
+
+    def __init__(self, compressor=None, keep=False):
+        self.frames = 0
+        self.bytes = 0
+        self.compressor = compressor
+        self.kept = [] if keep else None
+
+    async def send(self, text_data=None, bytes_data=None, close=False):
+        self.frames += 1
+        self.bytes += len(text_data or bytes_data or '')
+        if self.kept is not None and text_data is not None:
+            self.kept.append(text_data)
+        if self.compressor is not None and text_data is not None:
+            self.compressor.encode(text_data)
+
+
+def _reads(trace):
+    for _, data in trace.events:
+        for start in range(0, len(data), PTY_READ_SIZE):
+            yield data[start:start + PTY_READ_SIZE]
+
+
+def _pipeline(compressor=None, keep=False):
+    consumer = TerminalConsumer()
+    consumer.broadcaster = None
+    socket = StubSocket(compressor, keep)
+    consumer.send = socket.send
+    return consumer, ShellChannel(DEFAULT_CHANNEL, None, None), socket
+
+
+def _percentile(ordered, fraction):
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+async def _time_trace(trace):
+    consumer, channel, socket = _pipeline()
+    latencies = []
+    started = time.perf_counter()
+    for data in _reads(trace):
+        read_started = time.perf_counter()
+        await consumer.handle_output_bytes(channel, data)
+        latencies.append(time.perf_counter() - read_started)
+    elapsed = time.perf_counter() - started
+    return elapsed, sorted(latencies), socket
+
+
+async def _baseline_read(decoder, socket, data):
+    text = decoder.decode(data)
+    while text:
+        chunk = text[:MAX_OUTPUT_CHUNK]
+        text = text[MAX_OUTPUT_CHUNK:]
+        await socket.send(text_data=json.dumps({"type": "output", "data": chunk}))
+        if text:
+            await asyncio.sleep(0.005)
+
+
+async def _time_baseline(trace):
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    socket = StubSocket()
+    latencies = []
+    started = time.perf_counter()
+    for data in _reads(trace):
+        read_started = time.perf_counter()
+        await _baseline_read(decoder, socket, data)
+        latencies.append(time.perf_counter() - read_started)
+    return time.perf_counter() - started, sorted(latencies)
+
+
+async def _measure_allocations(trace):
+    consumer, channel, _ = _pipeline()
+    allocated = 0
+    tracemalloc.start()
+    try:
+        for data in _reads(trace):
+            before, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            await consumer.handle_output_bytes(channel, data)
+            _, peak = tracemalloc.get_traced_memory()
+            allocated += max(0, peak - before)
+    finally:
+        tracemalloc.stop()
+    return allocated
+
+
+async def _measure_wire_bytes(trace):
+    consumer, channel, socket = _pipeline(FrameCompressor(dictionary=load_dictionary()))
+    for data in _reads(trace):
+        await consumer.handle_output_bytes(channel, data)
+    return socket.compressor.wire_bytes
+
+
+async def _collect_frames(trace):
+    consumer, channel, socket = _pipeline(keep=True)
+    for data in _reads(trace):
+        await consumer.handle_output_bytes(channel, data)
+    return socket.kept
+
+
+def frames_of(trace):
+    """The text frames the pipeline sends for a trace, e.g. to train the compression dictionary"""
+    return asyncio.run(_collect_frames(trace))
+
+
+def run_trace(trace):
+    """Benchmark one trace; returns a flat dict of metrics"""
+    elapsed, latencies, socket = asyncio.run(_time_trace(trace))
+    allocated = asyncio.run(_measure_allocations(trace))
+    wire_bytes = asyncio.run(_measure_wire_bytes(trace))
+    baseline_elapsed, baseline_latencies = min(
+        asyncio.run(_time_baseline(trace)) for _ in range(BASELINE_REPEATS)
+    )
+    # Baseline reads take microseconds, so their mean is a steadier yardstick than their tail
+    baseline_read = baseline_elapsed / len(baseline_latencies) if baseline_latencies else 0.0
+    size = trace.size
+    return {
+        "name": trace.name,
+        "input_kb": round(size / 1024, 1),
+        "reads": len(latencies),
+        "frames": socket.frames,
+        "output_kb": round(socket.bytes / 1024, 1),
+        "wire_kb": round(wire_bytes / 1024, 1),
+        "mb_per_s": round(size / (1024 * 1024) / elapsed, 2) if elapsed else 0.0,
+        "p50_read_ms": round(_percentile(latencies, 0.50) * 1000, 3),
+        "p99_read_ms": round(_percentile(latencies, 0.99) * 1000, 3),
+        "max_read_ms": round(latencies[-1] * 1000, 3) if latencies else 0.0,
+        "alloc_bytes_per_kb": round(allocated / (size / 1024)) if size else 0,
+        "speed_ratio": round(baseline_elapsed / elapsed, 3) if elapsed else 0.0,
+        "p99_ratio": round(_percentile(latencies, 0.99) / baseline_read, 2) if baseline_read else 0.0,
+        "realtime_factor": round(trace.duration / elapsed, 1) if elapsed else 0.0,
+    }
+
+
+def check_thresholds(result, thresholds):
+    """Regressions for one result; thresholds map trace names (or 'default') to min_/max_ limits"""
+    limits = dict(thresholds.get('default', {}))
+    limits.update(thresholds.get(result['name'], {}))
+    failures = []
+    for key, limit in limits.items():
+        bound, _, metric = key.partition('_')
+        value = result.get(metric)
+        if value is None:
+            continue
+        if bound == 'min' and value < limit:
+            failures.append(f"{result['name']}: {metric} {value} < {limit}")
+        elif bound == 'max' and value > limit:
+            failures.append(f"{result['name']}: {metric} {value} > {limit}")
+    return failures
@@ -0,0 +1,127 @@
+"""Read-only fan-out of a session's terminal output to observers.
+
+Output frames are serialized once by the student's consumer and the same
+string is handed to every observer. Each observer drains its own bounded
+queue, so a slow observer loses frames instead of delaying the student.
+"""
+import asyncio
+import re
+import time
+from collections import deque
+
+# Strips CSI/OSC escape sequences when rendering thumbnails
+ANSI_ESCAPE_RE = re.compile(r'\x1b\[[0-?]*[ -/]*[@-~]|\x1b\][^\x07\x1b]*(?:\x07|\x1b\\)?|\x1b[@-_]')
+
+TAIL_BYTES = 8192  # Recent output kept per session for late joiners and thumbnails
+THUMBNAIL_LINES = 12
+THUMBNAIL_COLUMNS = 80
+
+_broadcasters = {}
+
+
+class ObserverQueue:
+    """Bounded per-observer frame queue that drops on overflow"""
+
+    def __init__(self, maxsize):
+        self.queue = asyncio.Queue(maxsize=maxsize)
+        self.dropped = 0
+        self.queued_bytes = 0
+
+    def offer(self, frame):
+        try:
+            self.queue.put_nowait(frame)
+            self.queued_bytes += len(frame)
+        except asyncio.QueueFull:
+            self.dropped += 1
+
+    def end(self):
+        """Wake the observer with an end-of-stream marker, evicting a frame if needed"""
+        if self.queue.full():
+            evicted = self.queue.get_nowait()
+            self.queued_bytes -= len(evicted) if evicted else 0
+            self.dropped += 1
+        self.queue.put_nowait(None)
+
+    async def get(self):
+        frame = await self.queue.get()
+        if frame:
+            self.queued_bytes -= len(frame)
+        return frame
+
+
+class SessionBroadcaster:
+    """Per-session hub between the student's consumer and its observers"""
+
+    def __init__(self, session_id):
+        self.session_id = session_id
+        self.started = time.time()
+        self.observers = set()
+        self._tail = deque()
+        self._tail_size = 0
+        self._thumbnail = ''
+        self._thumbnail_at = 0.0
+        self._dirty = False
+
+    def publish(self, frame, text):
+        """Deliver an already-encoded frame to every observer and remember its text"""
+        for observer in self.observers:
+            observer.offer(frame)
+
+        self._tail.append(text)
+        self._tail_size += len(text)
+        while self._tail_size > TAIL_BYTES and len(self._tail) > 1:
+            self._tail_size -= len(self._tail.popleft())
+        self._dirty = True
+
+    def subscribe(self, maxsize):
+        observer = ObserverQueue(maxsize)
+        self.observers.add(observer)
+        return observer
+
+    def unsubscribe(self, observer):
+        self.observers.discard(observer)
+
+    def tail(self):
+        return ''.join(self._tail)
+
+    def buffered_bytes(self):
+        """Replay tail plus frames waiting in observer queues"""
+        return self._tail_size + sum(observer.queued_bytes for observer in self.observers)
+
+    def thumbnail(self, max_age):
+        """Plain-text view of the last few screen lines, re-rendered at most every max_age seconds"""
+        now = time.monotonic()
+        if self._dirty and now - self._thumbnail_at >= max_age:
+            text = ANSI_ESCAPE_RE.sub('', self.tail()).replace('\r', '')
+            lines = text.split('\n')[-THUMBNAIL_LINES:]
+            self._thumbnail = '\n'.join(line[:THUMBNAIL_COLUMNS] for line in lines)
+            self._thumbnail_at = now
+            self._dirty = False
+        return self._thumbnail
+
+    def close(self):
+        for observer in self.observers:
+            observer.end()
+        self.observers.clear()
+
+
+def open_session(session_id):
+    """Create the broadcaster for a newly connected session"""
+    broadcaster = SessionBroadcaster(session_id)
+    _broadcasters[session_id] = broadcaster
+    return broadcaster
+
+
+def close_session(broadcaster):
+    """Disconnect all observers and forget the broadcaster"""
+    broadcaster.close()
+    if _broadcasters.get(broadcaster.session_id) is broadcaster:
+        del _broadcasters[broadcaster.session_id]
+
+
+def get_broadcaster(session_id):
+    return _broadcasters.get(session_id)
+
+
+def all_broadcasters():
+    return list(_broadcasters.values())
@@ -0,0 +1,159 @@
+"""Compile caches for sandboxed shells.
+
+Every workspace ships the same ``projects/hello.c``, and welcome.txt tells
+each student to compile it, so a class pays for the same compile dozens of
+times. With TERMINAL_COMPILE_CACHE_DIR set, each sandbox gets two ccache
+layers:
+
+- The shared cache holds entries the server itself compiled from its own
+  copy of the shipped sources. It is attached read-only as ccache remote
+  storage, so every student's first ``gcc hello.c -o hello`` is a hit.
+- A per-session cache in the workspace takes everything the student
+  compiles, so their repeat builds hit too.
+
+Paths handed to the shell are the ones it sees. Under firejail
+``--private`` the workspace is mounted as the sandbox's home directory, so
+the per-session caches live under that home rather than the workspace's
+host path, which doesn't exist inside the sandbox.
+
+Sandboxes never write to the shared cache. ccache keys on the inputs, but
+it can't check that a stored object really came from them, and a writable
+shared cache would let one student plant objects for everyone else.
+
+The same reasoning applies to Python bytecode. The importer trusts a
+``.pyc`` whose recorded source mtime and size match, and every sandbox
+sees its workspace at the same path, so a shared ``__pycache__`` prefix
+could be poisoned the same way. Each session gets a private
+PYTHONPYCACHEPREFIX instead, which keeps its imports cached without
+littering the workspace.
+"""
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Debian's ccache package puts gcc/g++/cc wrappers here
+CCACHE_MASQUERADE_DIR = '/usr/lib/ccache'
+SESSION_CCACHE = os.path.join('.cache', 'ccache')
+SESSION_PYCACHE = os.path.join('.cache', 'pycache')
+# Compiles the workspace template tells students to run, as (source, directory, argv)
+SEED_COMPILES = [
+    ('projects/hello.c', 'projects', ['gcc', 'hello.c', '-o', 'hello']),
+]
+SEED_TIMEOUT = 60
+
+_seeded = False  # Set once a seed succeeds; a failed one is retried by the next new session
+_seeding = False
+_seed_lock = threading.Lock()
+
+
+def shared_dir():
+    """Root of the shared cache, or '' when compile caching is disabled"""
+    return getattr(settings, 'TERMINAL_COMPILE_CACHE_DIR', '')
+
+
+def shared_ccache_dir(root):
+    return os.path.join(root, 'ccache')
+
+
+def ccache_available():
+    return bool(shutil.which('ccache')) and os.path.isdir(CCACHE_MASQUERADE_DIR)
+
+
+def _ccache_env(cache_dir, base_dir):
+    return {
+        'CCACHE_DIR': cache_dir,
+        # Workspaces live at different paths; hash paths relative to the workspace instead
+        'CCACHE_BASEDIR': base_dir,
+        # firejail's private-bin copies gcc, so its mtime differs from the one the server saw
+        'CCACHE_COMPILERCHECK': 'content',
+    }
+
+
+def sandbox_env(home, path):
+    """Environment for a session's shell: cache settings plus the PATH to use
+
+    home is where the shell sees the workspace: its host path, or the
+    sandbox's home directory under firejail.
+    """
+    root = shared_dir()
+    if not root:
+        return {}
+    env = {'PYTHONPYCACHEPREFIX': os.path.join(home, SESSION_PYCACHE)}
+    if ccache_available():
+        env.update(_ccache_env(os.path.join(home, SESSION_CCACHE), home))
+        env.update({
+            'PATH': f"{CCACHE_MASQUERADE_DIR}:{path}",
+            'CCACHE_MAXSIZE': getattr(settings, 'SESSION_COMPILE_CACHE_SIZE', '64M'),
+            'CCACHE_REMOTE_STORAGE': f"file:{shared_ccache_dir(root)}|read-only",
+        })
+    return env
+
+
+def sandbox_read_only_paths():
+    """Paths to mount read-only into every sandbox"""
+    root = shared_dir()
+    return [root] if root and os.path.isdir(root) else []
+
+
+def seed_from_workspace(workspace):
+    """Fill the shared cache from a freshly created (still untouched) workspace, once per worker.
+
+    Runs in a background thread so the first session doesn't wait on gcc.
+    """
+    global _seeding
+    root = shared_dir()
+    if not root or not ccache_available():
+        return
+    with _seed_lock:
+        if _seeded or _seeding:
+            return
+        _seeding = True
+        # Copy now, before the student's shell exists, so only template content gets compiled
+        staging = tempfile.mkdtemp(prefix='compile_cache_seed_')
+        try:
+            for source, _, _ in SEED_COMPILES:
+                target = os.path.join(staging, source)
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                shutil.copyfile(os.path.join(workspace, source), target)
+        except OSError as e:
+            logger.warning(f"Not seeding the compile cache: {e}")
+            shutil.rmtree(staging, ignore_errors=True)
+            _seeding = False
+            return
+    threading.Thread(target=_seed, args=(root, staging), name='compile-cache-seed', daemon=True).start()
+
+
+def _seed(root, staging):
+    global _seeded, _seeding
+    cache_dir = shared_ccache_dir(root)
+    succeeded = False
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        env = os.environ.copy()
+        env.update(_ccache_env(cache_dir, staging))
+        env['PATH'] = f"{CCACHE_MASQUERADE_DIR}:{settings.SANDBOX_PATH}"
+        for _, directory, argv in SEED_COMPILES:
+            cwd = os.path.join(staging, directory)
+            # ccache leaves -o out of the key, so the output can go anywhere
+            result = subprocess.run(
+                argv, cwd=cwd, env=env, capture_output=True, timeout=SEED_TIMEOUT,
+            )
+            if result.returncode != 0:
+                logger.warning(f"Compile cache seed '{' '.join(argv)}' failed: {result.stderr.decode(errors='replace')[:200]}")
+                return
+        succeeded = True
+        logger.info(f"Seeded shared compile cache at {cache_dir}")
+    except (OSError, subprocess.SubprocessError) as e:
+        logger.warning(f"Failed to seed the compile cache: {e}")
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+        with _seed_lock:
+            _seeded = succeeded
+            _seeding = False
@@ -0,0 +1,256 @@
+"""Command and workspace path completion served without a PTY round trip.
+
+Executables on the sandbox PATH are indexed once per process; each session
+gets a lazily built index of its workspace that is kept current from
+filesystem events. Both are sorted arrays queried with bisect, with a short
+TTL cache in front for repeated keystrokes.
+
+The workspace is walked in a worker thread, never on the event loop, and
+path completions answer from whatever is indexed so far (flagged partial)
+until the walk finishes.
+"""
+import asyncio
+import bisect
+import logging
+import os
+import time
+
+from asgiref.sync import sync_to_async
+
+try:
+    import watchfiles
+except ImportError:  # pragma: no cover - optional dependency
+    watchfiles = None
+
+logger = logging.getLogger(__name__)
+
+MAX_MATCHES = 50
+MAX_WORKSPACE_ENTRIES = 20000
+CACHE_TTL = 2.0  # seconds
+CACHE_SIZE = 256
+
+# Builtins bash resolves without PATH lookup
+SHELL_BUILTINS = (
+    'alias', 'bg', 'cd', 'echo', 'exit', 'export', 'fg', 'help', 'history',
+    'jobs', 'printf', 'pwd', 'read', 'set', 'source', 'type', 'ulimit',
+    'umask', 'unalias', 'unset',
+)
+
+
+class PrefixIndex:
+    """Sorted array of strings supporting prefix queries and incremental updates"""
+
+    def __init__(self, entries=()):
+        self.entries = sorted(set(entries))
+        self.generation = 0
+
+    def add(self, entry):
+        i = bisect.bisect_left(self.entries, entry)
+        if i == len(self.entries) or self.entries[i] != entry:
+            self.entries.insert(i, entry)
+            self.generation += 1
+
+    def update(self, entries):
+        """Add many entries at once (e.g. a directory moved into the workspace)"""
+        merged = sorted(set(self.entries).union(entries))
+        if len(merged) != len(self.entries):
+            self.entries = merged
+            self.generation += 1
+
+    def discard(self, entry):
+        i = bisect.bisect_left(self.entries, entry)
+        if i < len(self.entries) and self.entries[i] == entry:
+            del self.entries[i]
+            self.generation += 1
+
+    def discard_prefix(self, prefix):
+        """Remove every entry starting with prefix (e.g. a deleted directory's contents)"""
+        lo = bisect.bisect_left(self.entries, prefix)
+        hi = lo
+        while hi < len(self.entries) and self.entries[hi].startswith(prefix):
+            hi += 1
+        if hi > lo:
+            del self.entries[lo:hi]
+            self.generation += 1
+
+    def query(self, prefix, limit=MAX_MATCHES):
+        i = bisect.bisect_left(self.entries, prefix)
+        matches = []
+        while i < len(self.entries) and len(matches) < limit:
+            entry = self.entries[i]
+            if not entry.startswith(prefix):
+                break
+            matches.append(entry)
+            i += 1
+        return matches
+
+
+class CompletionCache:
+    """Tiny TTL cache keyed by (kind, prefix), invalidated by index generation"""
+
+    def __init__(self, ttl=CACHE_TTL, size=CACHE_SIZE):
+        self.ttl = ttl
+        self.size = size
+        self._entries = {}
+
+    def get(self, key, generation):
+        hit = self._entries.get(key)
+        if hit and hit[0] == generation and time.monotonic() - hit[1] < self.ttl:
+            return hit[2]
+        return None
+
+    def put(self, key, generation, matches):
+        if len(self._entries) >= self.size:
+            # Evict the oldest insertion
+            self._entries.pop(next(iter(self._entries)))
+        self._entries[key] = (generation, time.monotonic(), matches)
+
+    def buffered_bytes(self):
+        return sum(len(match) for _, _, matches in self._entries.values() for match in matches)
+
+
+def scan_executables(search_path):
+    """Names of executables reachable through a PATH string, plus shell builtins"""
+    names = set(SHELL_BUILTINS)
+    for directory in search_path.split(os.pathsep):
+        try:
+            with os.scandir(directory) as it:
+                for entry in it:
+                    try:
+                        if entry.is_file() and os.access(entry.path, os.X_OK):
+                            names.add(entry.name)
+                    except OSError:
+                        continue
+        except OSError:
+            continue
+    return names
+
+
+_command_index = None
+
+
+def get_command_index():
+    """Process-wide index of sandbox commands, built on first use"""
+    global _command_index
+    if _command_index is None:
+        from django.conf import settings
+        started = time.perf_counter()
+        _command_index = PrefixIndex(scan_executables(settings.SANDBOX_PATH))
+        logger.info(
+            f"Indexed {len(_command_index.entries)} sandbox commands in "
+            f"{(time.perf_counter() - started) * 1000:.1f}ms"
+        )
+    return _command_index
+
+
+class WorkspaceIndex:
+    """Paths inside one session's workspace, relative to it; directories end with '/'"""
+
+    def __init__(self, root):
+        self.root = root
+        self.index = PrefixIndex()
+        self.ready = False
+        self._stop = asyncio.Event()
+        self._task = None
+
+    def _relative(self, path, is_dir):
+        rel = os.path.relpath(path, self.root)
+        return rel + '/' if is_dir else rel
+
+    def _scan(self, top=None, limit=MAX_WORKSPACE_ENTRIES):
+        entries = []
+        for dirpath, dirnames, filenames in os.walk(top or self.root):
+            for name in dirnames:
+                entries.append(self._relative(os.path.join(dirpath, name), True))
+            for name in filenames:
+                entries.append(self._relative(os.path.join(dirpath, name), False))
+            if len(entries) >= limit:
+                logger.warning(f"Workspace index truncated at {MAX_WORKSPACE_ENTRIES} entries: {self.root}")
+                break
+        return entries
+
+    def start(self):
+        """Index the workspace in a thread, then follow filesystem events (inotify via watchfiles) if available"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        started = time.perf_counter()
+        try:
+            self.index.update(await sync_to_async(self._scan, thread_sensitive=False)())
+        except Exception as e:
+            logger.warning(f"Failed to index workspace {self.root}: {e}")
+        finally:
+            self.ready = True
+        logger.debug(
+            f"Indexed {len(self.index.entries)} workspace paths in {(time.perf_counter() - started) * 1000:.1f}ms"
+        )
+        if watchfiles is not None:
+            await self._watch()
+
+    async def _watch(self):
+        try:
+            async for changes in watchfiles.awatch(self.root, stop_event=self._stop, debounce=200, step=20):
+                for change, path in changes:
+                    await self._apply(change, path)
+        except Exception as e:
+            logger.warning(f"Workspace watcher stopped for {self.root}: {e}")
+
+    async def _apply(self, change, path):
+        if change == watchfiles.Change.deleted:
+            rel = os.path.relpath(path, self.root)
+            self.index.discard(rel)
+            self.index.discard_prefix(rel + '/')
+        elif change == watchfiles.Change.added:
+            room = MAX_WORKSPACE_ENTRIES - len(self.index.entries)
+            if room <= 0:
+                return
+            is_dir = os.path.isdir(path)
+            self.index.add(self._relative(path, is_dir))
+            if is_dir:
+                # A directory moved in arrives as one event; its contents don't get their own
+                self.index.update(await sync_to_async(self._scan, thread_sensitive=False)(path, room))
+
+    def stop(self):
+        self._stop.set()
+
+
+class SessionCompleter:
+    """Completion front end for one terminal session"""
+
+    def __init__(self, workspace):
+        self.workspace = workspace
+        self.cache = CompletionCache()
+        self._files = None
+
+    def files(self):
+        """The workspace index, which starts building in the background on first use"""
+        if self._files is None:
+            self._files = WorkspaceIndex(self.workspace)
+            self._files.start()
+        return self._files
+
+    def complete(self, kind, prefix):
+        """Matches for prefix, and whether they are partial because the workspace is still being indexed"""
+        if kind == 'command':
+            index, partial = get_command_index(), False
+        else:
+            files = self.files()
+            index, partial = files.index, not files.ready
+        key = (kind, prefix)
+        matches = self.cache.get(key, index.generation)
+        if matches is None:
+            matches = index.query(prefix)
+            self.cache.put(key, index.generation, matches)
+        return matches, partial
+
+    def buffered_bytes(self):
+        """Approximate text held by the completion cache and the workspace file index"""
+        size = self.cache.buffered_bytes()
+        if self._files is not None:
+            size += sum(len(entry) for entry in self._files.index.entries)
+        return size
+
+    def close(self):
+        if self._files is not None:
+            self._files.stop()
@@ -0,0 +1,164 @@
+"""Compressed output frames for terminal WebSockets.
+
+Daphne has no permessage-deflate, so compression happens at the
+application level. A client that sends ``?compress=deflate`` gets one raw
+deflate stream per connection. Every large frame is the next piece of that
+stream, sync-flushed and sent as a binary message. The client feeds all
+binary messages into a single ``DecompressionStream('deflate-raw')``, so
+repeated prompts, colour codes and listings are coded as back-references
+to earlier frames. Each frame's JSON text is followed by a newline, which
+JSON never contains raw, so the client can split the inflated stream back
+into messages. Frames under the size threshold go out as plain text.
+
+The stream starts from a preset dictionary of typical terminal frames
+(``compression_dict.txt``, built by ``manage.py build_compression_dict``).
+Browsers can't take a dictionary directly, so the client loads the same
+bytes into its inflater as stored deflate blocks and discards what comes
+out. The client names its copy by ``?dict=<id>``, and the server only uses
+the dictionary when both ids match.
+"""
+import hashlib
+import os
+import re
+import zlib
+from collections import Counter
+
+DICTIONARY_PATH = os.path.join(os.path.dirname(__file__), 'compression_dict.txt')
+# Deflate only reaches back 32KB, and the client has to load the dictionary with stored blocks
+MAX_DICTIONARY_SIZE = 32 * 1024
+FRAME_SEPARATOR = b"\n"
+# zlib's documented deflate footprint for windowBits=15, memLevel=8
+DEFLATE_STATE_BYTES = (1 << (15 + 2)) + (1 << (8 + 9))
+
+_dictionary = None
+# Counters of connections that have closed on this worker
+_closed = {"sessions": 0, "raw_bytes": 0, "wire_bytes": 0}
+
+
+def load_dictionary():
+    """The shipped preset dictionary as bytes (empty when the file is missing)"""
+    global _dictionary
+    if _dictionary is None:
+        try:
+            with open(DICTIONARY_PATH, 'rb') as f:
+                _dictionary = f.read()[-MAX_DICTIONARY_SIZE:]
+        except OSError:
+            _dictionary = b""
+    return _dictionary
+
+
+def dictionary_id(data):
+    return hashlib.sha256(data).hexdigest()[:16] if data else ""
+
+
+class FrameCompressor:
+    """Per-connection deflate context plus counters of what it saved"""
+
+    def __init__(self, min_size=256, level=6, dictionary=b""):
+        self.min_size = min_size
+        self.dictionary_id = dictionary_id(dictionary)
+        if dictionary:
+            self._compressor = zlib.compressobj(level, zlib.DEFLATED, -15, 8, zlib.Z_DEFAULT_STRATEGY, dictionary)
+        else:
+            self._compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+        self.frames = 0
+        self.compressed_frames = 0
+        self.raw_bytes = 0
+        self.wire_bytes = 0
+
+    def encode(self, text_data):
+        """(text_data, bytes_data) to put on the wire for one outgoing text frame"""
+        raw = text_data.encode('utf-8')
+        self.frames += 1
+        self.raw_bytes += len(raw)
+        if len(raw) < self.min_size:
+            self.wire_bytes += len(raw)
+            return text_data, None
+        compressed = self._compressor.compress(raw + FRAME_SEPARATOR) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+        self.compressed_frames += 1
+        self.wire_bytes += len(compressed)
+        return None, compressed
+
+    def memory_bytes(self):
+        return DEFLATE_STATE_BYTES
+
+    def stats(self):
+        saved = self.raw_bytes - self.wire_bytes
+        return {
+            "frames": self.frames,
+            "compressed_frames": self.compressed_frames,
+            "raw_bytes": self.raw_bytes,
+            "wire_bytes": self.wire_bytes,
+            "saved_bytes": saved,
+            "saved_pct": round(100 * saved / self.raw_bytes, 1) if self.raw_bytes else 0.0,
+            "dictionary": self.dictionary_id or None,
+        }
+
+
+def negotiate(query, enabled=True, min_size=256):
+    """A FrameCompressor for a connection whose query string asked for one, else None"""
+    if not enabled or 'deflate' not in query.get('compress', []):
+        return None
+    dictionary = load_dictionary()
+    if not dictionary or query.get('dict', [''])[0] != dictionary_id(dictionary):
+        # The client has another dictionary (or none); plain deflate still works
+        dictionary = b""
+    return FrameCompressor(min_size=min_size, dictionary=dictionary)
+
+
+def session_closed(compressor):
+    _closed["sessions"] += 1
+    _closed["raw_bytes"] += compressor.raw_bytes
+    _closed["wire_bytes"] += compressor.wire_bytes
+
+
+def report(live):
+    """Savings per live session (a dict of session id to compressor) plus totals for closed ones"""
+    saved = _closed["raw_bytes"] - _closed["wire_bytes"]
+    return {
+        "sessions": {session_id: compressor.stats() for session_id, compressor in live.items()},
+        "closed": dict(_closed, saved_bytes=saved),
+    }
+
+
+# Frames split into escape sequences, JSON escapes, words and runs of the same separator
+_PIECE_RE = re.compile(r'\\u001b\[[0-9;?]*[A-Za-z]|\\u001b.|\\u[0-9a-fA-F]{4}|\\[nrt"\\]|\w+|(\W)\1*')
+
+
+def train_dictionary(frames, size=8 * 1024, max_piece_run=6):
+    """Build a preset dictionary from sample frames.
+
+    Candidates are runs of up to ``max_piece_run`` consecutive pieces (escape
+    sequences, words, punctuation). A candidate's score is its length times
+    the number of frames it appears in, since the dictionary pays off for
+    strings a session's first frames are likely to contain. The best
+    candidates are packed until the dictionary is full. They go last,
+    because deflate codes nearer back-references more cheaply.
+    """
+    counts = Counter()
+    for frame in frames:
+        pieces = [m.group(0) for m in _PIECE_RE.finditer(frame)]
+        seen = set()
+        for start in range(len(pieces)):
+            candidate = ''
+            for piece in pieces[start:start + max_piece_run]:
+                candidate += piece
+                if len(candidate) >= 4:
+                    seen.add(candidate)
+        counts.update(seen)
+    scored = sorted(
+        (count * len(candidate), candidate) for candidate, count in counts.items() if count > 1
+    )
+    chosen = []
+    used = 0
+    for _, candidate in reversed(scored):
+        encoded = candidate.encode('utf-8')
+        if used + len(encoded) > size:
+            continue
+        if any(candidate in kept for kept in chosen):
+            continue
+        chosen.append(candidate)
+        used += len(encoded)
+        if used >= size - 4:
+            break
+    return ''.join(reversed(chosen)).encode('utf-8')
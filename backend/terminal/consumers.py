@@ -1,18 +1,31 @@
 import os
+import codecs
 import json
+import pwd
 import tempfile
 import shutil
 import subprocess
 from urllib.parse import parse_qs
 from channels.generic.websocket import AsyncWebsocketConsumer
 from asgiref.sync import sync_to_async
+from django.conf import settings
 import fcntl
 import pty
 import asyncio
 import logging
+import re
 import select
 import errno
+import secrets
+import time
+import uuid
 from datetime import datetime
+from . import (
+    audit, broadcast, buildcache, compression, handoff, heartbeat, mirror, ptytrace, scrollback, sessions,
+    snapshots, tracing,
+)
+from .completion import SessionCompleter
+from .permissions import token_matches
 
 logging.basicConfig(
     level=logging.INFO,
@@ -25,7 +38,22 @@ logging.basicConfig(
 
 logger = logging.getLogger(__name__)
 
-def build_firejail_cmd(work_dir, argv):
+# Largest file a sandboxed process may write (--rlimit-fsize); workspace uploads obey the same cap
+SANDBOX_RLIMIT_FSIZE = 100000000  # 100MB
+
+# Channel used by clients that don't tag their messages (the session's first shell)
+DEFAULT_CHANNEL = "main"
+MAX_CHANNEL_ID_LENGTH = 32
+
+# Largest piece of output sent in one WebSocket message, to protect the UI and server
+MAX_OUTPUT_CHUNK = 8192
+# Bytes requested per read from a PTY master
+PTY_READ_SIZE = 4096
+
+# End of an interactive prompt ("$ ", "# ", "> ", "% "), possibly followed by escape sequences
+SHELL_PROMPT_RE = re.compile(rb'[$#%>] (?:\x1b\[[0-9;?]*[A-Za-z])*$')
+
+def build_firejail_cmd(work_dir, argv, name=None, read_only=()):
     """Build firejail command with appropriate security restrictions"""
     cmd = [
         "firejail",
@@ -49,7 +77,7 @@ def build_firejail_cmd(work_dir, argv):
         "--shell=none",           # No shell access to parent
         "--rlimit-as=1000000000", # Limit virtual memory to 1GB
         "--rlimit-cpu=3600",      # Limit CPU time to 1 hour
-        "--rlimit-fsize=100000000", # Limit file size to 100MB
+        f"--rlimit-fsize={SANDBOX_RLIMIT_FSIZE}", # Limit file size to 100MB
         "--rlimit-nproc=50",      # Limit number of processes
         "--timeout=01:00:00",     # 1 hour timeout
     ]
@@ -61,15 +89,64 @@ def build_firejail_cmd(work_dir, argv):
         # Add network restriction only in development (profile handles this in production)
         cmd.append("--net=none")
     
+    # Name the sandbox so extra channels can join it instead of building a new one
+    if name:
+        cmd.append(f"--name={name}")
+    
+    # Shared state the sandbox may read but never change (e.g. the compile cache)
+    for path in read_only:
+        cmd.append(f"--read-only={path}")
+    
     cmd.extend(["--", *argv])
     return cmd
 
+def sandbox_home():
+    """Where firejail --private mounts the workspace: the worker user's home directory"""
+    return pwd.getpwuid(os.getuid()).pw_dir
+
+def build_firejail_join_cmd(name, argv):
+    """Build a command that runs argv inside an already running, named sandbox"""
+    return ["firejail", f"--join={name}", "--", *argv]
+
 def build_simple_cmd(work_dir, argv):
     """Fallback: Build a simple command without firejail"""
     return argv
 
+class ShellChannel:
+    """One PTY-backed shell inside a session's sandbox"""
+
+    def __init__(self, channel_id, master_fd, proc):
+        self.channel_id = channel_id
+        self.master_fd = master_fd
+        self.proc = proc
+        self.running = True
+        self.reader_task = None
+        self.decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        self.trace = None  # ptytrace.TraceWriter while capture is enabled
+        self.scrollback = None  # scrollback.ScrollbackLog unless history is disabled
+
+    def frame(self, message_type, data):
+        """Serialize an outgoing message, tagging it unless it belongs to the default channel"""
+        message = {"type": message_type, "data": data}
+        if self.channel_id != DEFAULT_CHANNEL:
+            message["channel"] = self.channel_id
+        return json.dumps(message)
+
+    def buffered_bytes(self):
+        """Undecoded bytes of a UTF-8 sequence split across reads"""
+        return len(self.decoder.getstate()[0])
+
 class TerminalConsumer(AsyncWebsocketConsumer):
+    record = None  # sessions.SessionRecord once connected
+    transfer_token = None  # Bearer token for workspace export/import, sent once accepted
+    resume_token = None  # Secret that reclaims this session's shells after a rolling restart
+
     async def connect(self):
+        with tracing.trace('terminal.connect'):
+            await self.start_session()
+
+    async def start_session(self):
+        """Start (or resume) the session this connection asks for"""
         query = parse_qs(self.scope["query_string"].decode())
         session_id = query.get("session", [None])[0]
         if not session_id:
@@ -79,48 +156,96 @@ class TerminalConsumer(AsyncWebsocketConsumer):
             return
         
         self.session_id = session_id
+        tracing.annotate(session=session_id)
+        client = self.scope.get("client")
+        self.record = sessions.SessionRecord(session_id, client=f"{client[0]}:{client[1]}" if client else None)
+        self.compressor = compression.negotiate(
+            query,
+            enabled=getattr(settings, 'TERMINAL_COMPRESSION_ENABLED', True),
+            min_size=getattr(settings, 'TERMINAL_COMPRESSION_MIN_BYTES', 256),
+        )
         self.reader_running = False
-        self.master_fd = None
-        self.proc = None
+        self.channels = {}
+        self.sandbox_name = None
+        self.broadcaster = None
+        self.completer = None
+        self.search_task = None
+        self.search_page = None  # Future of the search page running in a thread, if any
         self.use_firejail = True  # ALWAYS use firejail for security
+        self.workspace_baseline = None
+        self.suspended = False
+        self.handed_off = False
+        self.disconnected = False
+        self.torn_down = False
+        handoff.remember_loop(asyncio.get_running_loop())
+        heartbeat.ensure_sweeper()
         
+        # A client coming back after a rolling restart picks up its shells where they were,
+        # provided it shows the resume token only the owning client was sent
         try:
-            self.workspace = tempfile.mkdtemp(prefix=f"terminal_{session_id}_")
+            adopted = handoff.claim(session_id, query.get("resume", [None])[0])
+        except handoff.ResumeRefused as e:
+            logger.warning(f"Refused to resume session {session_id}: {e}")
+            await self.close(code=4003)
+            return
+        if adopted is not None:
+            if adopted.channels:
+                tracing.annotate(resumed=True)
+                await self.resume_adopted_session(adopted)
+                return
+            await sync_to_async(adopted.discard, thread_sensitive=False)()
+        
+        # Opt-in persistence: a stable client identity lets us restore the previous workspace
+        identity = query.get("identity", [None])[0]
+        store = snapshots.get_store()
+        self.identity = identity if store and snapshots.is_valid_identity(identity) else None
+        self.record.identity = self.identity
+        
+        try:
+            with tracing.span('workspace.create'):
+                self.workspace = tempfile.mkdtemp(prefix=f"terminal_{session_id}_")
+            self.record.workspace = self.workspace
             logger.info(f"Created workspace: {self.workspace}")
             
             # Create some basic files in the workspace
-            await self.setup_workspace()
+            with tracing.span('workspace.setup'):
+                await self.setup_workspace()
+            
+            if self.identity and self.workspace_baseline is not None:
+                with tracing.span('workspace.restore'):
+                    await self.restore_workspace(store)
             
-            await self.accept()
+            self.completer = SessionCompleter(self.workspace)
+            
+            with tracing.span('websocket.accept'):
+                await self.accept()
+            await self.send_session_tokens()
+            sessions.register(self)
+            self.broadcaster = broadcast.open_session(session_id)
             logger.info(f"WebSocket connection accepted for session: {session_id}")
 
             # Start the terminal process
-            self.master_fd, self.proc = await sync_to_async(self.spawn_sandbox_shell)()
-            logger.info(f"Terminal process started with PID: {self.proc.pid}")
-            
-            self.reader_running = True
-            
-            # Start the async reader task
-            asyncio.create_task(self.read_output())
-            
-            # Send welcome message with a small delay to ensure connection is stable
-            await asyncio.sleep(1.0)  # Increased delay to let shell initialize
-            
-            # Check if process is still running before sending welcome
-            if self.proc.poll() is not None:
-                logger.error(f"Shell process died before welcome message, exit code: {self.proc.returncode}")
-                await self.send(text_data=json.dumps({"type": "error", "data": "Terminal process failed to initialize"}))
-                await self.close()
-                return
+            self.sandbox_name = f"learnlinux-{uuid.uuid4().hex[:16]}"
+            # Returns once the shell has printed its first prompt
+            with tracing.span('shell.spawn'):
+                master_fd, proc, startup_output = await self.spawn_sandbox_shell()
+            logger.info(f"Terminal process started with PID: {proc.pid}")
+            self.record.pid = proc.pid
             
             welcome_msg = "Welcome to LearnLinux Terminal!\n$ "
             message_data = json.dumps({"type": "output", "data": welcome_msg})
             logger.debug(f"Sending welcome message: {repr(message_data)}")
-            await self.send(text_data=message_data)
+            with tracing.span('welcome.send'):
+                await self.send(text_data=message_data)
             logger.info("Welcome message sent successfully")
             
+            # Start the async reader task; it sends what the shell printed while starting first
+            self.reader_running = True
+            self.add_channel(DEFAULT_CHANNEL, master_fd, proc, startup_output)
+            
         except Exception as e:
             logger.error(f"Failed to initialize terminal session: {e}")
+            tracing.fail(str(e))
             try:
                 error_msg = json.dumps({"type": "error", "data": f"Failed to start terminal: {str(e)}"})
                 logger.debug(f"Sending error message: {repr(error_msg)}")
@@ -129,6 +254,206 @@ class TerminalConsumer(AsyncWebsocketConsumer):
                 logger.error(f"Failed to send error message: {send_error}")
             await self.close()
 
+    async def send_session_tokens(self):
+        """Issue this connection's secrets to the client that owns the session
+
+        The session ID is chosen by the client and may leak (it is in URLs), so it
+        can't authorize anything on its own. The transfer token unlocks workspace
+        export and import; the resume token lets the client reclaim its shells
+        from the next worker after a rolling restart. Both are new on every
+        connection, so a resume token is good for one reconnect.
+        """
+        self.transfer_token = secrets.token_urlsafe(32)
+        self.resume_token = secrets.token_urlsafe(32)
+        await self.send(text_data=json.dumps({
+            "type": "session",
+            "transfer_token": self.transfer_token,
+            "resume_token": self.resume_token,
+        }))
+
+    async def resume_adopted_session(self, adopted):
+        """Attach to a session handed over by the previous worker instead of starting a new one"""
+        self.workspace = adopted.workspace
+        self.sandbox_name = adopted.sandbox_name
+        self.identity = adopted.identity
+        self.record.identity = self.identity
+        self.record.workspace = self.workspace
+        self.workspace_baseline = adopted.workspace_baseline
+        self.completer = SessionCompleter(self.workspace)
+        
+        await self.accept()
+        await self.send_session_tokens()
+        sessions.register(self)
+        self.broadcaster = broadcast.open_session(self.session_id)
+        self.reader_running = True
+        for channel in adopted.channels:
+            self.add_channel(channel.channel_id, channel.master_fd, channel.proc)
+            if channel.channel_id == DEFAULT_CHANNEL:
+                self.record.pid = channel.proc.pid
+        logger.info(f"Resumed handed-off session {self.session_id} with {len(adopted.channels)} channels")
+        
+        await self.send(text_data=json.dumps({"type": "output", "data": "Reconnected to your running session.\n"}))
+
+    async def suspend_for_handoff(self):
+        """Stop reading the PTYs so the next worker can take them over without losing output"""
+        self.suspended = True
+        self.reader_running = False
+        tasks = [channel.reader_task for channel in self.channels.values() if channel.reader_task]
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+        # The next worker reopens each channel's history from disk
+        await asyncio.gather(*(
+            asyncio.wrap_future(channel.scrollback.flush())
+            for channel in self.channels.values() if channel.scrollback
+        ))
+
+    def handoff_state(self):
+        """Metadata and descriptors describing this session: (meta, [master_fd, pidfd, ...])"""
+        channels = []
+        fds = []
+        for channel in self.channels.values():
+            if channel.master_fd is None or not channel.proc or channel.proc.poll() is not None:
+                continue
+            pidfd = os.dup(channel.proc.pidfd) if isinstance(channel.proc, handoff.AdoptedProcess) else os.pidfd_open(channel.proc.pid)
+            channels.append({"id": channel.channel_id, "pid": channel.proc.pid})
+            fds.extend((channel.master_fd, pidfd))
+        meta = {
+            "session_id": self.session_id,
+            "workspace": self.workspace,
+            "sandbox_name": self.sandbox_name,
+            "identity": self.identity,
+            "baseline": self.workspace_baseline,
+            "resume_token": self.resume_token,
+            "channels": channels,
+        }
+        return meta, fds
+
+    async def complete_handoff(self):
+        """The next worker owns the shells now: drop our copies and send the client over"""
+        self.handed_off = True
+        for channel in list(self.channels.values()):
+            channel.running = False
+            if channel.master_fd is not None:
+                os.close(channel.master_fd)
+                channel.master_fd = None
+            if isinstance(channel.proc, handoff.AdoptedProcess):
+                channel.proc.close()
+            if channel.trace:
+                channel.trace.close()
+            if channel.scrollback:
+                channel.scrollback.close()
+        self.channels.clear()
+        if not self.disconnected:
+            await self.close(code=handoff.HANDOFF_CLOSE_CODE)
+
+    async def resume_after_failed_handoff(self):
+        """Carry on serving the session ourselves"""
+        self.suspended = False
+        if self.disconnected:
+            # The client left while we were suspended; do the cleanup disconnect skipped
+            await self.teardown()
+            return
+        self.reader_running = True
+        for channel in self.channels.values():
+            channel.reader_task = asyncio.create_task(self.read_output(channel))
+
+    def add_channel(self, channel_id, master_fd, proc, startup_output=b""):
+        """Track a spawned shell and start streaming its output"""
+        channel = ShellChannel(channel_id, master_fd, proc)
+        trace_dir = getattr(settings, 'TERMINAL_TRACE_DIR', '')
+        if trace_dir:
+            channel.trace = ptytrace.open_session_trace(trace_dir, self.session_id, channel_id)
+        scrollback_dir = getattr(settings, 'TERMINAL_SCROLLBACK_DIR', '')
+        if scrollback_dir:
+            try:
+                # Keyed by the sandbox, not the client-chosen session ID: a client reconnecting
+                # with the same ID must not share (or delete) the files of a connection still closing
+                channel.scrollback = scrollback.open_log(
+                    scrollback_dir, self.sandbox_name, channel_id,
+                    getattr(settings, 'SCROLLBACK_MAX_BYTES', 16 * 1024 * 1024),
+                )
+            except OSError as e:
+                logger.error(f"Failed to open scrollback for channel {channel_id}: {e}")
+        self.channels[channel_id] = channel
+        channel.reader_task = asyncio.create_task(self.read_output(channel, startup_output))
+        return channel
+
+    async def open_channel(self, channel_id):
+        """Spawn another shell in the session's existing sandbox"""
+        if channel_id in self.channels:
+            await self.send(text_data=json.dumps({"type": "error", "data": f"Channel '{channel_id}' is already open", "channel": channel_id}))
+            return
+        max_channels = getattr(settings, 'TERMINAL_MAX_CHANNELS', 4)
+        if len(self.channels) >= max_channels:
+            await self.send(text_data=json.dumps({"type": "error", "data": f"At most {max_channels} channels per connection", "channel": channel_id}))
+            return
+        try:
+            master_fd, proc, startup_output = await self.spawn_sandbox_shell(join=True)
+        except Exception as e:
+            logger.error(f"Failed to open channel {channel_id}: {e}")
+            await self.send(text_data=json.dumps({"type": "error", "data": f"Failed to open channel: {str(e)}", "channel": channel_id}))
+            return
+        logger.info(f"Opened channel {channel_id} with PID: {proc.pid}")
+        await self.send(text_data=json.dumps({"type": "opened", "channel": channel_id}))
+        self.add_channel(channel_id, master_fd, proc, startup_output)
+
+    async def close_channel(self, channel):
+        """Stop a channel's reader and terminate its shell"""
+        channel.running = False
+        self.channels.pop(channel.channel_id, None)
+        if channel.trace:
+            channel.trace.close()
+            channel.trace = None
+        if channel.scrollback:
+            channel.scrollback.close(remove=True)
+            channel.scrollback = None
+        
+        # Close the master file descriptor first to stop the reader
+        if channel.master_fd is not None:
+            try:
+                os.close(channel.master_fd)
+                logger.debug("Master file descriptor closed")
+            except Exception as e:
+                logger.warning(f"Error closing master_fd: {e}")
+            finally:
+                channel.master_fd = None
+        
+        # Wait a moment for the reader to stop
+        with tracing.span('reader.stop_wait'):
+            await asyncio.sleep(0.2)
+        
+        # Then terminate the process
+        if channel.proc:
+            with tracing.span('shell.terminate'):
+                try:
+                    # Try graceful termination first
+                    channel.proc.terminate()
+                    try:
+                        await sync_to_async(channel.proc.wait)(timeout=5)
+                        logger.debug("Process terminated gracefully")
+                    except (subprocess.TimeoutExpired, asyncio.TimeoutError):
+                        # Force kill if graceful termination fails
+                        logger.warning("Graceful termination failed, force killing process")
+                        channel.proc.kill()
+                        try:
+                            await sync_to_async(channel.proc.wait)(timeout=2)
+                            logger.debug("Process killed successfully")
+                        except:
+                            logger.warning("Failed to confirm process termination")
+                except Exception as e:
+                    logger.error(f"Error terminating process: {e}")
+                finally:
+                    channel.proc = None
+
+    def audit_command(self, action, reason, command):
+        """Add a security-relevant command to the searchable audit store"""
+        client = self.scope.get("client") if hasattr(self, 'scope') else None
+        audit.record(
+            getattr(self, 'session_id', 'unknown'), action, reason, command,
+            identity=getattr(self, 'identity', None),
+            client=f"{client[0]}:{client[1]}" if client else None,
+        )
+
     def is_command_allowed(self, command):
         """Check if a command is allowed - permissive approach since we're in Docker containers"""
         # Remove leading/trailing whitespace and split command
@@ -195,16 +520,19 @@ class TerminalConsumer(AsyncWebsocketConsumer):
         # Check for strictly forbidden commands
         if base_cmd in strictly_forbidden:
             logger.warning(f"Blocked strictly forbidden command: {base_cmd}")
+            self.audit_command(audit.ACTION_BLOCKED, "forbidden command", command)
             return False
         
         # Block package managers to prevent container modification
         if base_cmd in package_managers:
             logger.warning(f"Blocked package manager command: {base_cmd}")
+            self.audit_command(audit.ACTION_BLOCKED, "package manager", command)
             return False
         
         # Allow network tools but log them (useful for learning)
         if base_cmd in network_restricted:
             logger.info(f"Allowing monitored network command: {base_cmd}")
+            self.audit_command(audit.ACTION_MONITORED, "network command", command)
             # You could add additional validation here if needed
             return True
         
@@ -213,6 +541,7 @@ class TerminalConsumer(AsyncWebsocketConsumer):
         sensitive_paths = ['/etc/passwd', '/etc/shadow', '/etc/sudoers', '/root', '/boot', '/sys', '/proc/sys']
         if any(path in command for path in sensitive_paths):
             logger.warning(f"Blocked access to sensitive path in command: {command}")
+            self.audit_command(audit.ACTION_BLOCKED, "sensitive path", command)
             return False
         
         # Check for command injection attempts - more permissive approach
@@ -228,6 +557,7 @@ class TerminalConsumer(AsyncWebsocketConsumer):
         for pattern in dangerous_patterns:
             if pattern in command.lower():
                 logger.warning(f"Blocked dangerous pattern '{pattern}' in command: {command}")
+                self.audit_command(audit.ACTION_BLOCKED, f"dangerous pattern '{pattern}'", command)
                 return False
         
         # Allow most commands since we're in a sandboxed Docker container
@@ -249,7 +579,7 @@ class TerminalConsumer(AsyncWebsocketConsumer):
             
             # Create sample files for learning
             files_to_create = [
-                f("welcome.txt", """Welcome to LearnLinux Terminal!
+                ("welcome.txt", """Welcome to LearnLinux Terminal!
 =================================
 
 This is a comprehensive Linux learning environment where you can practice commands safely.
@@ -355,14 +685,49 @@ timeout=30
             for script in script_files:
                 if os.path.exists(script):
                     os.chmod(script, 0o755)
+            
+            # Remember the pristine template so snapshots only need to store the delta
+            self.workspace_baseline = snapshots.scan_template(self.workspace)
+            
+            # The first workspace on this worker fills the shared compile cache, if enabled
+            buildcache.seed_from_workspace(self.workspace)
                     
             logger.info(f"Workspace setup completed with comprehensive learning environment")
             
         except Exception as e:
             logger.error(f"Failed to setup workspace: {e}")
 
-    def spawn_sandbox_shell(self):
-        """Spawn a shell in the workspace with sandboxing (flexible for different environments)"""
+    async def restore_workspace(self, store):
+        """Replay the identity's last snapshot on top of the fresh template"""
+        try:
+            restored = await sync_to_async(store.restore, thread_sensitive=False)(
+                self.identity, self.workspace, self.workspace_baseline
+            )
+            if restored is not None:
+                self.workspace_baseline = restored
+                logger.info(f"Restored workspace snapshot for session: {self.session_id}")
+        except Exception as e:
+            logger.error(f"Failed to restore workspace snapshot: {e}")
+
+    async def snapshot_workspace(self):
+        """Persist the workspace delta for this identity before it is deleted"""
+        store = snapshots.get_store()
+        if not store:
+            return
+        try:
+            changed, hashed = await sync_to_async(store.snapshot, thread_sensitive=False)(
+                self.identity, self.workspace, self.workspace_baseline
+            )
+            logger.info(f"Saved workspace snapshot: {changed} changed files, {hashed} bytes hashed")
+        except Exception as e:
+            logger.error(f"Failed to snapshot workspace: {e}")
+
+    async def spawn_sandbox_shell(self, join=False):
+        """Spawn a shell in the workspace with sandboxing (flexible for different environments)
+
+        With join=True the shell is started inside the session's running sandbox
+        rather than a new one, which is all an extra channel needs.
+        """
         # Try different shells in order of preference
         shells_to_try = [
             "/bin/bash",
@@ -374,6 +739,7 @@ timeout=30
         for shell in shells_to_try:
             if os.path.exists(shell):
                 logger.info(f"Using shell: {shell}")
+                tracing.annotate(shell=shell, join=join)
                 if 'bash' in shell:
                     argv = [shell, '-i']  # Interactive mode for bash
                 else:
@@ -382,16 +748,25 @@ timeout=30
                 # Try firejail first, fallback to direct execution in development
                 if self.use_firejail and shutil.which("firejail"):
                     try:
-                        cmd = build_firejail_cmd(self.workspace, argv)
+                        if join:
+                            cmd = build_firejail_join_cmd(self.sandbox_name, argv)
+                        else:
+                            # A new sandbox's first process opens the lesson mirror's port, then runs the shell
+                            cmd = build_firejail_cmd(
+                                self.workspace, mirror.sandbox_argv(argv), name=self.sandbox_name,
+                                read_only=buildcache.sandbox_read_only_paths() + mirror.sandbox_read_only_paths(),
+                            )
                         logger.info(f"Attempting firejail command: {' '.join(cmd[:5])}...")
-                        return self._spawn_pty_process(cmd, self.workspace)
+                        tracing.annotate(sandbox='firejail')
+                        return await self._start_pty_process(cmd, self.workspace)
                     except Exception as e:
                         logger.warning(f"Firejail failed for {shell}: {e}")
+                        tracing.annotate(sandbox='none', sandbox_error=str(e))
                         # In development, fall back to direct execution
                         if os.getenv('DJANGO_DEVELOPMENT', 'False').lower() == 'true':
                             logger.warning("Development mode: falling back to direct shell execution")
                             cmd = argv
-                            return self._spawn_pty_process(cmd, self.workspace)
+                            return await self._start_pty_process(cmd, self.workspace)
                         else:
                             # In production, security is mandatory
                             logger.error("Production mode: firejail is required for security")
@@ -400,8 +775,9 @@ timeout=30
                     # Direct execution (for development only)
                     if os.getenv('DJANGO_DEVELOPMENT', 'False').lower() == 'true':
                         logger.warning("Development mode: running shell without firejail")
+                        tracing.annotate(sandbox='none')
                         cmd = argv
-                        return self._spawn_pty_process(cmd, self.workspace)
+                        return await self._start_pty_process(cmd, self.workspace)
                     else:
                         logger.error("Production mode requires firejail for security")
                         raise RuntimeError("Security sandbox is mandatory in production")
@@ -409,7 +785,11 @@ timeout=30
         raise RuntimeError("No suitable shell found")
 
     def _spawn_pty_process(self, cmd, cwd):
-        """Common method to spawn a process with PTY"""
+        """Common method to spawn a process with PTY
+
+        No Python runs in the child (start_new_session instead of preexec_fn),
+        so subprocess can use its fast vfork/exec path.
+        """
         master_fd = None
         slave_fd = None
         
@@ -420,17 +800,20 @@ timeout=30
             flags = fcntl.fcntl(master_fd, fcntl.F_GETFL)
             fcntl.fcntl(master_fd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
 
+            # Inside a sandbox the workspace isn't at its host path but at the home directory
+            home = sandbox_home() if cmd[0] == 'firejail' else self.workspace
+
             # Set up environment
             env = os.environ.copy()
             env.update({
                 'PS1': r'\$ ',  # Simple prompt to reduce control sequences
                 'TERM': 'linux',  # Better terminal type for compatibility
-                'HOME': self.workspace,
+                'HOME': home,
                 'USER': os.environ.get('USER', 'learner'),
                 'SHELL': cmd[0],
                 'LANG': 'C.UTF-8',  # Use C locale to avoid encoding issues
                 'LC_ALL': 'C.UTF-8',  # Use C locale to avoid encoding issues
-                'PATH': '/usr/local/bin:/usr/bin:/bin',
+                'PATH': settings.SANDBOX_PATH,
                 # Disable shell initialization files that might cause issues
                 'BASH_ENV': '/dev/null',
                 'ENV': '/dev/null',
@@ -448,63 +831,36 @@ timeout=30
                 'COLUMNS': '80',
                 'LINES': '24',
             })
+            # Optional compile cache layers; the worker's own PYTHONDONTWRITEBYTECODE
+            # shouldn't stop a student's imports being cached in their private prefix
+            cache_env = buildcache.sandbox_env(home, env['PATH'])
+            if cache_env:
+                env.update(cache_env)
+                env.pop('PYTHONDONTWRITEBYTECODE', None)
+            # Only sandboxes can reach the mirror's forwarded port
+            if cmd[0] == 'firejail':
+                env.update(mirror.sandbox_env())
 
-            def preexec_function():
-                os.setsid()
-                try:
-                    os.tcsetpgrp(0, os.getpid())
-                except OSError:
-                    pass  # Ignore if not supported
+            proc = subprocess.Popen(
+                cmd,
+                cwd=cwd,
+                stdin=slave_fd,
+                stdout=slave_fd,
+                stderr=slave_fd,
+                close_fds=True,
+                env=env,
+                start_new_session=True
+            )
             
-            try:
-                proc = subprocess.Popen(
-                    cmd,
-                    cwd=cwd,
-                    stdin=slave_fd,
-                    stdout=slave_fd,
-                    stderr=slave_fd,
-                    close_fds=True,
-                    env=env,
-                    preexec_fn=preexec_function
-                )
-                
-                # Close slave_fd in parent process
-                os.close(slave_fd)
-                slave_fd = None
-                
-                # Give the process a moment to initialize
-                import time
-                time.sleep(1)  # Increased delay for better initialization
-                
-                # Check if process is still running after initialization
-                if proc.poll() is not None:
-                    stdout, stderr = proc.communicate()
-                    error_msg = f"Process died immediately after initialization with return code {proc.returncode}"
-                    if stderr:
-                        error_msg += f"\nStderr: {stderr.decode('utf-8', errors='replace')}"
-                    if stdout:
-                        error_msg += f"\nStdout: {stdout.decode('utf-8', errors='replace')}"
-                    logger.error(error_msg)
-                    raise RuntimeError(error_msg)
-                
-                logger.info(f"Process started successfully with PID: {proc.pid}")
-                return master_fd, proc
-                
-            except Exception as e:
-                logger.error(f"Failed to start process: {e}")
-                if proc:
-                    try:
-                        proc.terminate()
-                        proc.wait(timeout=5)
-                    except:
-                        try:
-                            proc.kill()
-                        except:
-                            pass
-                raise e
+            # Close slave_fd in parent process
+            os.close(slave_fd)
+            slave_fd = None
+            
+            logger.info(f"Process started with PID: {proc.pid}")
+            return master_fd, proc
                 
         except Exception as e:
-            logger.error(f"Failed to create PTY: {e}")
+            logger.error(f"Failed to start process: {e}")
             # Clean up file descriptors if they were created
             if slave_fd is not None:
                 try:
@@ -518,68 +874,120 @@ timeout=30
                     pass
             raise e
 
-    async def read_output(self):
-        """Enhanced async method to read output from the terminal"""
-        buffer = b""
+    async def _wait_for_prompt(self, master_fd, proc):
+        """Collect a new shell's startup output until its first prompt appears; returns the bytes read"""
+        loop = asyncio.get_running_loop()
+        timeout = getattr(settings, 'TERMINAL_SPAWN_TIMEOUT', 5)
+        started = loop.time()
+        deadline = started + timeout
+        readable = asyncio.Event()
+        output = b""
+        # Sandbox setup ends roughly where the first byte arrives; shell init runs until the prompt
+        started_ns = tracing.now()
+        first_output_ns = None
+        
+        loop.add_reader(master_fd, readable.set)
+        try:
+            while not SHELL_PROMPT_RE.search(output[-64:]):
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    # Slow, or a prompt we don't recognise; the shell is alive, so carry on
+                    logger.warning(f"No prompt from PID {proc.pid} after {timeout}s, continuing anyway")
+                    break
+                try:
+                    await asyncio.wait_for(readable.wait(), remaining)
+                except asyncio.TimeoutError:
+                    continue
+                readable.clear()
+                try:
+                    data = os.read(master_fd, 4096)
+                except BlockingIOError:
+                    continue
+                except OSError:
+                    data = b""  # EIO: the slave side closed, so the shell is gone
+                if not data:
+                    error_msg = f"Process died during startup with return code {proc.poll()}"
+                    if output:
+                        error_msg += f"\nOutput: {output.decode('utf-8', errors='replace')}"
+                    raise RuntimeError(error_msg)
+                if first_output_ns is None:
+                    first_output_ns = tracing.now()
+                output += data
+        finally:
+            loop.remove_reader(master_fd)
+        
+        if first_output_ns is not None:
+            tracing.record('shell.first_output', started_ns, first_output_ns)
+            tracing.record('shell.prompt', first_output_ns, tracing.now())
+        logger.info(f"Shell PID {proc.pid} ready after {(loop.time() - started) * 1000:.0f}ms")
+        return output
+
+    async def _start_pty_process(self, cmd, cwd):
+        """Spawn a PTY process and wait until it is ready: (master_fd, proc, startup_output)"""
+        with tracing.span('pty.spawn'):
+            # Popen's fork/exec blocks; keep it off the event loop
+            master_fd, proc = await sync_to_async(self._spawn_pty_process, thread_sensitive=False)(cmd, cwd)
+        try:
+            startup_output = await self._wait_for_prompt(master_fd, proc)
+        except BaseException:
+            os.close(master_fd)
+            if proc.poll() is None:
+                proc.kill()
+            raise
+        return master_fd, proc, startup_output
+
+    async def handle_output_bytes(self, channel, data):
+        """Output pipeline for one PTY read: decode, filter, frame and send
+
+        Kept separate from read_output so bench_output can replay captured
+        traces through exactly this code.
+        """
+        if channel.trace:
+            channel.trace.write(data)
+        # The incremental decoder holds back a UTF-8 sequence split across reads
+        output = channel.decoder.decode(data)
+        if output:
+            await self.send_output(channel, output)
+
+    async def send_output(self, channel, output):
+        """Format decoded terminal output and send it to the client (and observers) in chunks"""
+        formatted_output = self.format_terminal_output(output)
+        if not formatted_output.strip():  # Only send non-empty content
+            return
+        if channel.scrollback:
+            channel.scrollback.append(formatted_output)
+        # Chunk large outputs to protect the UI and server
+        text = formatted_output
+        while text:
+            chunk = text[:MAX_OUTPUT_CHUNK]
+            text = text[MAX_OUTPUT_CHUNK:]
+            message_data = channel.frame("output", chunk)
+            await self.send(text_data=message_data)
+            if self.broadcaster:
+                self.broadcaster.publish(message_data, chunk)
+            # Brief yield to avoid flooding
+            if text:
+                await asyncio.sleep(0.005)
+
+    async def read_output(self, channel, startup_output=b""):
+        """Enhanced async method to read output from one channel's terminal"""
         consecutive_empty_reads = 0
-        # Cap how much we send per message to avoid overwhelming the client
-        MAX_CHUNK = 8192  # bytes per WebSocket message
         
-        while self.reader_running and self.master_fd is not None:
+        # Bytes already read while waiting for the shell's first prompt
+        if startup_output:
+            await self.handle_output_bytes(channel, startup_output)
+        
+        while self.reader_running and channel.running and channel.master_fd is not None:
             try:
                 # Use select to check if data is available
-                ready, _, _ = await sync_to_async(select.select)([self.master_fd], [], [], 0.1)
+                ready, _, _ = await sync_to_async(select.select)([channel.master_fd], [], [], 0.1)
                 
                 if ready:
                     try:
-                        data = await sync_to_async(os.read)(self.master_fd, 4096)
+                        data = await sync_to_async(os.read)(channel.master_fd, PTY_READ_SIZE)
                         if data:
-                            buffer += data
                             consecutive_empty_reads = 0
-                            
-                            # Process buffer for complete lines
-                            while buffer:
-                                try:
-                                    # Try to decode the entire buffer
-                                    output = buffer.decode('utf-8', errors='replace')
-                                    
-                                    # Process output for better readability
-                                    if output:
-                                        formatted_output = self.format_terminal_output(output)
-                                        if formatted_output.strip():  # Only send non-empty content
-                                            # Chunk large outputs to protect the UI and server
-                                            text = formatted_output
-                                            while text:
-                                                chunk = text[:MAX_CHUNK]
-                                                text = text[MAX_CHUNK:]
-                                                message_data = json.dumps({"type": "output", "data": chunk})
-                                                await self.send(text_data=message_data)
-                                                # Brief yield to avoid flooding
-                                                if text:
-                                                    await asyncio.sleep(0.005)
-                                        buffer = b""
-                                        break
-                                except UnicodeDecodeError:
-                                    # If we can't decode, try to find a valid UTF-8 sequence
-                                    for i in range(len(buffer) - 1, 0, -1):
-                                        try:
-                                            partial = buffer[:i].decode('utf-8')
-                                            formatted_output = self.format_terminal_output(partial)
-                                            if formatted_output.strip():
-                                                text = formatted_output
-                                                while text:
-                                                    chunk = text[:MAX_CHUNK]
-                                                    text = text[MAX_CHUNK:]
-                                                    await self.send(text_data=json.dumps({"type": "output", "data": chunk}))
-                                                    if text:
-                                                        await asyncio.sleep(0.005)
-                                            buffer = buffer[i:]
-                                            break
-                                        except UnicodeDecodeError:
-                                            continue
-                                    else:
-                                        # If no valid sequence found, skip one byte and try again
-                                        buffer = buffer[1:]
+                            await self.handle_output_bytes(channel, data)
                         else:
                             # EOF reached
                             consecutive_empty_reads += 1
@@ -600,21 +1008,34 @@ timeout=30
                     await asyncio.sleep(0.05)
                     
                     # Check if process is still alive
-                    if hasattr(self, 'proc') and self.proc and self.proc.poll() is not None:
-                        logger.info(f"Terminal process exited with code: {self.proc.returncode}")
+                    if channel.proc and channel.proc.poll() is not None:
+                        logger.info(f"Terminal process exited with code: {channel.proc.returncode}")
                         break
                     
             except Exception as e:
                 logger.error(f"Error in read_output loop: {e}")
                 break
         
-        logger.info("Terminal output reader stopped")
+        logger.info(f"Terminal output reader stopped for channel: {channel.channel_id}")
+        
+        # Suspended for a handoff: the shell is still running and about to change owner
+        if self.suspended:
+            return
         
         # Send final message to client
         try:
-            await self.send(text_data=json.dumps({"type": "output", "data": "\nTerminal session ended.\n"}))
+            await self.send(text_data=channel.frame("output", "\nTerminal session ended.\n"))
         except Exception as e:
             logger.warning(f"Could not send final message: {e}")
+        
+        # An extra channel whose shell exited on its own is torn down here; the
+        # default channel lives until the connection closes, as before
+        if channel.channel_id != DEFAULT_CHANNEL and self.channels.get(channel.channel_id) is channel:
+            await self.close_channel(channel)
+            try:
+                await self.send(text_data=json.dumps({"type": "closed", "channel": channel.channel_id}))
+            except Exception as e:
+                logger.warning(f"Could not send channel close message: {e}")
 
     def format_terminal_output(self, output):
         """Format terminal output for better readability"""
@@ -684,12 +1105,40 @@ timeout=30
                 return
                 
             logger.debug(f"Received raw message: {repr(text_data)}")
+            # Characters rather than bytes for non-ASCII input; close enough for accounting
+            self.record.received(len(text_data))
             
             # Handle both JSON and plain text input for compatibility
+            channel_id = DEFAULT_CHANNEL
             try:
                 data = json.loads(text_data)
                 command = data.get("input", "")
                 logger.debug(f"Parsed JSON message: {data}")
+                if data.get("channel"):
+                    channel_id = str(data["channel"])[:MAX_CHANNEL_ID_LENGTH]
+                
+                # Channel control messages
+                message_type = data.get("type")
+                if message_type == "pong":
+                    return
+                if message_type == "open":
+                    await self.open_channel(channel_id)
+                    return
+                if message_type == "close":
+                    channel = self.channels.get(channel_id)
+                    if channel and channel_id != DEFAULT_CHANNEL:
+                        await self.close_channel(channel)
+                        await self.send(text_data=json.dumps({"type": "closed", "channel": channel_id}))
+                    return
+                if message_type == "complete":
+                    await self.complete(data)
+                    return
+                if message_type == "search":
+                    await self.start_search(channel_id, data)
+                    return
+                if message_type == "search_cancel":
+                    self.cancel_search()
+                    return
             except json.JSONDecodeError:
                 # If it's not JSON, treat it as a direct command
                 command = text_data.strip()
@@ -697,6 +1146,11 @@ timeout=30
             
             if not command:
                 return
+            
+            channel = self.channels.get(channel_id)
+            if channel is None:
+                await self.send(text_data=json.dumps({"type": "error", "data": f"Unknown channel '{channel_id}'", "channel": channel_id}))
+                return
 
             logger.debug(f"Final command to execute: {repr(command)}")
             
@@ -704,27 +1158,27 @@ timeout=30
             if not self.is_command_allowed(command):
                 error_msg = f"Command '{command}' is not allowed for security reasons"
                 logger.warning(f"Blocked dangerous command: {repr(command)}")
-                await self.send(text_data=json.dumps({"type": "error", "data": error_msg}))
+                await self.send(text_data=channel.frame("error", error_msg))
                 return
             
             # Check if process is still alive
-            if not hasattr(self, 'proc') or not self.proc or self.proc.poll() is not None:
-                await self.send(text_data=json.dumps({"type": "error", "data": "Terminal process is not running"}))
+            if not channel.proc or channel.proc.poll() is not None:
+                await self.send(text_data=channel.frame("error", "Terminal process is not running"))
                 return
             
             # Check if master_fd is still valid
-            if not hasattr(self, 'master_fd') or self.master_fd is None:
-                await self.send(text_data=json.dumps({"type": "error", "data": "Terminal connection is not available"}))
+            if channel.master_fd is None:
+                await self.send(text_data=channel.frame("error", "Terminal connection is not available"))
                 return
             
             # Send the command to the terminal
             try:
                 command_bytes = (command + "\n").encode('utf-8')
-                await sync_to_async(os.write)(self.master_fd, command_bytes)
+                await sync_to_async(os.write)(channel.master_fd, command_bytes)
                 logger.debug(f"Command sent to terminal: {repr(command)}")
             except OSError as e:
                 logger.error(f"Failed to write to terminal: {e}")
-                await self.send(text_data=json.dumps({"type": "error", "data": f"Failed to send command: {str(e)}"}))
+                await self.send(text_data=channel.frame("error", f"Failed to send command: {str(e)}"))
                 
         except Exception as e:
             logger.error(f"Error processing command: {e}")
@@ -735,51 +1189,236 @@ timeout=30
             # Don't close the connection on command processing errors
             return
 
+    async def complete(self, data):
+        """Answer a completion control message from the command or workspace index"""
+        kind = data.get("kind", "command")
+        prefix = str(data.get("prefix", ""))
+        if kind not in ("command", "path") or not self.completer:
+            await self.send(text_data=json.dumps({"type": "error", "data": f"Unsupported completion kind: {kind}"}))
+            return
+        matches, partial = self.completer.complete(kind, prefix)
+        await self.send(text_data=json.dumps({
+            "type": "completion",
+            "id": data.get("id"),
+            "kind": kind,
+            "prefix": prefix,
+            "matches": matches,
+            # The workspace is still being indexed; ask again for the full list
+            "partial": partial,
+        }))
+
+    async def start_search(self, channel_id, data):
+        """Answer a search control message; a new search replaces one still running"""
+        channel = self.channels.get(channel_id)
+        if channel is None or channel.scrollback is None:
+            await self.send(text_data=json.dumps({"type": "error", "data": "Search is not available for this channel"}))
+            return
+        try:
+            matcher = scrollback.compile_matcher(
+                str(data.get("query", "")), regex=bool(data.get("regex")), case_sensitive=bool(data.get("case")),
+            )
+            context = int(data.get("context", 2))
+            cursor = max(0, int(data.get("cursor") or 0))
+        except (TypeError, ValueError) as e:
+            await self.send(text_data=json.dumps({"type": "error", "data": f"Invalid search: {e}"}))
+            return
+        if self.search_page is not None and not self.search_page.done():
+            # A cancelled search's thread can't be interrupted; don't stack another on top of it
+            await self.send(text_data=json.dumps({"type": "error", "data": "The previous search is still running"}))
+            return
+        self.cancel_search()
+        self.search_task = asyncio.create_task(
+            self.run_search(channel, data.get("id"), matcher, context, cursor)
+        )
+
+    def cancel_search(self):
+        if self.search_task and not self.search_task.done():
+            self.search_task.cancel()
+        self.search_task = None
+
+    async def run_search(self, channel, search_id, matcher, context, cursor):
+        """Send a search's results one page per message, oldest first, until done or the result limit"""
+        page_size = getattr(settings, 'SCROLLBACK_SEARCH_PAGE_SIZE', 50)
+        remaining = getattr(settings, 'SCROLLBACK_SEARCH_MAX_RESULTS', 1000)
+        # Searches the history as of now; output printed meanwhile is for the next search
+        snapshot = channel.scrollback.snapshot()
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                # Own bounded pool: searches never hold up the executor rmtree and proc.wait run on
+                self.search_page = loop.run_in_executor(
+                    scrollback.executor(), scrollback.search_page,
+                    snapshot, matcher, cursor, context, min(page_size, remaining),
+                )
+                matches, cursor = await self.search_page
+                remaining -= len(matches)
+                done = cursor is None
+                await self.send(text_data=json.dumps({
+                    "type": "search_results",
+                    "id": search_id,
+                    "channel": channel.channel_id,
+                    "matches": matches,
+                    "lines": snapshot.lines,
+                    # Send this back as "cursor" to continue a search that hit the result limit
+                    "cursor": cursor,
+                    "done": done,
+                }))
+                if done or remaining <= 0:
+                    return
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Scrollback search failed: {e}")
+            await self.send(text_data=json.dumps({"type": "error", "data": f"Search failed: {e}"}))
+
+    async def send_ping(self):
+        """Heartbeat ping; the client answers with a pong"""
+        await self.send(text_data=json.dumps({"type": "ping", "ts": time.time()}))
+
+    async def reap(self, reason, code=None):
+        """Reclaim a session whose client stopped answering heartbeats, or that an operator killed"""
+        with tracing.trace('terminal.disconnect', session=getattr(self, 'session_id', None), reason=reason):
+            await self.release()
+        try:
+            await self.close(code)
+        except Exception as e:
+            logger.debug(f"Close after reaping failed: {e}")
+
+    async def send(self, text_data=None, bytes_data=None, close=False):
+        """Send a frame, compressed when the client negotiated it and the frame is large enough"""
+        compressor = getattr(self, 'compressor', None)
+        if compressor is not None and text_data is not None:
+            text_data, bytes_data = compressor.encode(text_data)
+        if self.record is not None:
+            # Outgoing JSON is ASCII-only, so its length is its size on the wire
+            self.record.sent(len(text_data) if text_data is not None else len(bytes_data or b""))
+        await super().send(text_data=text_data, bytes_data=bytes_data, close=close)
+
     async def disconnect(self, close_code):
         logger.info(f"Terminal disconnecting with code: {close_code}")
+        if getattr(self, 'disconnected', False):
+            # Reaped: that traced the disconnect already
+            await self.release()
+            return
+        with tracing.trace(
+            'terminal.disconnect', session=getattr(self, 'session_id', None), reason='client', close_code=close_code,
+        ):
+            await self.release()
+
+    async def release(self):
+        """Detach the session from this worker; safe to call more than once"""
         self.reader_running = False
+        if hasattr(self, 'session_id'):
+            sessions.unregister(self)
+        if getattr(self, 'broadcaster', None):
+            broadcast.close_session(self.broadcaster)
+            self.broadcaster = None
+        if getattr(self, 'completer', None):
+            self.completer.close()
+        if getattr(self, 'search_task', None):
+            self.cancel_search()
         
-        # Close the master file descriptor first to stop the reader
-        if hasattr(self, 'master_fd') and self.master_fd is not None:
-            try:
-                os.close(self.master_fd)
-                logger.debug("Master file descriptor closed")
-            except Exception as e:
-                logger.warning(f"Error closing master_fd: {e}")
-            finally:
-                self.master_fd = None
+        if getattr(self, 'disconnected', False):
+            return
+        self.disconnected = True
+        if getattr(self, 'compressor', None):
+            stats = self.compressor.stats()
+            logger.info(
+                f"Session {self.session_id} output: {stats['raw_bytes']} bytes sent as {stats['wire_bytes']} "
+                f"({stats['saved_pct']}% saved by compression)"
+            )
+            compression.session_closed(self.compressor)
+        if getattr(self, 'suspended', False) or getattr(self, 'handed_off', False):
+            # The shells and workspace belong to the handoff now
+            logger.info(f"Leaving shells and workspace of session {self.session_id} to the handoff")
+            return
         
-        # Wait a moment for the reader to stop
-        await asyncio.sleep(0.2)
+        await self.teardown()
+
+    async def teardown(self):
+        """Stop the session's shells, snapshot and delete its workspace"""
+        if getattr(self, 'torn_down', False):
+            return
+        self.torn_down = True
         
-        # Then terminate the process
-        if hasattr(self, 'proc') and self.proc:
-            try:
-                # Try graceful termination first
-                self.proc.terminate()
-                try:
-                    await sync_to_async(self.proc.wait)(timeout=5)
-                    logger.debug("Process terminated gracefully")
-                except (subprocess.TimeoutExpired, asyncio.TimeoutError):
-                    # Force kill if graceful termination fails
-                    logger.warning("Graceful termination failed, force killing process")
-                    self.proc.kill()
-                    try:
-                        await sync_to_async(self.proc.wait)(timeout=2)
-                        logger.debug("Process killed successfully")
-                    except:
-                        logger.warning("Failed to confirm process termination")
-            except Exception as e:
-                logger.error(f"Error terminating process: {e}")
-            finally:
-                self.proc = None
+        # Stop every channel's shell before touching the workspace
+        channels = list(getattr(self, 'channels', {}).values())
+        if channels:
+            with tracing.span('channels.close', channels=len(channels)):
+                await asyncio.gather(*(self.close_channel(channel) for channel in channels))
+        
+        scrollback_dir = getattr(settings, 'TERMINAL_SCROLLBACK_DIR', '')
+        if scrollback_dir and getattr(self, 'sandbox_name', None):
+            await sync_to_async(scrollback.remove_session, thread_sensitive=False)(scrollback_dir, self.sandbox_name)
+        
+        # Snapshot before cleanup so an opted-in identity can resume next time
+        if getattr(self, 'identity', None) and getattr(self, 'workspace_baseline', None) is not None:
+            with tracing.span('workspace.snapshot'):
+                await self.snapshot_workspace()
         
         # Clean up workspace
         if hasattr(self, 'workspace') and self.workspace:
             try:
-                await sync_to_async(shutil.rmtree)(self.workspace, ignore_errors=True)
+                with tracing.span('workspace.remove'):
+                    await sync_to_async(shutil.rmtree)(self.workspace, ignore_errors=True)
                 logger.debug(f"Workspace cleaned up: {self.workspace}")
             except Exception as e:
                 logger.error(f"Error cleaning up workspace: {e}")
         
-        logger.info("Terminal cleanup completed")
\ No newline at end of file
+        logger.info("Terminal cleanup completed")
+
+
+class ObserverConsumer(AsyncWebsocketConsumer):
+    """Read-only live view of another session's terminal, for instructors"""
+
+    async def connect(self):
+        query = parse_qs(self.scope["query_string"].decode())
+        session_id = query.get("session", [None])[0]
+        self.observer = None
+        self.broadcaster = None
+        self.pump_task = None
+        
+        if not token_matches(query.get("token", [None])[0], 'TERMINAL_INSTRUCTOR_TOKEN'):
+            logger.warning(f"Rejected observer without a valid instructor token for session: {session_id}")
+            await self.close(code=4003)
+            return
+        
+        self.broadcaster = broadcast.get_broadcaster(session_id)
+        if self.broadcaster is None:
+            await self.close(code=4004)
+            return
+        
+        await self.accept()
+        self.observer = self.broadcaster.subscribe(getattr(settings, 'OBSERVER_QUEUE_SIZE', 256))
+        logger.info(f"Observer attached to session: {session_id}")
+        
+        # Catch the observer up with recent output before streaming live frames
+        tail = self.broadcaster.tail()
+        if tail:
+            await self.send(text_data=json.dumps({"type": "output", "data": tail}))
+        self.pump_task = asyncio.create_task(self.pump())
+
+    async def pump(self):
+        """Forward frames from this observer's queue until the session ends"""
+        try:
+            while True:
+                frame = await self.observer.get()
+                if frame is None:
+                    break
+                await self.send(text_data=frame)
+            await self.send(text_data=json.dumps({"type": "output", "data": "\nObserved session ended.\n"}))
+            await self.close()
+        except Exception as e:
+            logger.warning(f"Observer stream stopped: {e}")
+
+    async def receive(self, text_data=None, bytes_data=None):
+        # Observers are strictly read-only
+        return
+
+    async def disconnect(self, close_code):
+        if self.broadcaster and self.observer:
+            self.broadcaster.unsubscribe(self.observer)
+            if self.observer.dropped:
+                logger.info(f"Observer dropped {self.observer.dropped} frames for session: {self.broadcaster.session_id}")
+        if self.pump_task and not self.pump_task.done() and self.pump_task is not asyncio.current_task():
+            self.pump_task.cancel()
@@ -0,0 +1,400 @@
+"""Hand live terminal sessions from an outgoing worker to its replacement.
+
+Each worker listens on TERMINAL_HANDOFF_SOCKET. A freshly started worker
+connects to that socket before it serves any traffic. The running worker then
+stops reading its PTYs and sends every session to the new worker. Each session
+goes as a small JSON header followed by its PTY master fds and pidfds, passed
+with SCM_RIGHTS. Once the new worker acknowledges, the old one closes its
+WebSockets with HANDOFF_CLOSE_CODE and shuts down. Clients reconnect with the
+same session id and pick up the same shells. No respawn happens, and output
+written in the meantime is still in the PTY buffer.
+
+A reconnecting client has to present the session's resume token, which only
+the client that owns the session was sent. The session id alone is not enough,
+since it shows up in URLs and logs.
+"""
+import asyncio
+import hmac
+import json
+import logging
+import os
+import select
+import shutil
+import signal
+import socket
+import struct
+import subprocess
+import threading
+import time
+
+from . import scrollback
+
+logger = logging.getLogger(__name__)
+
+# Close code telling clients the server is restarting and they should reconnect right away
+HANDOFF_CLOSE_CODE = 4001
+
+PROTOCOL_VERSION = 1
+HEADER = struct.Struct('!I')
+FD_MARKER = b'F'
+ACK = b'\x01'
+IO_TIMEOUT = 10.0  # seconds allowed for any single step of the exchange
+MAX_HEADER_BYTES = 16 * 1024 * 1024
+
+_loop = None
+_adopted = {}
+_adopted_lock = threading.Lock()
+_listener = None
+
+
+class HandoffError(Exception):
+    """The handoff exchange could not be completed"""
+
+
+class ResumeRefused(Exception):
+    """A client asked for an inherited session without its resume token"""
+
+
+class AdoptedProcess:
+    """Popen-like handle for a shell started by a previous worker
+
+    The shell is not our child, so it is tracked and signalled through a
+    pidfd. Its exit status goes to whoever reaps it, so returncode is only
+    -1 ("exited") once the process is gone.
+    """
+
+    def __init__(self, pid, pidfd):
+        self.pid = pid
+        self.pidfd = pidfd
+        self.returncode = None
+
+    def _exited(self):
+        self.returncode = -1
+        self.close()
+
+    def poll(self):
+        if self.returncode is None:
+            ready, _, _ = select.select([self.pidfd], [], [], 0)
+            if ready:
+                self._exited()
+        return self.returncode
+
+    def wait(self, timeout=None):
+        if self.returncode is None:
+            ready, _, _ = select.select([self.pidfd], [], [], timeout)
+            if not ready:
+                raise subprocess.TimeoutExpired(f"pid {self.pid}", timeout)
+            self._exited()
+        return self.returncode
+
+    def send_signal(self, sig):
+        if self.returncode is None:
+            try:
+                signal.pidfd_send_signal(self.pidfd, sig)
+            except ProcessLookupError:
+                pass
+
+    def terminate(self):
+        self.send_signal(signal.SIGTERM)
+
+    def kill(self):
+        self.send_signal(signal.SIGKILL)
+
+    def close(self):
+        if self.pidfd is not None:
+            os.close(self.pidfd)
+            self.pidfd = None
+
+
+class AdoptedChannel:
+    """A shell inherited from the previous worker, ready to be attached to a consumer"""
+
+    def __init__(self, channel_id, master_fd, proc):
+        self.channel_id = channel_id
+        self.master_fd = master_fd
+        self.proc = proc
+
+
+class AdoptedSession:
+    """Everything a TerminalConsumer needs to carry on an inherited session"""
+
+    def __init__(self, meta, channels, expires):
+        self.session_id = meta['session_id']
+        self.workspace = meta['workspace']
+        self.sandbox_name = meta['sandbox_name']
+        self.identity = meta['identity']
+        # Sessions from a worker without resume tokens can't be claimed safely and just expire
+        self.resume_token = meta.get('resume_token')
+        baseline = meta['baseline']
+        self.workspace_baseline = None if baseline is None else {
+            rel: tuple(entry) for rel, entry in baseline.items()
+        }
+        self.channels = channels
+        self.expires = expires
+
+    def prune(self):
+        """Drop channels whose shell already exited"""
+        alive = []
+        for channel in self.channels:
+            if channel.proc.poll() is None:
+                alive.append(channel)
+            else:
+                os.close(channel.master_fd)
+        self.channels = alive
+
+    def meta(self):
+        return {
+            'session_id': self.session_id,
+            'workspace': self.workspace,
+            'sandbox_name': self.sandbox_name,
+            'identity': self.identity,
+            'baseline': self.workspace_baseline,
+            'resume_token': self.resume_token,
+            'channels': [{'id': c.channel_id, 'pid': c.proc.pid} for c in self.channels],
+        }
+
+    def fds(self):
+        fds = []
+        for channel in self.channels:
+            fds.extend((channel.master_fd, channel.proc.pidfd))
+        return fds
+
+    def discard(self):
+        """Kill the shells and delete the workspace of a session nobody came back for"""
+        for channel in self.channels:
+            channel.proc.kill()
+            channel.proc.close()
+            os.close(channel.master_fd)
+        shutil.rmtree(self.workspace, ignore_errors=True)
+        from django.conf import settings
+        if getattr(settings, 'TERMINAL_SCROLLBACK_DIR', ''):
+            scrollback.remove_session(settings.TERMINAL_SCROLLBACK_DIR, self.sandbox_name)
+
+
+def _socket_path():
+    from django.conf import settings
+    return getattr(settings, 'TERMINAL_HANDOFF_SOCKET', '')
+
+
+def remember_loop(loop):
+    """Record the event loop consumers run on so a handoff can suspend them"""
+    global _loop
+    _loop = loop
+
+
+def claim(session_id, resume_token):
+    """Take an inherited session for a reconnecting client, if there is one
+
+    Raises ResumeRefused, leaving the session for its owner, unless
+    resume_token matches the one the session was handed over with.
+    """
+    with _adopted_lock:
+        session = _adopted.get(session_id)
+        if session is None:
+            return None
+        expected = session.resume_token
+        if not expected or not resume_token or not hmac.compare_digest(resume_token.encode(), expected.encode()):
+            raise ResumeRefused("missing or wrong resume token")
+        return _adopted.pop(session_id)
+
+
+def _expire_unclaimed():
+    now = time.monotonic()
+    with _adopted_lock:
+        expired = [s for s in _adopted.values() if s.expires <= now]
+        for session in expired:
+            del _adopted[session.session_id]
+    for session in expired:
+        logger.info(f"Discarding handed-off session nobody reconnected to: {session.session_id}")
+        session.discard()
+
+
+# Wire format helpers
+
+def _recv_exact(sock, size):
+    data = bytearray()
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise HandoffError("Peer closed the handoff socket early")
+        data.extend(chunk)
+    return bytes(data)
+
+
+def _send_message(sock, payload, fds=()):
+    body = json.dumps(payload, separators=(',', ':')).encode()
+    sock.sendall(HEADER.pack(len(body)) + body)
+    if fds:
+        # A one-byte message of its own carries the descriptors so they can't
+        # get attached to the middle of a header on the receiving side
+        socket.send_fds(sock, [FD_MARKER], list(fds))
+
+
+def _recv_message(sock):
+    (size,) = HEADER.unpack(_recv_exact(sock, HEADER.size))
+    if size > MAX_HEADER_BYTES:
+        raise HandoffError(f"Handoff header too large: {size} bytes")
+    payload = json.loads(_recv_exact(sock, size))
+    expected = payload.get('fd_count', 0)
+    fds = []
+    if expected:
+        marker, fds, _, _ = socket.recv_fds(sock, 1, expected)
+        if marker != FD_MARKER or len(fds) != expected:
+            for fd in fds:
+                os.close(fd)
+            raise HandoffError("Handoff descriptors missing or truncated")
+    return payload, fds
+
+
+# Incoming worker
+
+def adopt_from_previous_worker(path):
+    """Ask the worker listening on path for its sessions. Returns how many were adopted."""
+    if not os.path.exists(path):
+        return 0
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(IO_TIMEOUT)
+    try:
+        sock.connect(path)
+    except OSError as e:
+        logger.info(f"No previous worker to take sessions from ({e})")
+        sock.close()
+        return 0
+
+    from django.conf import settings
+    claim_timeout = getattr(settings, 'TERMINAL_HANDOFF_CLAIM_TIMEOUT', 120)
+    received = []
+    try:
+        with sock:
+            _send_message(sock, {'version': PROTOCOL_VERSION})
+            while True:
+                payload, fds = _recv_message(sock)
+                if payload.get('done'):
+                    break
+                channels = []
+                for i, channel in enumerate(payload['channels']):
+                    master_fd, pidfd = fds[2 * i], fds[2 * i + 1]
+                    channels.append(AdoptedChannel(channel['id'], master_fd, AdoptedProcess(channel['pid'], pidfd)))
+                received.append(AdoptedSession(payload, channels, time.monotonic() + claim_timeout))
+            sock.sendall(ACK)
+    except (OSError, ValueError, KeyError, HandoffError) as e:
+        # The sender keeps its sessions unless it saw our ACK, so just let go of ours
+        logger.error(f"Session handoff from previous worker failed: {e}")
+        for session in received:
+            for channel in session.channels:
+                channel.proc.close()
+                os.close(channel.master_fd)
+        return 0
+
+    with _adopted_lock:
+        for session in received:
+            _adopted[session.session_id] = session
+    if received:
+        timer = threading.Timer(claim_timeout, _expire_unclaimed)
+        timer.daemon = True
+        timer.start()
+    logger.info(f"Adopted {len(received)} live sessions from previous worker")
+    return len(received)
+
+
+# Outgoing worker
+
+async def _suspend_live_sessions():
+    from . import sessions
+    consumers = sessions.live_sessions()
+    await asyncio.gather(*(consumer.suspend_for_handoff() for consumer in consumers))
+    return consumers
+
+
+async def _finish_live_sessions(consumers):
+    for consumer in consumers:
+        await consumer.complete_handoff()
+
+
+async def _resume_live_sessions(consumers):
+    for consumer in consumers:
+        await consumer.resume_after_failed_handoff()
+
+
+def _run_on_loop(coro):
+    return asyncio.run_coroutine_threadsafe(coro, _loop).result(IO_TIMEOUT)
+
+
+def _serve_handoff(conn):
+    """Send everything this worker is running to the worker on the other end of conn"""
+    conn.settimeout(IO_TIMEOUT)
+    hello, _ = _recv_message(conn)
+    if hello.get('version') != PROTOCOL_VERSION:
+        raise HandoffError(f"Unsupported handoff protocol version: {hello.get('version')}")
+
+    consumers = _run_on_loop(_suspend_live_sessions()) if _loop is not None else []
+    with _adopted_lock:
+        inherited = list(_adopted.values())
+        _adopted.clear()
+
+    outgoing = []
+    try:
+        for consumer in consumers:
+            meta, fds = consumer.handoff_state()
+            outgoing.append(fds)
+            _send_message(conn, {**meta, 'fd_count': len(fds)}, fds)
+        for session in inherited:
+            session.prune()
+            fds = session.fds()
+            _send_message(conn, {**session.meta(), 'fd_count': len(fds)}, fds)
+        _send_message(conn, {'done': True})
+        if _recv_exact(conn, len(ACK)) != ACK:
+            raise HandoffError("Unexpected handoff acknowledgement")
+    except BaseException:
+        for fds in outgoing:
+            # Only the pidfds were opened for the handoff; the PTYs stay ours
+            for pidfd in fds[1::2]:
+                os.close(pidfd)
+        with _adopted_lock:
+            for session in inherited:
+                _adopted.setdefault(session.session_id, session)
+        if consumers:
+            _run_on_loop(_resume_live_sessions(consumers))
+        raise
+
+    for session in inherited:
+        for channel in session.channels:
+            channel.proc.close()
+            os.close(channel.master_fd)
+    if consumers:
+        _run_on_loop(_finish_live_sessions(consumers))
+    logger.info(f"Handed off {len(consumers) + len(inherited)} sessions; shutting down")
+    os.kill(os.getpid(), signal.SIGTERM)
+
+
+def _listen(server):
+    while True:
+        conn, _ = server.accept()
+        with conn:
+            try:
+                _serve_handoff(conn)
+                return
+            except Exception as e:
+                logger.error(f"Session handoff to new worker failed, keeping sessions: {e}")
+
+
+def start():
+    """Adopt sessions from the previous worker, then wait to hand them to the next one"""
+    global _listener
+    path = _socket_path()
+    if not path or _listener is not None:
+        return
+    adopt_from_previous_worker(path)
+
+    # The previous worker's socket file is replaced; its listener is shutting down anyway
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(path)
+    os.chmod(path, 0o600)
+    server.listen(1)
+    _listener = threading.Thread(target=_listen, args=(server,), name='terminal-handoff', daemon=True)
+    _listener.start()
+    logger.info(f"Listening for session handoff on {path}")
@@ -0,0 +1,78 @@
+"""Application-level heartbeat for terminal sessions.
+
+A half-open connection (a laptop lid closed behind a NAT) never reaches
+``disconnect``, so its sandbox would otherwise run until firejail's timeout.
+One sweeper task per worker pings every live session each interval. Sessions
+the client has not answered for longer than the timeout are torn down, and
+counted as reaped. Each reap is traced as its own ``terminal.disconnect``
+with ``reason=heartbeat``.
+"""
+import asyncio
+import contextvars
+import logging
+import time
+
+from django.conf import settings
+
+from . import sessions
+
+logger = logging.getLogger(__name__)
+
+_sweeper = None
+_stats = {"reaped_total": 0, "last_reaped_at": None}
+
+
+def interval():
+    return getattr(settings, 'TERMINAL_HEARTBEAT_INTERVAL', 20)
+
+
+def timeout():
+    return getattr(settings, 'TERMINAL_HEARTBEAT_TIMEOUT', 60)
+
+
+def ensure_sweeper():
+    """Start this worker's sweeper on the running loop if it isn't already going"""
+    global _sweeper
+    if _sweeper is None or _sweeper.done() or _sweeper.get_loop() is not asyncio.get_running_loop():
+        # The first session to connect starts the sweeper from inside its connect
+        # trace; an empty context keeps the sweeper's work out of that trace
+        _sweeper = asyncio.create_task(_sweep_forever(), context=contextvars.Context())
+
+
+def stats():
+    return {
+        "live_sessions": len(sessions.live_sessions()),
+        "reaped_total": _stats["reaped_total"],
+        "last_reaped_at": _stats["last_reaped_at"],
+        "interval": interval(),
+        "timeout": timeout(),
+    }
+
+
+async def _check(consumer, now, limit):
+    # Still connecting (no shell yet), or paused for a handoff
+    record = consumer.record
+    if record is None or record.pid is None or getattr(consumer, 'suspended', False):
+        return
+    silent_for = now - record.last_activity
+    if silent_for > limit:
+        logger.warning(f"Reaping session {consumer.session_id}: no client traffic for {silent_for:.0f}s")
+        _stats["reaped_total"] += 1
+        _stats["last_reaped_at"] = time.time()
+        await consumer.reap(reason='heartbeat')
+    else:
+        await consumer.send_ping()
+
+
+async def _sweep_forever():
+    while True:
+        await asyncio.sleep(interval())
+        now = time.monotonic()
+        limit = timeout()
+        results = await asyncio.gather(
+            *(_check(consumer, now, limit) for consumer in sessions.live_sessions()),
+            return_exceptions=True,
+        )
+        for result in results:
+            if isinstance(result, Exception):
+                logger.error(f"Heartbeat check failed: {result}")
@@ -0,0 +1,57 @@
+import json
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from terminal.bench import corpus, replay
+from terminal.ptytrace import read_trace
+
+DEFAULT_THRESHOLDS = os.path.join(os.path.dirname(replay.__file__), 'thresholds.json')
+
+
+class Command(BaseCommand):
+    help = "Replay pty traces through the terminal output pipeline and report throughput, latency and allocations"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--trace', action='append', default=[], help="Extra .ptytrace[.gz] file to replay (repeatable)")
+        parser.add_argument('--only', action='append', default=[], help="Run only this built-in trace (repeatable)")
+        parser.add_argument('--no-builtin', action='store_true', help="Skip the built-in corpus")
+        parser.add_argument('--thresholds', default=DEFAULT_THRESHOLDS, help="JSON file of min_/max_ limits per trace, against ratios to the in-run baseline")
+        parser.add_argument('--no-thresholds', action='store_true', help="Report only, never fail")
+        parser.add_argument('--json', action='store_true', help="Print results as JSON")
+
+    def handle(self, *args, **options):
+        traces = [] if options['no_builtin'] else corpus.builtin_traces(options['only'] or None)
+        for path in options['trace']:
+            try:
+                traces.append(read_trace(path))
+            except (OSError, ValueError) as e:
+                raise CommandError(f"Cannot read trace {path}: {e}")
+        if not traces:
+            raise CommandError("Nothing to replay")
+
+        results = [replay.run_trace(trace) for trace in traces]
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+        else:
+            self.stdout.write(
+                f"{'trace':<18}{'in KB':>9}{'frames':>8}{'wire KB':>9}{'MB/s':>8}{'x base':>8}{'p50 ms':>9}{'p99 ms':>9}{'max ms':>9}{'B/KB':>8}"
+            )
+            for r in results:
+                self.stdout.write(
+                    f"{r['name'][:17]:<18}{r['input_kb']:>9}{r['frames']:>8}{r['wire_kb']:>9}{r['mb_per_s']:>8}{r['speed_ratio']:>8}"
+                    f"{r['p50_read_ms']:>9}{r['p99_read_ms']:>9}{r['max_read_ms']:>9}{r['alloc_bytes_per_kb']:>8}"
+                )
+
+        if options['no_thresholds']:
+            return
+        try:
+            with open(options['thresholds']) as f:
+                thresholds = json.load(f)
+        except (OSError, ValueError) as e:
+            raise CommandError(f"Cannot read thresholds {options['thresholds']}: {e}")
+        failures = [failure for r in results for failure in replay.check_thresholds(r, thresholds)]
+        if failures:
+            raise CommandError("Output pipeline regressed:\n  " + "\n  ".join(failures))
+        self.stdout.write(self.style.SUCCESS("All output pipeline thresholds met"))
@@ -0,0 +1,68 @@
+import json
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from terminal import compression
+from terminal.bench import corpus, replay
+from terminal.ptytrace import read_trace
+
+DEFAULT_FRONTEND_MODULE = os.path.join(
+    os.path.dirname(settings.BASE_DIR), 'frontend', 'src', 'utils', 'compressionDictionary.js'
+)
+# utf8_heavy is random text and yes_flood sends nothing, so neither teaches the dictionary anything
+TRAINING_TRACES = ['shell', 'vim', 'top', 'compiler_errors']
+
+
+class Command(BaseCommand):
+    help = "Train the preset dictionary for compressed terminal frames and write the server and client copies"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--trace', action='append', default=[], help="Extra .ptytrace[.gz] file to train on (repeatable)")
+        parser.add_argument('--no-builtin', action='store_true', help="Skip the built-in corpus")
+        parser.add_argument('--size', type=int, default=8 * 1024, help="Dictionary size in bytes (at most 32768)")
+        parser.add_argument('--frames-per-trace', type=int, default=100, help="Train on this many leading frames of each trace")
+        parser.add_argument('--frontend', default=DEFAULT_FRONTEND_MODULE, help="Client module to write")
+
+    def handle(self, *args, **options):
+        if not 0 < options['size'] <= compression.MAX_DICTIONARY_SIZE:
+            raise CommandError(f"--size must be between 1 and {compression.MAX_DICTIONARY_SIZE}")
+        traces = [] if options['no_builtin'] else corpus.builtin_traces(TRAINING_TRACES)
+        for path in options['trace']:
+            try:
+                traces.append(read_trace(path))
+            except (OSError, ValueError) as e:
+                raise CommandError(f"Cannot read trace {path}: {e}")
+
+        # A new connection's first frames are where a dictionary helps; later ones have the stream history
+        sessions = [replay.frames_of(trace) for trace in traces]
+        frames = [frame for session in sessions for frame in session[:options['frames_per_trace']]]
+        if not frames:
+            raise CommandError("No frames to train on")
+        dictionary = compression.train_dictionary(frames, size=options['size'])
+        dict_id = compression.dictionary_id(dictionary)
+
+        with open(compression.DICTIONARY_PATH, 'wb') as f:
+            f.write(dictionary)
+        with open(options['frontend'], 'w', encoding='utf-8') as f:
+            f.write(
+                "// Generated by `python manage.py build_compression_dict`; do not edit.\n"
+                "// Must match backend/terminal/compression_dict.txt byte for byte.\n"
+                f"export const COMPRESSION_DICTIONARY_ID = '{dict_id}';\n"
+                f"export const COMPRESSION_DICTIONARY = {json.dumps(dictionary.decode('utf-8'))};\n"
+            )
+
+        self.stdout.write(f"Wrote {len(dictionary)} byte dictionary {dict_id} from {len(frames)} frames")
+        # Each trace as its own connection, compressing frames the way the consumer does
+        self.stdout.write(f"{'trace':<18}{'first KB':>10}{'deflate':>9}{'+dict':>8}{'all KB':>10}{'deflate':>9}{'+dict':>8}")
+        for trace, session in zip(traces, sessions):
+            row = f"{trace.name[:17]:<18}"
+            for sample in (session[:20], session):
+                plain = compression.FrameCompressor()
+                primed = compression.FrameCompressor(dictionary=dictionary)
+                for frame in sample:
+                    plain.encode(frame)
+                    primed.encode(frame)
+                row += f"{plain.raw_bytes / 1024:>10.1f}{plain.stats()['saved_pct']:>8}%{primed.stats()['saved_pct']:>7}%"
+            self.stdout.write(row)
@@ -0,0 +1,55 @@
+import os
+import pty
+import select
+import subprocess
+
+from django.core.management.base import BaseCommand, CommandError
+
+from terminal.consumers import PTY_READ_SIZE
+from terminal.ptytrace import TraceWriter
+
+
+class Command(BaseCommand):
+    help = "Run a command on a PTY and record its raw output as a pty trace for bench_output"
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', help="Trace file to write (.ptytrace, or .ptytrace.gz to compress)")
+        parser.add_argument('argv', nargs='+', help="Command to run, after --")
+        parser.add_argument('--name', help="Trace name (defaults to the command)")
+        parser.add_argument('--timeout', type=float, default=60, help="Stop recording after this many seconds")
+
+    def handle(self, *args, **options):
+        argv = options['argv']
+        master_fd, slave_fd = pty.openpty()
+        env = dict(os.environ, TERM='linux', COLUMNS='80', LINES='24')
+        try:
+            proc = subprocess.Popen(argv, stdin=slave_fd, stdout=slave_fd, stderr=slave_fd,
+                                    close_fds=True, env=env, start_new_session=True)
+        except OSError as e:
+            os.close(master_fd)
+            raise CommandError(f"Cannot run {argv[0]}: {e}")
+        finally:
+            os.close(slave_fd)
+
+        writer = TraceWriter(options['output'], options['name'] or os.path.basename(argv[0]))
+        total = 0
+        try:
+            while True:
+                ready, _, _ = select.select([master_fd], [], [], options['timeout'])
+                if not ready:
+                    proc.kill()
+                    break
+                try:
+                    data = os.read(master_fd, PTY_READ_SIZE)
+                except OSError:
+                    break  # EIO once the command exits
+                if not data:
+                    break
+                writer.write(data)
+                total += len(data)
+        finally:
+            writer.close()
+            os.close(master_fd)
+            proc.wait()
+
+        self.stdout.write(f"Recorded {total} bytes from {' '.join(argv)} to {options['output']}")
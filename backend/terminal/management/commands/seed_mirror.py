@@ -0,0 +1,39 @@
+import http.client
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from terminal import mirror
+
+
+class Command(BaseCommand):
+    help = "Fetch the lesson URLs into the offline lesson mirror's cache"
+
+    def add_arguments(self, parser):
+        parser.add_argument('urls', nargs='*', help="URLs to fetch (default: TERMINAL_MIRROR_URLS)")
+        parser.add_argument('--dir', default=None, help="Mirror directory (default: TERMINAL_MIRROR_DIR)")
+        parser.add_argument('--no-follow', action='store_true', help="Don't also fetch the targets of redirects")
+        parser.add_argument('--list', action='store_true', help="List what the mirror already holds and exit")
+
+    def handle(self, *args, **options):
+        root = options['dir'] or mirror.root_dir()
+        if not root:
+            raise CommandError("Set TERMINAL_MIRROR_DIR or pass --dir")
+        cache = mirror.MirrorCache(os.path.join(root, 'cache'))
+
+        if options['list']:
+            for url in cache.urls():
+                self.stdout.write(url)
+            return
+
+        failed = 0
+        for url in options['urls'] or getattr(settings, 'TERMINAL_MIRROR_URLS', []):
+            try:
+                for stored, status, size in mirror.seed(cache, url, follow=not options['no_follow']):
+                    self.stdout.write(f"{status} {size:>9} bytes  {stored}")
+            except (OSError, ValueError, http.client.HTTPException) as e:
+                failed += 1
+                self.stderr.write(f"Failed to fetch {url}: {e}")
+        if failed:
+            raise CommandError(f"{failed} URL(s) could not be fetched")
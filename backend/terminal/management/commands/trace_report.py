@@ -0,0 +1,87 @@
+import json
+import os
+import socket
+import threading
+
+from django.core.management.base import BaseCommand, CommandError
+
+from terminal import tracing
+
+
+class Command(BaseCommand):
+    help = "Summarize exported connect/disconnect spans as per-phase percentiles, or collect them from a socket"
+
+    def add_arguments(self, parser):
+        parser.add_argument('files', nargs='+', help="OTLP/JSON lines files (.gz ok); with --listen, the file to append to")
+        parser.add_argument('--root', action='append', default=[], help="Only traces whose root span has this name (repeatable)")
+        parser.add_argument('--percentiles', default='50,90,99', help="Comma-separated percentiles to report")
+        parser.add_argument('--json', action='store_true', help="Print results as JSON")
+        parser.add_argument('--listen', metavar='SOCKET', help="Act as the unix: collector, appending batches to the file")
+
+    def handle(self, *args, **options):
+        try:
+            percentiles = [float(p) / 100 for p in options['percentiles'].split(',')]
+        except ValueError:
+            raise CommandError("--percentiles must be comma-separated numbers")
+        if not all(0 < p <= 1 for p in percentiles):
+            raise CommandError("--percentiles must be between 0 and 100")
+
+        if options['listen']:
+            if len(options['files']) != 1:
+                raise CommandError("--listen takes exactly one output file")
+            self.collect(options['listen'], options['files'][0])
+
+        spans = []
+        for path in options['files']:
+            try:
+                spans.extend(tracing.read_spans(path))
+            except (OSError, ValueError, KeyError) as e:
+                raise CommandError(f"Cannot read spans from {path}: {e}")
+        rows = tracing.summarize(spans, percentiles)
+        if options['root']:
+            rows = [row for row in rows if row['phase'][0] in options['root']]
+        if not rows:
+            raise CommandError("No complete traces found")
+
+        if options['json']:
+            self.stdout.write(json.dumps([{**row, "phase": "/".join(row['phase'])} for row in rows], indent=2))
+            return
+        columns = [key for key in rows[0] if key.startswith('p') and key.endswith('_ms') and key != 'phase']
+        self.stdout.write(
+            f"{'phase':<40}{'count':>7}{'errors':>7}{'mean ms':>10}"
+            + "".join(f"{key[:-3] + ' ms':>10}" for key in columns)
+            + f"{'max ms':>10}{'share':>8}"
+        )
+        for row in rows:
+            label = "  " * (len(row['phase']) - 1) + row['phase'][-1]
+            self.stdout.write(
+                f"{label[:39]:<40}{row['count']:>7}{row['errors']:>7}{row['mean_ms']:>10}"
+                + "".join(f"{row[key]:>10}" for key in columns)
+                + f"{row['max_ms']:>10}{str(row['share']) + '%':>8}"
+            )
+
+    def collect(self, socket_path, output):
+        """Accept exporter connections and append each line they send to output, until interrupted"""
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(socket_path)
+        server.listen(16)
+        write_lock = threading.Lock()
+        self.stdout.write(f"Collecting spans on {socket_path} into {output}; Ctrl-C to stop and summarize")
+
+        def receive(connection):
+            with connection, connection.makefile('rb') as lines:
+                for line in lines:
+                    with write_lock, open(output, 'ab') as f:
+                        f.write(line if line.endswith(b"\n") else line + b"\n")
+
+        try:
+            while True:
+                connection, _ = server.accept()
+                threading.Thread(target=receive, args=(connection,), daemon=True).start()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.close()
+            os.unlink(socket_path)
@@ -0,0 +1,540 @@
+"""Lesson mirror: an offline, caching HTTP(S) proxy for sandboxed shells.
+
+welcome.txt teaches ``wget https://example.com`` and ``curl -I google.com``,
+but sandboxes run with --net=none. With TERMINAL_MIRROR_DIR set, one worker
+per host serves a proxy on a Unix socket. The socket sits in a directory
+that is mounted read-only into every sandbox, and mirror_forwarder.py makes
+it reachable there as ``http_proxy=http://127.0.0.1:3128``. The proxy only
+answers from an on-disk cache filled ahead of time by
+``manage.py seed_mirror``, so lessons work offline, answer in
+milliseconds, and make no outbound calls. TERMINAL_MIRROR_FETCH lets
+misses be fetched once and cached instead, but only from the lesson hosts
+(TERMINAL_MIRROR_FETCH_HOSTS) and only when they resolve to public
+addresses, so a sandbox can't point the host at its own network or a cloud
+metadata endpoint and have the answer cached for everyone.
+
+HTTPS goes through CONNECT. The mirror terminates TLS with a certificate
+for the requested host, signed by its own CA. Sandboxes trust that CA
+through SSL_CERT_FILE, CURL_CA_BUNDLE and a wgetrc. Certificates are only
+minted for hosts the mirror can answer for (cached URLs and fetch hosts);
+any other CONNECT is refused before TLS starts, so a sandbox can neither
+churn the certificate cache nor obtain a trusted certificate for an
+arbitrary name.
+
+Layout under TERMINAL_MIRROR_DIR:
+
+    public/    mounted read-only into sandboxes: mirror.sock, ca.pem, wgetrc, forwarder
+    private/   CA key, leader lock (never mounted)
+    cache/     one <sha256>.json (status, headers) + <sha256>.body per URL
+"""
+import asyncio
+import datetime
+import fcntl
+import functools
+import hashlib
+import http.client
+import ipaddress
+import json
+import logging
+import os
+import shutil
+import socket
+import ssl
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urljoin, urlsplit
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+PROXY_PORT = 3128
+SOCKET_NAME = 'mirror.sock'
+FORWARDER_SOURCE = os.path.join(os.path.dirname(__file__), 'mirror_forwarder.py')
+MAX_BODY_BYTES = 20 * 1024 * 1024
+MAX_HEADER_BYTES = 64 * 1024
+REQUEST_TIMEOUT = 30
+MAX_REDIRECTS = 5
+LEAF_VALID_DAYS = 365
+MAX_LEAF_CONTEXTS = 256  # TLS contexts kept for recently requested hosts
+USER_AGENT = 'LearnLinux-lesson-mirror/1'
+
+# Not forwarded from cached responses; the mirror sets its own framing
+HOP_BY_HOP = {
+    'connection', 'keep-alive', 'proxy-connection', 'transfer-encoding', 'te', 'trailer',
+    'upgrade', 'proxy-authenticate', 'proxy-authorization', 'content-length',
+}
+
+
+def root_dir():
+    return getattr(settings, 'TERMINAL_MIRROR_DIR', '')
+
+
+def _paths(root):
+    return {
+        "public": os.path.join(root, 'public'),
+        "private": os.path.join(root, 'private'),
+        "cache": os.path.join(root, 'cache'),
+        "socket": os.path.join(root, 'public', SOCKET_NAME),
+        "ca_cert": os.path.join(root, 'public', 'ca.pem'),
+        "ca_key": os.path.join(root, 'private', 'ca-key.pem'),
+        "wgetrc": os.path.join(root, 'public', 'wgetrc'),
+        "forwarder": os.path.join(root, 'public', 'mirror_forwarder.py'),
+    }
+
+
+def normalize_url(url):
+    """Cache key for a URL: lowercase scheme and host, no default port, never an empty path"""
+    parts = urlsplit(url)
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or '').lower()
+    port = parts.port
+    netloc = host if port in (None, 80 if scheme == 'http' else 443) else f"{host}:{port}"
+    path = parts.path or '/'
+    return f"{scheme}://{netloc}{path}" + (f"?{parts.query}" if parts.query else "")
+
+
+def _atomic_write(path, data):
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+class MirrorCache:
+    """URL-addressed responses on disk"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._hosts = set()
+        self._hosts_version = None
+
+    def _base(self, url):
+        return os.path.join(self.directory, hashlib.sha256(normalize_url(url).encode()).hexdigest())
+
+    def get(self, url):
+        """(meta, body) for a cached URL, or None"""
+        base = self._base(url)
+        try:
+            with open(base + '.json') as f:
+                meta = json.load(f)
+            with open(base + '.body', 'rb') as f:
+                body = f.read()
+        except (OSError, ValueError):
+            return None
+        return meta, body
+
+    def put(self, url, status, reason, headers, body):
+        base = self._base(url)
+        # Body first, so a reader that finds the metadata always finds its body
+        _atomic_write(base + '.body', body)
+        _atomic_write(base + '.json', json.dumps({
+            "url": normalize_url(url),
+            "status": status,
+            "reason": reason,
+            "headers": headers,
+            "fetched_at": time.time(),
+        }).encode())
+
+    def urls(self):
+        found = []
+        for name in sorted(os.listdir(self.directory)):
+            if name.endswith('.json'):
+                try:
+                    with open(os.path.join(self.directory, name)) as f:
+                        found.append(json.load(f)["url"])
+                except (OSError, ValueError, KeyError):
+                    continue
+        return found
+
+    def hosts(self):
+        """Hosts with at least one cached URL, rescanned only when the directory changes"""
+        # Entries are renamed into place, so every put (here or by seed_mirror) bumps the mtime
+        version = os.stat(self.directory).st_mtime_ns
+        if version != self._hosts_version:
+            self._hosts = {urlsplit(url).hostname for url in self.urls()}
+            self._hosts_version = version
+        return self._hosts
+
+
+def fetch_hosts():
+    """Hosts the proxy may fetch misses from"""
+    hosts = getattr(settings, 'TERMINAL_MIRROR_FETCH_HOSTS', None)
+    if hosts is None:
+        hosts = [urlsplit(url).hostname for url in getattr(settings, 'TERMINAL_MIRROR_URLS', [])]
+    return {host.lower() for host in hosts if host}
+
+
+def public_address(host, port):
+    """Resolve host, refusing it unless every address it has is on the public internet"""
+    try:
+        infos = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    except socket.gaierror as e:
+        raise ValueError(f"Cannot resolve {host}: {e}")
+    addresses = [info[4][0] for info in infos]
+    for address in addresses:
+        # Drop any IPv6 zone ("fe80::1%eth0") before parsing
+        if not ipaddress.ip_address(address.split('%', 1)[0]).is_global:
+            raise ValueError(f"{host} resolves to a non-public address ({address})")
+    return addresses[0]
+
+
+class _PinnedHTTPConnection(http.client.HTTPConnection):
+    """Connects to an already checked address, so a second DNS answer can't redirect it"""
+
+    def __init__(self, host, port, address, **kwargs):
+        super().__init__(host, port, **kwargs)
+        self.address = address
+
+    def connect(self):
+        self.sock = socket.create_connection((self.address, self.port), self.timeout)
+
+
+class _PinnedHTTPSConnection(http.client.HTTPSConnection):
+    """HTTPS to an already checked address, still verifying the certificate against the host name"""
+
+    def __init__(self, host, port, address, **kwargs):
+        super().__init__(host, port, **kwargs)
+        self.address = address
+
+    def connect(self):
+        sock = socket.create_connection((self.address, self.port), self.timeout)
+        self.sock = self._context.wrap_socket(sock, server_hostname=self.host)
+
+
+def fetch(url, timeout=REQUEST_TIMEOUT, public_only=False):
+    """GET a URL from the internet without following redirects: (status, reason, headers, body)
+
+    With public_only, hosts that resolve to private, loopback, link-local or
+    otherwise non-public addresses are refused (ValueError).
+    """
+    parts = urlsplit(url)
+    https = parts.scheme == 'https'
+    if public_only:
+        port = parts.port or (443 if https else 80)
+        connection_class = _PinnedHTTPSConnection if https else _PinnedHTTPConnection
+        connection = connection_class(
+            parts.hostname, parts.port, public_address(parts.hostname, port), timeout=timeout,
+        )
+    else:
+        connection_class = http.client.HTTPSConnection if https else http.client.HTTPConnection
+        connection = connection_class(parts.hostname, parts.port, timeout=timeout)
+    try:
+        path = (parts.path or '/') + (f"?{parts.query}" if parts.query else "")
+        connection.request('GET', path, headers={'User-Agent': USER_AGENT, 'Accept-Encoding': 'identity'})
+        response = connection.getresponse()
+        body = response.read(MAX_BODY_BYTES + 1)
+        if len(body) > MAX_BODY_BYTES:
+            raise ValueError(f"{url} is larger than {MAX_BODY_BYTES} bytes")
+        headers = [(k, v) for k, v in response.getheaders() if k.lower() not in HOP_BY_HOP]
+        return response.status, response.reason, headers, body
+    finally:
+        connection.close()
+
+
+def seed(cache, url, follow=True):
+    """Fetch a URL (and the redirects it leads to) into the cache; returns the URLs stored"""
+    stored = []
+    for _ in range(MAX_REDIRECTS + 1):
+        status, reason, headers, body = fetch(url)
+        cache.put(url, status, reason, headers, body)
+        stored.append((normalize_url(url), status, len(body)))
+        location = dict((k.lower(), v) for k, v in headers).get('location')
+        if not (follow and 300 <= status < 400 and location):
+            break
+        url = urljoin(url, location)
+    return stored
+
+
+class CertificateAuthority:
+    """The mirror's own CA, and leaf certificates for the hosts sandboxes ask for"""
+
+    def __init__(self, cert_path, key_path, leaf_dir):
+        from cryptography import x509
+        from cryptography.hazmat.primitives import hashes, serialization
+        from cryptography.hazmat.primitives.asymmetric import ec
+        from cryptography.x509.oid import NameOID
+        self._x509, self._hashes, self._serialization, self._ec, self._oid = x509, hashes, serialization, ec, NameOID
+        self.leaf_dir = leaf_dir
+        self._contexts = OrderedDict()
+        os.makedirs(leaf_dir, mode=0o700, exist_ok=True)
+        # Leaf keys are never reused across restarts; clear any a crash left behind
+        for name in os.listdir(leaf_dir):
+            if name.endswith('.pem'):
+                os.unlink(os.path.join(leaf_dir, name))
+        if os.path.exists(cert_path) and os.path.exists(key_path):
+            with open(key_path, 'rb') as f:
+                self.key = serialization.load_pem_private_key(f.read(), None)
+            with open(cert_path, 'rb') as f:
+                self.cert = x509.load_pem_x509_certificate(f.read())
+        else:
+            self._create(cert_path, key_path)
+
+    def _create(self, cert_path, key_path):
+        x509, NameOID = self._x509, self._oid
+        self.key = self._ec.generate_private_key(self._ec.SECP256R1())
+        name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, 'LearnLinux lesson mirror CA')])
+        now = datetime.datetime.now(datetime.timezone.utc)
+        self.cert = (
+            x509.CertificateBuilder()
+            .subject_name(name).issuer_name(name)
+            .public_key(self.key.public_key())
+            .serial_number(x509.random_serial_number())
+            .not_valid_before(now - datetime.timedelta(days=1))
+            .not_valid_after(now + datetime.timedelta(days=3650))
+            .add_extension(x509.BasicConstraints(ca=True, path_length=0), critical=True)
+            .add_extension(x509.KeyUsage(
+                digital_signature=True, key_cert_sign=True, crl_sign=True, content_commitment=False,
+                key_encipherment=False, data_encipherment=False, key_agreement=False,
+                encipher_only=False, decipher_only=False,
+            ), critical=True)
+            .add_extension(x509.SubjectKeyIdentifier.from_public_key(self.key.public_key()), critical=False)
+            .sign(self.key, self._hashes.SHA256())
+        )
+        key_pem = self.key.private_bytes(
+            self._serialization.Encoding.PEM, self._serialization.PrivateFormat.PKCS8,
+            self._serialization.NoEncryption(),
+        )
+        fd = os.open(key_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(key_pem)
+        _atomic_write(cert_path, self.cert.public_bytes(self._serialization.Encoding.PEM))
+        os.chmod(cert_path, 0o644)
+        logger.info(f"Created lesson mirror CA at {cert_path}")
+
+    def _leaf(self, host):
+        """PEM certificate and key for host, signed by this CA"""
+        x509, NameOID = self._x509, self._oid
+        key = self._ec.generate_private_key(self._ec.SECP256R1())
+        try:
+            alt_name = x509.IPAddress(ipaddress.ip_address(host))
+        except ValueError:
+            alt_name = x509.DNSName(host)
+        now = datetime.datetime.now(datetime.timezone.utc)
+        cert = (
+            x509.CertificateBuilder()
+            .subject_name(x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, host[:64])]))
+            .issuer_name(self.cert.subject)
+            .public_key(key.public_key())
+            .serial_number(x509.random_serial_number())
+            .not_valid_before(now - datetime.timedelta(days=1))
+            .not_valid_after(now + datetime.timedelta(days=LEAF_VALID_DAYS))
+            .add_extension(x509.SubjectAlternativeName([alt_name]), critical=False)
+            .add_extension(x509.BasicConstraints(ca=False, path_length=None), critical=True)
+            .add_extension(x509.ExtendedKeyUsage([x509.oid.ExtendedKeyUsageOID.SERVER_AUTH]), critical=False)
+            .add_extension(
+                x509.AuthorityKeyIdentifier.from_issuer_public_key(self.key.public_key()), critical=False,
+            )
+            .sign(self.key, self._hashes.SHA256())
+        )
+        return cert.public_bytes(self._serialization.Encoding.PEM) + key.private_bytes(
+            self._serialization.Encoding.PEM, self._serialization.PrivateFormat.PKCS8,
+            self._serialization.NoEncryption(),
+        )
+
+    def server_context(self, host):
+        """TLS context presenting a certificate for host, kept for the most recent MAX_LEAF_CONTEXTS hosts"""
+        context = self._contexts.get(host)
+        if context is not None:
+            self._contexts.move_to_end(host)
+            return context
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        # load_cert_chain only reads files; the leaf key is on disk just long enough for that
+        fd, path = tempfile.mkstemp(dir=self.leaf_dir, suffix='.pem')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(self._leaf(host))
+            context.load_cert_chain(path)
+        finally:
+            os.unlink(path)
+        self._contexts[host] = context
+        if len(self._contexts) > MAX_LEAF_CONTEXTS:
+            self._contexts.popitem(last=False)
+        return context
+
+
+class MirrorProxy:
+    """Answers proxy requests (absolute-form HTTP and CONNECT) from the cache"""
+
+    def __init__(self, cache, authority, fetch_misses=False, fetch_hosts=()):
+        self.cache = cache
+        self.authority = authority
+        self.fetch_misses = fetch_misses
+        self.fetch_hosts = set(fetch_hosts)
+        self.hits = 0
+        self.misses = 0
+
+    def serves_host(self, host):
+        """Whether the mirror can answer for host, and so may present a certificate for it"""
+        return host in self.fetch_hosts or host in self.cache.hosts()
+
+    async def handle(self, reader, writer):
+        try:
+            request = await asyncio.wait_for(self._read_head(reader), REQUEST_TIMEOUT)
+            if request is None:
+                return
+            method, target = request
+            if method == 'CONNECT':
+                host = target.rsplit(':', 1)[0].strip('[]').lower()
+                if not self.serves_host(host):
+                    self.misses += 1
+                    await self._respond(writer, 403, 'Forbidden', [('Content-Type', 'text/plain')], (
+                        f"{host} is not available in this offline lesson mirror.\n"
+                    ).encode())
+                    return
+                writer.write(b"HTTP/1.1 200 Connection established\r\n\r\n")
+                await writer.drain()
+                await writer.start_tls(self.authority.server_context(host))
+                inner = await asyncio.wait_for(self._read_head(reader), REQUEST_TIMEOUT)
+                if inner is None:
+                    return
+                method, path = inner
+                port = target.rsplit(':', 1)[1] if ':' in target else '443'
+                url = f"https://{host}{'' if port == '443' else ':' + port}{path}"
+            elif target.startswith('http://'):
+                url = target
+            else:
+                await self._respond(writer, 400, 'Bad Request', [], b"The lesson mirror only speaks proxy requests\n")
+                return
+            await self._serve(writer, method, url)
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError,
+                ConnectionError, ssl.SSLError) as e:
+            logger.debug(f"Lesson mirror connection ended: {e}")
+        except Exception as e:
+            logger.error(f"Lesson mirror request failed: {e}")
+        finally:
+            try:
+                writer.close()
+            except Exception:
+                pass
+
+    async def _read_head(self, reader):
+        """(method, target) of the next request; headers are read and ignored"""
+        head = await reader.readuntil(b"\r\n\r\n")
+        if len(head) > MAX_HEADER_BYTES:
+            return None
+        request_line = head.split(b"\r\n", 1)[0].decode('latin-1')
+        parts = request_line.split()
+        if len(parts) != 3:
+            return None
+        return parts[0].upper(), parts[1]
+
+    async def _serve(self, writer, method, url):
+        if method not in ('GET', 'HEAD'):
+            await self._respond(writer, 405, 'Method Not Allowed', [('Allow', 'GET, HEAD')],
+                                b"The lesson mirror is read-only\n")
+            return
+        entry = self.cache.get(url)
+        if entry is None and self.fetch_misses and (urlsplit(url).hostname or '').lower() in self.fetch_hosts:
+            try:
+                status, reason, headers, body = await asyncio.get_running_loop().run_in_executor(
+                    None, functools.partial(fetch, url, public_only=True),
+                )
+                self.cache.put(url, status, reason, headers, body)
+                entry = self.cache.get(url)
+            except (OSError, ValueError, http.client.HTTPException) as e:
+                logger.info(f"Lesson mirror could not fetch {url}: {e}")
+        if entry is None:
+            self.misses += 1
+            await self._respond(writer, 502, 'Not In Mirror', [('Content-Type', 'text/plain')], (
+                f"{normalize_url(url)} is not available in this offline lesson mirror.\n"
+                f"Try one of: {', '.join(self.cache.urls()) or '(the mirror is empty)'}\n"
+            ).encode())
+            return
+        self.hits += 1
+        meta, body = entry
+        headers = [(k, v) for k, v in meta["headers"] if k.lower() not in HOP_BY_HOP]
+        headers.append(('X-Cache', 'HIT from lesson-mirror'))
+        await self._respond(writer, meta["status"], meta["reason"], headers, b"" if method == 'HEAD' else body,
+                            content_length=len(body))
+
+    async def _respond(self, writer, status, reason, headers, body, content_length=None):
+        lines = [f"HTTP/1.1 {status} {reason}"]
+        lines += [f"{k}: {v}" for k, v in headers]
+        lines.append(f"Content-Length: {len(body) if content_length is None else content_length}")
+        lines.append("Connection: close")
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode('latin-1', 'replace') + body)
+        await writer.drain()
+
+
+def _prepare_public(paths):
+    os.makedirs(paths["public"], exist_ok=True)
+    os.makedirs(paths["private"], mode=0o700, exist_ok=True)
+    shutil.copyfile(FORWARDER_SOURCE, paths["forwarder"])
+    _atomic_write(paths["wgetrc"], f"ca_certificate = {paths['ca_cert']}\n".encode())
+    os.chmod(paths["wgetrc"], 0o644)
+
+
+async def _run(paths):
+    authority = CertificateAuthority(paths["ca_cert"], paths["ca_key"], os.path.join(paths["private"], 'leaf'))
+    proxy = MirrorProxy(
+        MirrorCache(paths["cache"]), authority,
+        fetch_misses=getattr(settings, 'TERMINAL_MIRROR_FETCH', False), fetch_hosts=fetch_hosts(),
+    )
+    if os.path.exists(paths["socket"]):
+        os.unlink(paths["socket"])
+    server = await asyncio.start_unix_server(proxy.handle, path=paths["socket"])
+    # Sandboxes run as the same user; nobody else needs in
+    os.chmod(paths["socket"], 0o600)
+    logger.info(f"Lesson mirror serving {len(proxy.cache.urls())} URLs on {paths['socket']}")
+    async with server:
+        await server.serve_forever()
+
+
+def _serve_when_leader(root):
+    paths = _paths(root)
+    try:
+        _prepare_public(paths)
+        lock = open(os.path.join(paths["private"], 'leader.lock'), 'w')
+        # One mirror per host: block until whichever worker holds the lock goes away
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        asyncio.run(_run(paths))
+    except Exception as e:
+        logger.error(f"Lesson mirror stopped: {e}")
+
+
+def start():
+    """Serve the lesson mirror from this worker when it's enabled and no other worker is"""
+    root = root_dir()
+    if not root:
+        return
+    threading.Thread(target=_serve_when_leader, args=(root,), name='lesson-mirror', daemon=True).start()
+
+
+def enabled():
+    return bool(root_dir())
+
+
+def sandbox_argv(argv):
+    """Start a new sandbox's shell behind the in-sandbox forwarder"""
+    if not enabled():
+        return argv
+    paths = _paths(root_dir())
+    return ['python3', paths["forwarder"], paths["socket"], str(PROXY_PORT), '--', *argv]
+
+
+def sandbox_env():
+    """Proxy and CA settings for shells inside a sandbox"""
+    if not enabled():
+        return {}
+    paths = _paths(root_dir())
+    proxy = f"http://127.0.0.1:{PROXY_PORT}/"
+    return {
+        'http_proxy': proxy, 'https_proxy': proxy, 'HTTP_PROXY': proxy, 'HTTPS_PROXY': proxy,
+        'no_proxy': 'localhost,127.0.0.1', 'NO_PROXY': 'localhost,127.0.0.1',
+        'SSL_CERT_FILE': paths["ca_cert"],
+        'CURL_CA_BUNDLE': paths["ca_cert"],
+        'REQUESTS_CA_BUNDLE': paths["ca_cert"],
+        'WGETRC': paths["wgetrc"],
+    }
+
+
+def sandbox_read_only_paths():
+    return [_paths(root_dir())["public"]] if enabled() else []
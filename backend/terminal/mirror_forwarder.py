@@ -0,0 +1,106 @@
+"""Sandbox side of the lesson mirror; runs as the sandbox's first process.
+
+Usage: python3 mirror_forwarder.py <mirror socket> <port> -- <shell argv...>
+
+A sandbox started with --net=none only has loopback, but it can still
+connect to a Unix socket mounted into its filesystem. This opens
+127.0.0.1:<port> inside the sandbox's network namespace and forks a child
+that pipes each connection to the mirror's socket. The shell is then
+exec'd in its place, so ``http_proxy=http://127.0.0.1:<port>`` works for
+everything the student runs. The child is a single-threaded selector loop,
+because every thread would count against the sandbox's process limit.
+
+Standard library only: this runs under the sandbox's python3, not the
+server's environment.
+"""
+import os
+import selectors
+import socket
+import sys
+
+BUFFER_SIZE = 65536
+
+
+def _close_pair(selector, pairs, sock):
+    peer = pairs.pop(sock, None)
+    for s in (sock, peer):
+        if s is None:
+            continue
+        pairs.pop(s, None)
+        try:
+            selector.unregister(s)
+        except (KeyError, ValueError):
+            pass
+        s.close()
+
+
+def serve(listener, socket_path):
+    selector = selectors.DefaultSelector()
+    selector.register(listener, selectors.EVENT_READ)
+    pairs = {}
+    while True:
+        for key, _ in selector.select():
+            sock = key.fileobj
+            if sock is listener:
+                client, _ = listener.accept()
+                upstream = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                try:
+                    upstream.connect(socket_path)
+                except OSError:
+                    client.close()
+                    upstream.close()
+                    continue
+                pairs[client] = upstream
+                pairs[upstream] = client
+                selector.register(client, selectors.EVENT_READ)
+                selector.register(upstream, selectors.EVENT_READ)
+                continue
+            try:
+                data = sock.recv(BUFFER_SIZE)
+            except OSError:
+                data = b""
+            if not data:
+                _close_pair(selector, pairs, sock)
+                continue
+            try:
+                pairs[sock].sendall(data)
+            except (OSError, KeyError):
+                _close_pair(selector, pairs, sock)
+
+
+def main(argv):
+    if len(argv) < 4 or argv[2] != '--':
+        sys.stderr.write("usage: mirror_forwarder.py <socket> <port> -- <command...>\n")
+        return 2
+    socket_path, port, command = argv[0], int(argv[1]), argv[3:]
+
+    listener = None
+    try:
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        listener.bind(('127.0.0.1', port))
+        listener.listen(64)
+    except OSError:
+        # Already forwarded in this sandbox (or no loopback); the shell matters more
+        if listener is not None:
+            listener.close()
+        listener = None
+
+    if listener is not None and os.fork() == 0:
+        # Off the terminal, so job control and the PTY closing don't reach us
+        os.setsid()
+        devnull = os.open(os.devnull, os.O_RDWR)
+        for fd in (0, 1, 2):
+            os.dup2(devnull, fd)
+        try:
+            serve(listener, socket_path)
+        finally:
+            os._exit(0)
+
+    if listener is not None:
+        listener.close()
+    os.execvp(command[0], command)
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
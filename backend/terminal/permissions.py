@@ -0,0 +1,35 @@
+import hmac
+
+from django.conf import settings
+from rest_framework.permissions import BasePermission
+
+
+def token_matches(provided, setting_name):
+    """Constant-time check of a shared-secret token; an unset secret disables access"""
+    expected = getattr(settings, setting_name, '')
+    if not expected or not provided:
+        return False
+    return hmac.compare_digest(str(provided).encode(), expected.encode())
+
+
+def bearer_token(request):
+    """Token from an 'Authorization: Bearer <token>' header"""
+    header = request.META.get('HTTP_AUTHORIZATION', '')
+    scheme, _, token = header.partition(' ')
+    if scheme.lower() != 'bearer':
+        return None
+    return token.strip()
+
+
+class HasInstructorToken(BasePermission):
+    """Allows access to requests carrying TERMINAL_INSTRUCTOR_TOKEN"""
+
+    def has_permission(self, request, view):
+        return token_matches(bearer_token(request), 'TERMINAL_INSTRUCTOR_TOKEN')
+
+
+class HasAdminToken(BasePermission):
+    """Allows access to requests carrying TERMINAL_ADMIN_TOKEN"""
+
+    def has_permission(self, request, view):
+        return token_matches(bearer_token(request), 'TERMINAL_ADMIN_TOKEN')
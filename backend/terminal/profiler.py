@@ -0,0 +1,125 @@
+"""On-demand sampling profiler for a running worker.
+
+Nothing here runs until an admin asks for a profile. While a profile is
+running, a background thread reads ``sys._current_frames()`` at a fixed
+interval and counts each thread's stack. A probe on the event loop measures
+how late its timer callbacks fire, and checks how many jobs are queued on the
+``sync_to_async`` executors. Stacks come out in the collapsed
+"frame;frame;frame count" format that flamegraph.pl and speedscope read.
+"""
+import asyncio
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+from asgiref.sync import SyncToAsync
+
+DEFAULT_INTERVAL = 0.005  # seconds between stack samples
+LAG_PROBE_INTERVAL = 0.05  # seconds between event loop lag measurements
+MAX_STACK_DEPTH = 128
+
+_running = threading.Lock()
+
+
+class ProfilerBusy(Exception):
+    """Another profile is already running in this worker"""
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    name = getattr(code, 'co_qualname', code.co_name)
+    return f"{os.path.basename(code.co_filename)}:{name}"
+
+
+class StackSampler:
+    """Samples every thread's stack from a background thread"""
+
+    def __init__(self, interval=DEFAULT_INTERVAL):
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='terminal-profiler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < MAX_STACK_DEPTH:
+                    stack.append(_frame_label(frame))
+                    frame = frame.f_back
+                stack.append(names.get(ident, f"thread-{ident}"))
+                self.stacks[';'.join(reversed(stack))] += 1
+            self.samples += 1
+
+    def collapsed(self):
+        """Stacks in collapsed format, hottest first"""
+        return '\n'.join(f"{stack} {count}" for stack, count in self.stacks.most_common())
+
+
+def _queue_depth(executor):
+    queue = getattr(executor, '_work_queue', None)
+    return queue.qsize() if queue is not None else 0
+
+
+def _summary(values, scale=1):
+    if not values:
+        return {"mean": 0, "p99": 0, "max": 0}
+    ordered = sorted(values)
+    return {
+        "mean": round(sum(ordered) / len(ordered) * scale, 3),
+        "p99": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))] * scale, 3),
+        "max": round(ordered[-1] * scale, 3),
+    }
+
+
+async def profile(seconds, interval=DEFAULT_INTERVAL):
+    """Sample the worker for `seconds` and report stacks, loop lag and executor backlog"""
+    if not _running.acquire(blocking=False):
+        raise ProfilerBusy("A profile is already running")
+    try:
+        loop = asyncio.get_running_loop()
+        sampler = StackSampler(interval)
+        lags = []
+        default_queue = []
+        thread_sensitive_queue = []
+        started = time.monotonic()
+
+        sampler.start()
+        try:
+            deadline = loop.time() + seconds
+            while loop.time() < deadline:
+                scheduled = loop.time()
+                await asyncio.sleep(LAG_PROBE_INTERVAL)
+                lags.append(max(0.0, loop.time() - scheduled - LAG_PROBE_INTERVAL))
+                default_queue.append(_queue_depth(getattr(loop, '_default_executor', None)))
+                thread_sensitive_queue.append(_queue_depth(SyncToAsync.single_thread_executor))
+        finally:
+            await asyncio.to_thread(sampler.stop)
+
+        return {
+            "duration": round(time.monotonic() - started, 3),
+            "interval_ms": interval * 1000,
+            "samples": sampler.samples,
+            "loop_lag_ms": _summary(lags, scale=1000),
+            "executor_queue": {
+                "default": _summary(default_queue),
+                "thread_sensitive": _summary(thread_sensitive_queue),
+            },
+            "stacks": sampler.collapsed(),
+        }
+    finally:
+        _running.release()
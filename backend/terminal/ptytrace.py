@@ -0,0 +1,103 @@
+"""Recorded PTY output streams ("pty traces") with timing.
+
+A trace is a JSON-lines file, gzip-compressed when its name ends in ``.gz``.
+The first line is a header:
+
+    {"version": 1, "name": "vim", "cols": 80, "rows": 24, "created": 1700000000.0}
+
+Each following line is one read from the PTY master:
+
+    [0.0132, "G1tIG1sySg=="]
+
+The first field is seconds since the start of the trace and the second is
+the raw bytes, base64 encoded. Raw bytes are kept rather than text so that
+UTF-8 sequences split across reads are replayed exactly as the kernel
+delivered them.
+"""
+import base64
+import gzip
+import json
+import os
+import re
+import time
+
+TRACE_VERSION = 1
+
+
+def _open(path, mode):
+    if path.endswith('.gz'):
+        return gzip.open(path, mode + 't', encoding='utf-8')
+    return open(path, mode, encoding='utf-8')
+
+
+class TraceWriter:
+    """Appends timed reads to a trace file"""
+
+    def __init__(self, path, name, cols=80, rows=24):
+        self.path = path
+        self.started = time.monotonic()
+        self._file = _open(path, 'w')
+        self._file.write(json.dumps({
+            "version": TRACE_VERSION,
+            "name": name,
+            "cols": cols,
+            "rows": rows,
+            "created": time.time(),
+        }) + "\n")
+
+    def write(self, data, at=None):
+        if at is None:
+            at = time.monotonic() - self.started
+        self._file.write(json.dumps([round(at, 6), base64.b64encode(data).decode('ascii')]) + "\n")
+
+    def close(self):
+        self._file.close()
+
+
+class Trace:
+    """A loaded trace: header fields plus a list of (seconds, bytes) events"""
+
+    def __init__(self, name, events, cols=80, rows=24):
+        self.name = name
+        self.events = events
+        self.cols = cols
+        self.rows = rows
+
+    @property
+    def size(self):
+        return sum(len(data) for _, data in self.events)
+
+    @property
+    def duration(self):
+        return self.events[-1][0] if self.events else 0.0
+
+
+def read_trace(path):
+    with _open(path, 'r') as f:
+        header = json.loads(f.readline())
+        if header.get('version') != TRACE_VERSION:
+            raise ValueError(f"Unsupported trace version in {path}: {header.get('version')}")
+        events = []
+        for line in f:
+            if line.strip():
+                at, data = json.loads(line)
+                events.append((at, base64.b64decode(data)))
+    return Trace(header.get('name') or os.path.basename(path), events, header.get('cols', 80), header.get('rows', 24))
+
+
+def write_trace(path, trace):
+    writer = TraceWriter(path, trace.name, trace.cols, trace.rows)
+    try:
+        for at, data in trace.events:
+            writer.write(data, at)
+    finally:
+        writer.close()
+
+
+def open_session_trace(trace_dir, session_id, channel_id):
+    """Start capturing one live channel into trace_dir"""
+    os.makedirs(trace_dir, exist_ok=True)
+    safe_session = re.sub(r'[^A-Za-z0-9_-]', '_', session_id)[:64]
+    safe_channel = re.sub(r'[^A-Za-z0-9_-]', '_', channel_id)
+    name = f"{safe_session}-{safe_channel}-{int(time.time())}"
+    return TraceWriter(os.path.join(trace_dir, f"{name}.ptytrace.gz"), name)
@@ -3,4 +3,5 @@ from . import consumers
 
 websocket_urlpatterns = [
     path('ws/terminal/', consumers.TerminalConsumer.as_asgi()),
+    path('ws/terminal/observe/', consumers.ObserverConsumer.as_asgi()),
 ]
@@ -0,0 +1,498 @@
+"""Full output history of every channel, on disk and searchable from the client.
+
+The browser only keeps the last MAX_OUTPUT_LINES lines, so the server keeps
+the rest. Output is recorded the way the browser splits it into lines (every
+output message ends a line), with escape sequences removed. Lines collect in
+memory until there are about BLOCK_SIZE bytes. That block is then compressed
+on its own and appended to ``<channel>.log``, and a fixed-size checkpoint
+(log offset, compressed size, first line number, line count) is appended to
+``<channel>.idx``. Blocks only ever hold whole lines. Compression and file
+I/O happen on one writer thread shared by every log, never on the event
+loop; blocks still queued for it are searched as part of the tail.
+
+A search looks up the block holding its start line from the checkpoints and
+inflates one block at a time. Before splitting a block into lines it runs
+the compiled matcher once over the whole block, so blocks without a match
+cost one inflate and one regex scan. Memory use doesn't depend on how much
+history there is, and each page of results stops after a bounded number of
+matches or scanned bytes. The caller gets a cursor to resume from.
+"""
+import bisect
+import hashlib
+import logging
+import os
+import pickle
+import re
+import select
+import shutil
+import signal
+import struct
+import subprocess
+import sys
+import threading
+import time
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from re import _parser as sre_parse
+except ImportError:  # Python < 3.11
+    import sre_parse
+
+logger = logging.getLogger(__name__)
+
+BLOCK_SIZE = 64 * 1024  # Uncompressed bytes per block
+COMPRESS_LEVEL = 1  # Terminal output compresses well even at the fastest level
+CHECKPOINT = struct.Struct('<QIQI')  # offset, compressed size, first line, line count
+MAX_QUERY_LENGTH = 256
+MAX_CONTEXT_LINES = 10
+MAX_LINE_CHARS = 2000  # Longer lines are cut short in results
+PAGE_SCAN_BYTES = 32 * 1024 * 1024  # Uncompressed bytes one page may scan before returning a cursor
+PAGE_SECONDS = 2.0  # Wall time one page may take before returning a cursor
+REGEX_KILL_SECONDS = 5.0  # A regex page still running after this is killed
+DEADLINE_CHECK_LINES = 1024
+_REPEATS = (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT) + (
+    (sre_parse.POSSESSIVE_REPEAT,) if hasattr(sre_parse, 'POSSESSIVE_REPEAT') else ()
+)
+
+# CSI, OSC and two-character escape sequences; none may swallow a newline, or line numbers would drift
+ESCAPE_RE = re.compile(r'\x1b\[[0-?]*[ -/]*[@-~]|\x1b\][^\x07\x1b\n]*(?:\x07|\x1b\\)|\x1b[@-Z\\-_]|\r')
+
+
+def _session_dir(root, key):
+    # Keys are server-generated and unique per connection (the sandbox name), but never trust a path
+    return os.path.join(root, hashlib.sha256(key.encode()).hexdigest()[:32])
+
+
+def open_log(root, key, channel_id, max_bytes):
+    """Open (or, after a handoff, reopen) a channel's history; key identifies the connection's sandbox"""
+    directory = _session_dir(root, key)
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    name = hashlib.sha256(channel_id.encode()).hexdigest()[:16]
+    return ScrollbackLog(os.path.join(directory, name), max_bytes)
+
+
+def remove_session(root, key):
+    """Delete every channel's history of a connection's sandbox"""
+    shutil.rmtree(_session_dir(root, key), ignore_errors=True)
+
+
+def _subpatterns(value):
+    if isinstance(value, sre_parse.SubPattern):
+        yield value
+    elif isinstance(value, (list, tuple)):
+        for item in value:
+            yield from _subpatterns(item)
+
+
+def _check_regex(pattern):
+    """Refuse constructs that make Python's backtracking matcher run for exponential time"""
+    for op, av in pattern:
+        if op in (sre_parse.GROUPREF, sre_parse.GROUPREF_EXISTS):
+            raise ValueError("Backreferences are not supported in searches")
+        if op in _REPEATS:
+            low, high, body = av
+            if high > 1 and any(
+                inner_op in _REPEATS or inner_op == sre_parse.BRANCH
+                for inner_op, _ in _flatten(body)
+            ):
+                raise ValueError("Nested quantifiers (like (a*)* or (a|b)+) are not supported in searches")
+        for sub in _subpatterns(av):
+            _check_regex(sub)
+
+
+def _flatten(pattern):
+    for op, av in pattern:
+        yield op, av
+        for sub in _subpatterns(av):
+            yield from _flatten(sub)
+
+
+class Matcher:
+    """A compiled search, with a cheap whole-block test in front of the per-line one
+
+    Regex searches only ever run line by line (lines cut at MAX_LINE_CHARS).
+    Patterns with nested quantifiers or backreferences are refused, and the
+    rest run in a child process (see ``search_page``), because even a pattern
+    like ``a*a*c`` can backtrack for seconds on one long line.
+    """
+
+    def __init__(self, query, regex=False, case_sensitive=False):
+        if not query or len(query) > MAX_QUERY_LENGTH:
+            raise ValueError(f"Search queries must be 1 to {MAX_QUERY_LENGTH} characters")
+        flags = 0 if case_sensitive else re.IGNORECASE
+        self.regex = regex
+        if regex:
+            try:
+                _check_regex(sre_parse.parse(query, flags))
+            except (re.error, OverflowError, RecursionError) as e:
+                raise ValueError(f"Invalid pattern: {e}")
+        # Plain-text, case-insensitive ASCII queries (the common case) fold ASCII only, so a
+        # lowercased block plus str.find can rule blocks out; that is several times faster than re
+        self.needle = None
+        if not regex and not case_sensitive and query.isascii():
+            self.needle = query.lower()
+            flags |= re.ASCII
+        try:
+            self.pattern = re.compile(query if regex else re.escape(query), flags)
+        except re.error as e:
+            raise ValueError(f"Invalid pattern: {e}")
+
+    def block_may_match(self, text):
+        if self.needle is not None:
+            return self.needle in text.lower()
+        if self.regex:
+            return True
+        return self.pattern.search(text) is not None
+
+    def matches(self, line):
+        return self.pattern.search(line[:MAX_LINE_CHARS] if self.regex else line) is not None
+
+
+_BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_CHILD_COMMAND = "import sys; from terminal.scrollback import _search_main; _search_main(sys.stdin.buffer, sys.stdout.buffer)"
+_FRAME = struct.Struct('<Q')  # Length prefix of each pickled request and result
+
+
+def _search_main(stdin, stdout):
+    """Regex search worker: pickled (snapshot, args) requests in, pickled results out, until stdin closes"""
+    # Ctrl-C in a development server reaches the whole process group; the parent decides when we stop
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    while True:
+        header = stdin.read(_FRAME.size)
+        if len(header) < _FRAME.size:
+            return
+        snapshot, args = pickle.loads(stdin.read(_FRAME.unpack(header)[0]))
+        try:
+            result = ("ok", snapshot.search(*args))
+        except Exception as e:
+            result = ("error", str(e))
+        data = pickle.dumps(result)
+        stdout.write(_FRAME.pack(len(data)) + data)
+        stdout.flush()
+
+
+class _RegexWorker:
+    """A long-lived child interpreter that runs regex pages for one search thread
+
+    Starting an interpreter per page cost more than most searches. The child
+    is reused until a page outlives REGEX_KILL_SECONDS, when it is killed (a
+    thread running re can't be interrupted) and replaced on the next page.
+    """
+
+    def __init__(self):
+        self.proc = None
+
+    def _start(self):
+        self.proc = subprocess.Popen(
+            [sys.executable, '-c', _CHILD_COMMAND],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, cwd=_BACKEND_DIR,
+        )
+
+    def _read(self, size, deadline):
+        fd = self.proc.stdout.fileno()
+        data = b''
+        while len(data) < size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not select.select([fd], [], [], remaining)[0]:
+                raise subprocess.TimeoutExpired(self.proc.args, REGEX_KILL_SECONDS)
+            chunk = os.read(fd, size - len(data))
+            if not chunk:
+                raise EOFError
+            data += chunk
+        return data
+
+    def stop(self):
+        if self.proc is not None:
+            self.proc.kill()
+            self.proc.wait()
+            self.proc.stdin.close()
+            self.proc.stdout.close()
+            self.proc = None
+
+    def run(self, snapshot, args):
+        if self.proc is None or self.proc.poll() is not None:
+            self.stop()
+            self._start()
+        request = pickle.dumps((snapshot, args))
+        deadline = time.monotonic() + REGEX_KILL_SECONDS
+        try:
+            self.proc.stdin.write(_FRAME.pack(len(request)) + request)
+            self.proc.stdin.flush()
+            size = _FRAME.unpack(self._read(_FRAME.size, deadline))[0]
+            status, result = pickle.loads(self._read(size, deadline))
+        except subprocess.TimeoutExpired:
+            self.stop()
+            raise ValueError("The pattern is too slow to search; try a simpler one")
+        except (OSError, EOFError, pickle.UnpicklingError) as e:
+            logger.error(f"Scrollback search process failed: {e!r}")
+            self.stop()
+            raise ValueError("The search process exited")
+        if status != "ok":
+            raise ValueError(result)
+        return result
+
+
+_workers = threading.local()
+
+
+def search_page(snapshot, matcher, cursor, context, max_matches):
+    """Run one page of a search in the calling thread: (matches, cursor)
+
+    A regex page runs in this thread's regex worker process (see _RegexWorker).
+    """
+    if not matcher.regex:
+        return snapshot.search(matcher, cursor, context, max_matches)
+    worker = getattr(_workers, 'worker', None)
+    if worker is None:
+        worker = _workers.worker = _RegexWorker()
+    return worker.run(snapshot, (matcher, cursor, context, max_matches))
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def executor():
+    """Threads that run searches, kept apart from the shared sync_to_async executor"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            from django.conf import settings
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'SCROLLBACK_SEARCH_THREADS', 2), thread_name_prefix='scrollback-search',
+            )
+    return _executor
+
+
+_writer = None
+
+
+def writer():
+    """The one thread that compresses and writes blocks for every log, in the order they were flushed"""
+    global _writer
+    with _executor_lock:
+        if _writer is None:
+            _writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='scrollback-writer')
+    return _writer
+
+
+def _written():
+    """Nothing to write: a Future for this is done once everything queued before it is"""
+
+
+def compile_matcher(query, regex=False, case_sensitive=False):
+    """Matcher for a search; raises ValueError for queries we won't run"""
+    return Matcher(query, regex, case_sensitive)
+
+
+def _clean(text):
+    # Most output has no escapes at all; don't pay for the regex then
+    if '\x1b' in text:
+        return ESCAPE_RE.sub('', text)
+    return text.replace('\r', '') if '\r' in text else text
+
+
+class ScrollbackLog:
+    """Append-only, block-compressed history of one channel"""
+
+    def __init__(self, base_path, max_bytes):
+        self.log_path = base_path + '.log'
+        self.index_path = base_path + '.idx'
+        self.max_bytes = max_bytes
+        self._pending = []
+        self._pending_bytes = 0
+        # Blocks handed to the writer thread but not yet on disk; guarded by _lock with the counters below
+        self._queued = deque()
+        self._lock = threading.Lock()
+        self._write_failed = False
+        self._log = open(self.log_path, 'ab')
+        self._index = open(self.index_path, 'ab')
+        # Picking up after a handoff: carry on from the last complete checkpoint
+        self.blocks = self._index.tell() // CHECKPOINT.size
+        self.flushed_lines = 0
+        self.log_bytes = self._log.tell()
+        if self.blocks:
+            with open(self.index_path, 'rb') as f:
+                f.seek((self.blocks - 1) * CHECKPOINT.size)
+                offset, size, first, count = CHECKPOINT.unpack(f.read(CHECKPOINT.size))
+            self.flushed_lines = first + count
+            self.log_bytes = offset + size
+        # Drop whatever a crash left after the last checkpoint
+        self._index.truncate(self.blocks * CHECKPOINT.size)
+        self._log.truncate(self.log_bytes)
+        self.full = self.log_bytes >= self.max_bytes
+
+    def append(self, text):
+        """Record one output message as the lines the browser shows for it"""
+        if self.full or not text:
+            return
+        if not text.endswith('\n'):
+            text += '\n'
+        self._pending.append(text)
+        self._pending_bytes += len(text)
+        if self._pending_bytes >= BLOCK_SIZE:
+            self.flush()
+
+    def flush(self):
+        """Hand the in-memory lines to the writer thread as one block
+
+        Returns a Future that is done once this block, and every block
+        flushed before it, is on disk.
+        """
+        if not self._pending:
+            return writer().submit(_written)
+        text = ''.join(self._pending)
+        self._pending = []
+        self._pending_bytes = 0
+        with self._lock:
+            self._queued.append(text)
+        return writer().submit(self._write, text)
+
+    def _write(self, text):
+        """Compress and append one queued block (writer thread)"""
+        if self._write_failed:
+            with self._lock:
+                self._queued.popleft()
+            return
+        text = _clean(text)
+        data = zlib.compress(text.encode('utf-8', errors='replace'), COMPRESS_LEVEL)
+        count = text.count('\n')
+        try:
+            self._log.write(data)
+            self._log.flush()
+            self._index.write(CHECKPOINT.pack(self.log_bytes, len(data), self.flushed_lines, count))
+            self._index.flush()
+        except OSError as e:
+            logger.error(f"Failed to write scrollback to {self.log_path}: {e}")
+            # Later blocks would be numbered from the wrong line
+            self._write_failed = True
+            self.full = True
+            with self._lock:
+                self._queued.popleft()
+            return
+        with self._lock:
+            self._queued.popleft()
+            self.blocks += 1
+            self.flushed_lines += count
+            self.log_bytes += len(data)
+        if self.log_bytes >= self.max_bytes:
+            self.full = True
+            logger.warning(f"Scrollback {self.log_path} reached {self.max_bytes} bytes; no longer recording")
+
+    def buffered_bytes(self):
+        with self._lock:
+            return self._pending_bytes + sum(len(text) for text in self._queued)
+
+    def close(self, remove=False):
+        """Flush and close; remove=True deletes the history as well. Returns a Future like flush"""
+        if remove:
+            self._pending = []
+            self._pending_bytes = 0
+        else:
+            self.flush()
+        return writer().submit(self._close, remove)
+
+    def _close(self, remove):
+        self._log.close()
+        self._index.close()
+        if remove:
+            for path in (self.log_path, self.index_path):
+                try:
+                    os.unlink(path)
+                except OSError:
+                    pass
+
+    def snapshot(self):
+        """What a search may read, taken on the event loop so a search thread never races append"""
+        with self._lock:
+            blocks, flushed_lines, queued = self.blocks, self.flushed_lines, ''.join(self._queued)
+        return ScrollbackSnapshot(
+            self.log_path, self.index_path, blocks, flushed_lines, _clean(queued + ''.join(self._pending)),
+        )
+
+
+class ScrollbackSnapshot:
+    """A consistent, read-only view of a log: its first ``blocks`` blocks plus the unflushed tail"""
+
+    def __init__(self, log_path, index_path, blocks, flushed_lines, tail):
+        self.log_path = log_path
+        self.index_path = index_path
+        self.blocks = blocks
+        self.flushed_lines = flushed_lines
+        self.tail = tail
+        self.lines = flushed_lines + tail.count('\n')
+
+    def _checkpoints(self):
+        with open(self.index_path, 'rb') as f:
+            data = f.read(self.blocks * CHECKPOINT.size)
+        return list(CHECKPOINT.iter_unpack(data[:len(data) - len(data) % CHECKPOINT.size]))
+
+    def _blocks_from(self, line):
+        """(first line, text) of each block from the one holding ``line``, then the tail"""
+        checkpoints = self._checkpoints()
+        start = max(0, bisect.bisect_right([first for _, _, first, _ in checkpoints], line) - 1)
+        if checkpoints[start:]:
+            with open(self.log_path, 'rb') as f:
+                for offset, size, first, count in checkpoints[start:]:
+                    if first + count <= line:
+                        continue
+                    f.seek(offset)
+                    yield first, zlib.decompress(f.read(size)).decode('utf-8', errors='replace')
+        if self.tail:
+            yield self.flushed_lines, self.tail
+
+    def search(self, matcher, start_line=0, context=2, max_matches=50, max_scan_bytes=PAGE_SCAN_BYTES,
+               max_seconds=PAGE_SECONDS):
+        """One page of matches at or after start_line: (matches, cursor or None when the log is exhausted)
+
+        Each match is {"line", "text", "before", "after"} with up to ``context``
+        lines either side. A page also ends early, with a cursor, once it has
+        scanned max_scan_bytes or run for max_seconds.
+        """
+        deadline = time.monotonic() + max_seconds
+        # A regex can be slow on a single line, so check the clock on every one
+        check_every = 1 if matcher.regex else DEADLINE_CHECK_LINES
+        context = max(0, min(context, MAX_CONTEXT_LINES))
+        before = deque(maxlen=context)
+        matches = []
+        waiting = []  # Matches still collecting lines after them
+        scanned = 0
+        # Start early enough to fill the first match's leading context
+        first_wanted = max(0, start_line - context)
+
+        for first, text in self._blocks_from(first_wanted):
+            scanned += len(text)
+            if not waiting and not matcher.block_may_match(text):
+                # Nothing to report in this block; only its last lines can be context for the next
+                if context:
+                    before.extend(line[:MAX_LINE_CHARS] for line in text.rsplit('\n', context + 1)[-context - 1:-1])
+                if scanned >= max_scan_bytes or time.monotonic() > deadline:
+                    return matches, first + text.count('\n')
+                continue
+            block_lines = text.split('\n')
+            block_lines.pop()  # Blocks end with a newline
+
+            for number, line in enumerate(block_lines, first):
+                if number < first_wanted:
+                    continue
+                if not waiting and number % check_every == 0 and time.monotonic() > deadline:
+                    return matches, number
+                for match in waiting:
+                    match["after"].append(line[:MAX_LINE_CHARS])
+                waiting = [m for m in waiting if len(m["after"]) < context]
+                if len(matches) >= max_matches:
+                    if not waiting:
+                        return matches, matches[-1]["line"] + 1
+                elif number >= start_line and matcher.matches(line):
+                    match = {"line": number, "text": line[:MAX_LINE_CHARS], "before": list(before), "after": []}
+                    matches.append(match)
+                    if context:
+                        waiting.append(match)
+                before.append(line[:MAX_LINE_CHARS])
+            if len(matches) >= max_matches and not waiting:
+                return matches, matches[-1]["line"] + 1
+            if (scanned >= max_scan_bytes or time.monotonic() > deadline) and not waiting:
+                return matches, first + len(block_lines)
+        return matches, None
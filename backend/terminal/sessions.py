@@ -0,0 +1,126 @@
+"""In-process index of live terminal sessions, keyed by session ID.
+
+Each consumer carries a SessionRecord, a fixed-layout record of the numbers
+an operator asks about. The output and input paths update it in place:
+a few slot stores per frame, with no dict lookups and no containers that
+grow. Everything more expensive, such as reader state and buffer sizes, is
+only gathered when someone asks through ``describe``.
+
+``last_activity`` is when the client last sent a frame (pongs included); the
+heartbeat reaps sessions on it, and ``describe`` reports it as idle time.
+"""
+import sys
+import time
+
+_live_sessions = {}
+
+
+class SessionRecord:
+    """Counters and identity of one session, updated on every frame"""
+
+    __slots__ = (
+        'session_id', 'identity', 'client', 'pid', 'workspace', 'started_at',
+        'bytes_in', 'bytes_out', 'frames_in', 'frames_out', 'last_activity',
+    )
+
+    def __init__(self, session_id, identity=None, client=None):
+        self.session_id = session_id
+        self.identity = identity
+        self.client = client
+        self.pid = None
+        self.workspace = None
+        self.started_at = time.time()
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.frames_in = 0
+        self.frames_out = 0
+        self.last_activity = time.monotonic()
+
+    def sent(self, size):
+        self.bytes_out += size
+        self.frames_out += 1
+
+    def received(self, size):
+        self.bytes_in += size
+        self.frames_in += 1
+        self.last_activity = time.monotonic()
+
+
+def register(consumer):
+    """Make a connected consumer discoverable by its session ID"""
+    _live_sessions[consumer.session_id] = consumer
+
+
+def unregister(consumer):
+    """Forget a consumer, unless a newer connection already took its session ID"""
+    if _live_sessions.get(consumer.session_id) is consumer:
+        del _live_sessions[consumer.session_id]
+
+
+def get_session(session_id):
+    """Return the live consumer for a session ID, or None"""
+    return _live_sessions.get(session_id)
+
+
+def live_sessions():
+    """Snapshot of all live consumers"""
+    return list(_live_sessions.values())
+
+
+def memory_usage(consumer):
+    """Bytes held in the session's own buffers, by owner"""
+    usage = {
+        "decoders": sum(channel.buffered_bytes() for channel in consumer.channels.values()),
+        "scrollback": sum(
+            channel.scrollback.buffered_bytes() for channel in consumer.channels.values() if channel.scrollback
+        ),
+        "compressor": consumer.compressor.memory_bytes() if consumer.compressor else 0,
+        "broadcast": consumer.broadcaster.buffered_bytes() if consumer.broadcaster else 0,
+        "completion": consumer.completer.buffered_bytes() if consumer.completer else 0,
+    }
+    usage["total"] = sum(usage.values())
+    return usage
+
+
+def _reader_state(channel):
+    task = channel.reader_task
+    if task is None:
+        return "not started"
+    if not task.done():
+        return "running"
+    if task.cancelled():
+        return "cancelled"
+    return "failed" if task.exception() is not None else "finished"
+
+
+def describe(consumer, now=None):
+    """JSON-ready view of one live session"""
+    record = consumer.record
+    now = time.monotonic() if now is None else now
+    return {
+        "session": record.session_id,
+        "identity": record.identity,
+        "client": record.client,
+        "pid": record.pid,
+        "workspace": record.workspace,
+        "started_at": record.started_at,
+        "idle_seconds": round(now - record.last_activity, 1),
+        "bytes_in": record.bytes_in,
+        "bytes_out": record.bytes_out,
+        "frames_in": record.frames_in,
+        "frames_out": record.frames_out,
+        "suspended": consumer.suspended,
+        "reader_running": consumer.reader_running,
+        "channels": [
+            {
+                "channel": channel.channel_id,
+                "pid": channel.proc.pid if channel.proc else None,
+                "running": channel.running,
+                "exit_code": channel.proc.poll() if channel.proc else None,
+                "reader": _reader_state(channel),
+            }
+            for channel in consumer.channels.values()
+        ],
+        "memory": memory_usage(consumer),
+        "record_bytes": sys.getsizeof(record),
+    }
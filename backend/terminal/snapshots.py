@@ -0,0 +1,333 @@
+"""Content-addressed workspace snapshots.
+
+A snapshot only records how a workspace differs from the template written by
+``TerminalConsumer.setup_workspace``: changed or added files (stored once as
+compressed, SHA-256 addressed blobs shared by every identity), extra
+directories, symlinks and deleted template paths. Restoring rebuilds the
+template and replays that delta, so both directions scale with what the
+student actually changed rather than with the size of the workspace.
+
+Snapshots expire after a retention period; blobs no longer referenced by any
+manifest are then swept by a mark-and-sweep pass run after snapshots.
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import stat
+import tempfile
+import threading
+import time
+import zlib
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+MANIFEST_VERSION = 1
+
+# Identities come from the client, so keep them to something safe to hash and log
+IDENTITY_RE = re.compile(r'^[A-Za-z0-9_-]{16,128}$')
+
+# Baseline entries are (size, mtime_ns, digest, origin, in_template). The origin
+# says whether the file is still as setup_workspace wrote it or was replayed
+# from a snapshot; in_template says whether the fresh template has the path, so
+# removing it has to be recorded as a deletion whatever its origin.
+ORIGIN_TEMPLATE = 'template'
+ORIGIN_RESTORED = 'restored'
+
+# Unreferenced blobs younger than this are left alone: a snapshot on another
+# worker may have stored them and not yet written the manifest that refers to them
+GC_GRACE_SECONDS = 3600
+GC_INTERVAL = 3600
+
+# Regenerable caches kept inside the workspace (see buildcache); not worth storing
+SKIP_PATHS = {os.path.join('.cache', 'ccache'), os.path.join('.cache', 'pycache')}
+
+
+_store = None
+
+
+def get_store():
+    """The configured snapshot store, or None when persistence is disabled"""
+    global _store
+    from django.conf import settings
+    if not getattr(settings, 'WORKSPACE_PERSISTENCE_ENABLED', False):
+        return None
+    if _store is None:
+        _store = SnapshotStore(
+            settings.WORKSPACE_SNAPSHOT_DIR,
+            retention_days=getattr(settings, 'WORKSPACE_SNAPSHOT_RETENTION_DAYS', 30),
+        )
+    return _store
+
+
+def is_valid_identity(identity):
+    return bool(identity) and bool(IDENTITY_RE.match(identity))
+
+
+def scan_template(workspace):
+    """Record every path of a freshly created template workspace as the baseline"""
+    baseline = {}
+    for root, dirs, files in os.walk(workspace):
+        for name in dirs + files:
+            path = os.path.join(root, name)
+            st = os.lstat(path)
+            baseline[os.path.relpath(path, workspace)] = (st.st_size, st.st_mtime_ns, None, ORIGIN_TEMPLATE, True)
+    return baseline
+
+
+def _in_template(base):
+    # Baselines handed over by a worker from before the in_template flag have four fields
+    return base[4] if len(base) > 4 else base[3] == ORIGIN_TEMPLATE
+
+
+def _remove_path(path):
+    """Remove whatever is at path, if anything"""
+    if os.path.isdir(path) and not os.path.islink(path):
+        shutil.rmtree(path, ignore_errors=True)
+    elif os.path.lexists(path):
+        os.unlink(path)
+
+
+def _hash_file(path):
+    digest = hashlib.sha256()
+    fd = os.open(path, os.O_RDONLY | getattr(os, 'O_NOFOLLOW', 0))
+    with os.fdopen(fd, 'rb', buffering=0) as f:
+        while True:
+            data = f.read(CHUNK_SIZE)
+            if not data:
+                break
+            digest.update(data)
+    return digest.hexdigest()
+
+
+class SnapshotStore:
+    """On-disk blob and manifest store rooted at a single directory"""
+
+    def __init__(self, root, retention_days=30):
+        self.root = root
+        self.retention_days = retention_days
+        self.objects_dir = os.path.join(root, 'objects')
+        self.manifests_dir = os.path.join(root, 'manifests')
+        os.makedirs(self.objects_dir, exist_ok=True)
+        os.makedirs(self.manifests_dir, exist_ok=True)
+        self._gc_lock = threading.Lock()
+        self._last_gc = 0.0
+
+    def _blob_path(self, digest):
+        return os.path.join(self.objects_dir, digest[:2], digest[2:])
+
+    def _manifest_path(self, identity):
+        key = hashlib.sha256(identity.encode()).hexdigest()
+        return os.path.join(self.manifests_dir, f"{key}.json")
+
+    def _atomic_tempfile(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        return tempfile.NamedTemporaryFile(dir=directory, prefix='.tmp-', delete=False)
+
+    def put_blob(self, path):
+        """Store a file's contents if not already present and return its digest"""
+        digest = _hash_file(path)
+        blob_path = self._blob_path(digest)
+        try:
+            # Refresh the mtime so a concurrent sweep treats the blob as newly written
+            os.utime(blob_path)
+            return digest
+        except FileNotFoundError:
+            pass
+
+        compressor = zlib.compressobj(6)
+        tmp = self._atomic_tempfile(os.path.dirname(blob_path))
+        try:
+            with tmp, open(path, 'rb', buffering=0) as src:
+                while True:
+                    data = src.read(CHUNK_SIZE)
+                    if not data:
+                        break
+                    tmp.write(compressor.compress(data))
+                tmp.write(compressor.flush())
+            os.replace(tmp.name, blob_path)
+        except BaseException:
+            os.unlink(tmp.name)
+            raise
+        return digest
+
+    def copy_blob(self, digest, dest):
+        """Decompress a blob into dest without following an existing symlink there"""
+        decompressor = zlib.decompressobj()
+        flags = os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, 'O_NOFOLLOW', 0)
+        with open(self._blob_path(digest), 'rb') as src, os.fdopen(os.open(dest, flags, 0o600), 'wb') as out:
+            while True:
+                data = src.read(CHUNK_SIZE)
+                if not data:
+                    break
+                out.write(decompressor.decompress(data))
+            out.write(decompressor.flush())
+
+    def load_manifest(self, identity):
+        try:
+            with open(self._manifest_path(identity)) as f:
+                manifest = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.error(f"Unreadable snapshot manifest for identity: {e}")
+            return None
+        if manifest.get('version') != MANIFEST_VERSION:
+            return None
+        return manifest
+
+    def save_manifest(self, identity, manifest):
+        tmp = self._atomic_tempfile(self.manifests_dir)
+        try:
+            with tmp:
+                tmp.write(json.dumps(manifest, separators=(',', ':')).encode())
+            os.replace(tmp.name, self._manifest_path(identity))
+        except BaseException:
+            os.unlink(tmp.name)
+            raise
+
+    def snapshot(self, identity, workspace, baseline):
+        """Record how the workspace differs from its baseline. Returns (changed_files, new_bytes_hashed)."""
+        files = {}
+        symlinks = {}
+        dirs = []
+        seen = set()
+        hashed_bytes = 0
+
+        for root, dirnames, filenames in os.walk(workspace):
+            dirnames[:] = [d for d in dirnames if os.path.relpath(os.path.join(root, d), workspace) not in SKIP_PATHS]
+            for name in dirnames + filenames:
+                path = os.path.join(root, name)
+                rel = os.path.relpath(path, workspace)
+                try:
+                    st = os.lstat(path)
+                except FileNotFoundError:
+                    continue
+                seen.add(rel)
+                base = baseline.get(rel)
+
+                if stat.S_ISLNK(st.st_mode):
+                    symlinks[rel] = os.readlink(path)
+                elif stat.S_ISDIR(st.st_mode):
+                    if base is None:
+                        dirs.append(rel)
+                elif stat.S_ISREG(st.st_mode):
+                    unchanged = base is not None and base[0] == st.st_size and base[1] == st.st_mtime_ns
+                    if unchanged and base[3] == ORIGIN_TEMPLATE:
+                        continue
+                    if unchanged:
+                        digest = base[2]
+                    else:
+                        digest = self.put_blob(path)
+                        hashed_bytes += st.st_size
+                    files[rel] = [digest, stat.S_IMODE(st.st_mode), st.st_mtime_ns]
+
+        deleted = sorted(rel for rel, base in baseline.items() if _in_template(base) and rel not in seen)
+        self.save_manifest(identity, {
+            'version': MANIFEST_VERSION,
+            'files': files,
+            'symlinks': symlinks,
+            'dirs': sorted(dirs),
+            'deleted': deleted,
+        })
+        self.maybe_collect_garbage()
+        return len(files), hashed_bytes
+
+    def restore(self, identity, workspace, baseline):
+        """Replay a saved delta on top of a template workspace. Returns the updated baseline, or None.
+
+        This runs eagerly before the shell starts: the shell reads files straight
+        from disk, so deferring them would need a FUSE layer inside the sandbox.
+        Only the delta is written, so it is already proportional to what changed.
+        """
+        manifest = self.load_manifest(identity)
+        if manifest is None:
+            return None
+
+        # Deepest paths first so directory removals never hit already-removed children
+        for rel in sorted(manifest['deleted'], key=len, reverse=True):
+            _remove_path(os.path.join(workspace, rel))
+
+        for rel in manifest['dirs']:
+            os.makedirs(os.path.join(workspace, rel), exist_ok=True)
+
+        restored = dict(baseline)
+        for rel, (digest, mode, mtime_ns) in manifest['files'].items():
+            path = os.path.join(workspace, rel)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            if os.path.isdir(path) and not os.path.islink(path):
+                _remove_path(path)  # A template directory was replaced by a file
+            try:
+                self.copy_blob(digest, path)
+            except FileNotFoundError:
+                logger.error(f"Snapshot blob {digest} missing, skipping {rel}")
+                continue
+            os.chmod(path, mode)
+            os.utime(path, ns=(mtime_ns, mtime_ns))
+            in_template = rel in baseline and _in_template(baseline[rel])
+            restored[rel] = (os.lstat(path).st_size, mtime_ns, digest, ORIGIN_RESTORED, in_template)
+
+        for rel, target in manifest['symlinks'].items():
+            path = os.path.join(workspace, rel)
+            _remove_path(path)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.symlink(target, path)
+
+        return restored
+
+    def maybe_collect_garbage(self):
+        """Run collect_garbage at most once per GC_INTERVAL, skipping if another thread is already at it"""
+        if time.time() - self._last_gc < GC_INTERVAL or not self._gc_lock.acquire(blocking=False):
+            return
+        try:
+            self._last_gc = time.time()
+            expired, swept = self.collect_garbage()
+            if expired or swept:
+                logger.info(f"Snapshot store cleanup: {expired} expired snapshots, {swept} unreferenced blobs removed")
+        except OSError as e:
+            logger.error(f"Snapshot store cleanup failed: {e}")
+        finally:
+            self._gc_lock.release()
+
+    def collect_garbage(self, now=None):
+        """Expire old manifests, then sweep blobs no manifest refers to. Returns (expired, swept)."""
+        now = time.time() if now is None else now
+        expired = 0
+        live = set()
+        for entry in os.scandir(self.manifests_dir):
+            if not entry.name.endswith('.json'):
+                continue
+            try:
+                if entry.stat().st_mtime < now - self.retention_days * 86400:
+                    os.unlink(entry.path)
+                    expired += 1
+                    continue
+                with open(entry.path) as f:
+                    manifest = json.load(f)
+            except FileNotFoundError:
+                continue
+            except ValueError as e:
+                # Keep it, and everything it might reference, for someone to look at
+                logger.error(f"Unreadable snapshot manifest {entry.name}, skipping cleanup: {e}")
+                return expired, 0
+            live.update(digest for digest, _, _ in manifest.get('files', {}).values())
+
+        swept = 0
+        cutoff = now - GC_GRACE_SECONDS
+        for prefix in os.scandir(self.objects_dir):
+            if not prefix.is_dir(follow_symlinks=False):
+                continue
+            for blob in os.scandir(prefix.path):
+                # Leftover temporary files from interrupted writes are swept the same way
+                if prefix.name + blob.name in live:
+                    continue
+                try:
+                    if blob.stat(follow_symlinks=False).st_mtime < cutoff:
+                        os.unlink(blob.path)
+                        swept += 1
+                except FileNotFoundError:
+                    continue
+        return expired, swept
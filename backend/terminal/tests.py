@@ -1,3 +1,1418 @@
-from django.test import TestCase
+import asyncio
+import io
+import json
+import os
+import pty
+import re
+import shutil
+import socket
+import ssl
+import subprocess
+import tarfile
+import tempfile
+import threading
+import time
+import zlib
+from unittest import mock
+
+from channels.testing import WebsocketCommunicator
+from django.test import SimpleTestCase, override_settings
+
+from . import audit, broadcast, buildcache, completion, compression, handoff, heartbeat, mirror, profiler, scrollback, sessions, snapshots, tracing, transfer
+from .bench import replay
+from .consumers import ObserverConsumer, TerminalConsumer
+from .ptytrace import Trace
+
+
+def _tar(*members):
+    """An in-memory tar stream of (name, data) files; data=None makes a directory"""
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode='w') as tar:
+        for name, data in members:
+            info = tarfile.TarInfo(name)
+            if data is None:
+                info.type = tarfile.DIRTYPE
+                tar.addfile(info)
+            else:
+                info.size = len(data)
+                tar.addfile(info, io.BytesIO(data))
+    buffer.seek(0)
+    return buffer
+
+
+class WorkspaceImportTests(SimpleTestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, True)
+        self.workspace = os.path.join(self.root, 'workspace')
+        os.mkdir(self.workspace)
+
+    def extract(self, stream, max_file_size=1024, max_total_size=4096):
+        return transfer.extract_workspace_archive(stream, self.workspace, max_file_size, max_total_size)
+
+    def test_extracts_files_and_directories(self):
+        files, size = self.extract(_tar(('docs', None), ('docs/a.txt', b'hello'), ('b.txt', b'!')))
+        self.assertEqual((files, size), (2, 6))
+        with open(os.path.join(self.workspace, 'docs', 'a.txt'), 'rb') as f:
+            self.assertEqual(f.read(), b'hello')
+
+    def test_rejects_parent_directory_paths(self):
+        for name in ('../escape.txt', 'docs/../../escape.txt', '..'):
+            with self.assertRaises(transfer.WorkspaceTransferError):
+                self.extract(_tar((name, b'x')))
+        self.assertFalse(os.path.exists(os.path.join(self.root, 'escape.txt')))
+
+    def test_absolute_paths_stay_inside_the_workspace(self):
+        self.extract(_tar(('/etc/passwd-copy', b'x')))
+        self.assertTrue(os.path.isfile(os.path.join(self.workspace, 'etc', 'passwd-copy')))
+
+    def test_rejects_writes_through_a_planted_symlink(self):
+        outside = os.path.join(self.root, 'outside')
+        os.mkdir(outside)
+        os.symlink(outside, os.path.join(self.workspace, 'link'))
+        with self.assertRaises(transfer.WorkspaceTransferError):
+            self.extract(_tar(('link/owned.txt', b'x')))
+        self.assertEqual(os.listdir(outside), [])
+
+    def test_skips_links_in_the_archive(self):
+        buffer = io.BytesIO()
+        with tarfile.open(fileobj=buffer, mode='w') as tar:
+            info = tarfile.TarInfo('passwd')
+            info.type = tarfile.SYMTYPE
+            info.linkname = '/etc/passwd'
+            tar.addfile(info)
+        buffer.seek(0)
+        self.assertEqual(self.extract(buffer), (0, 0))
+        self.assertFalse(os.path.lexists(os.path.join(self.workspace, 'passwd')))
+
+    def test_enforces_the_file_size_limit(self):
+        with self.assertRaises(transfer.WorkspaceTransferError):
+            self.extract(_tar(('big.bin', b'x' * 1025)))
+        self.assertFalse(os.path.exists(os.path.join(self.workspace, 'big.bin')))
+
+    def test_enforces_the_total_size_limit(self):
+        members = [(f'part{i}.bin', b'x' * 1000) for i in range(5)]
+        with self.assertRaises(transfer.WorkspaceTransferError):
+            self.extract(_tar(*members))
+        self.assertEqual(len(os.listdir(self.workspace)), 4)
+
+    def test_rejects_garbage(self):
+        with self.assertRaises(transfer.WorkspaceTransferError):
+            self.extract(io.BytesIO(b'not a tar archive' * 100))
+
+
+class WorkspaceExportTests(SimpleTestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, True)
+        self.workspace = os.path.join(self.root, 'workspace')
+        os.makedirs(os.path.join(self.workspace, 'projects'))
+        with open(os.path.join(self.workspace, 'projects', 'hello.c'), 'w') as f:
+            f.write('int main(void) { return 0; }\n')
+        self.secret = os.path.join(self.root, 'secret')
+        with open(self.secret, 'w') as f:
+            f.write('host secret\n')
+
+    def export(self, fmt='tar'):
+        data = b''.join(transfer.iter_workspace_archive(self.workspace, fmt))
+        with tarfile.open(fileobj=io.BytesIO(data), mode='r:*') as tar:
+            return {
+                m.name: (m.linkname if m.issym() else tar.extractfile(m).read() if m.isfile() else None)
+                for m in tar.getmembers()
+            }
+
+    def test_exports_files_and_directories(self):
+        for fmt in transfer.EXPORT_FORMATS:
+            self.assertEqual(self.export(fmt), {
+                'projects': None,
+                'projects/hello.c': b'int main(void) { return 0; }\n',
+            })
+
+    def test_symlinks_are_exported_as_links_not_targets(self):
+        os.symlink(self.secret, os.path.join(self.workspace, 'secret'))
+        os.symlink(self.root, os.path.join(self.workspace, 'host'))
+        members = self.export()
+        self.assertEqual(members['secret'], self.secret)
+        self.assertEqual(members['host'], self.root)
+        self.assertNotIn('host/secret', members)
+
+    def test_file_swapped_for_a_symlink_is_not_followed(self):
+        path = os.path.join(self.workspace, 'notes.txt')
+        with open(path, 'w') as f:
+            f.write('x' * 12)
+        root_fd = os.open(self.workspace, os.O_RDONLY)
+        self.addCleanup(os.close, root_fd)
+        _, st = transfer._tar_header('notes.txt', 'notes.txt', root_fd)
+        # The sandbox replaces the file between the header and the read
+        os.unlink(path)
+        os.symlink(self.secret, path)
+        data = b''.join(transfer._iter_file_data('notes.txt', root_fd, st))
+        self.assertEqual(data, tarfile.NUL * tarfile.BLOCKSIZE)
+
+
+class SnapshotRestoreTests(SimpleTestCase):
+    identity = 'a' * 32
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, True)
+        self.store = snapshots.SnapshotStore(os.path.join(self.root, 'store'))
+
+    def template(self, name):
+        workspace = os.path.join(self.root, name)
+        os.makedirs(os.path.join(workspace, 'projects'))
+        for rel, data in (('welcome.txt', 'welcome\n'), ('notes.txt', 'notes\n'), ('projects/hello.c', 'int x;\n')):
+            with open(os.path.join(workspace, rel), 'w') as f:
+                f.write(data)
+        return workspace, snapshots.scan_template(workspace)
+
+    def read(self, path):
+        with open(path) as f:
+            return f.read()
+
+    def test_restore_replays_changes_on_a_fresh_template(self):
+        workspace, baseline = self.template('first')
+        with open(os.path.join(workspace, 'notes.txt'), 'w') as f:
+            f.write('my own notes, longer than before\n')
+        os.makedirs(os.path.join(workspace, 'work', 'empty'))
+        with open(os.path.join(workspace, 'work', 'script.sh'), 'w') as f:
+            f.write('echo hi\n')
+        os.chmod(os.path.join(workspace, 'work', 'script.sh'), 0o755)
+        os.symlink('notes.txt', os.path.join(workspace, 'latest'))
+        os.unlink(os.path.join(workspace, 'welcome.txt'))
+        shutil.rmtree(os.path.join(workspace, 'projects'))
+
+        changed, hashed = self.store.snapshot(self.identity, workspace, baseline)
+        self.assertEqual(changed, 2)
+        self.assertGreater(hashed, 0)
+
+        fresh, fresh_baseline = self.template('second')
+        restored = self.store.restore(self.identity, fresh, fresh_baseline)
+        self.assertEqual(self.read(os.path.join(fresh, 'notes.txt')), 'my own notes, longer than before\n')
+        self.assertEqual(self.read(os.path.join(fresh, 'work', 'script.sh')), 'echo hi\n')
+        self.assertEqual(os.stat(os.path.join(fresh, 'work', 'script.sh')).st_mode & 0o777, 0o755)
+        self.assertTrue(os.path.isdir(os.path.join(fresh, 'work', 'empty')))
+        self.assertEqual(os.readlink(os.path.join(fresh, 'latest')), 'notes.txt')
+        self.assertFalse(os.path.exists(os.path.join(fresh, 'welcome.txt')))
+        self.assertFalse(os.path.exists(os.path.join(fresh, 'projects')))
+        self.assertEqual(restored['notes.txt'][3], snapshots.ORIGIN_RESTORED)
+
+        # Nothing changed since the restore, so the next snapshot hashes nothing
+        self.assertEqual(self.store.snapshot(self.identity, fresh, restored), (2, 0))
+
+    def test_untouched_template_stores_nothing(self):
+        workspace, baseline = self.template('first')
+        self.assertEqual(self.store.snapshot(self.identity, workspace, baseline), (0, 0))
+
+    def test_restore_without_a_snapshot(self):
+        workspace, baseline = self.template('first')
+        self.assertIsNone(self.store.restore('b' * 32, workspace, baseline))
+
+    def test_deleting_a_previously_restored_template_file(self):
+        workspace, baseline = self.template('first')
+        with open(os.path.join(workspace, 'notes.txt'), 'w') as f:
+            f.write('edited\n')
+        self.store.snapshot(self.identity, workspace, baseline)
+
+        second, second_baseline = self.template('second')
+        restored = self.store.restore(self.identity, second, second_baseline)
+        self.assertEqual(self.read(os.path.join(second, 'notes.txt')), 'edited\n')
+        os.unlink(os.path.join(second, 'notes.txt'))
+        self.store.snapshot(self.identity, second, restored)
+
+        third, third_baseline = self.template('third')
+        self.store.restore(self.identity, third, third_baseline)
+        self.assertFalse(os.path.exists(os.path.join(third, 'notes.txt')))
+
+    def test_expired_snapshots_and_unreferenced_blobs_are_collected(self):
+        workspace, baseline = self.template('first')
+        with open(os.path.join(workspace, 'notes.txt'), 'w') as f:
+            f.write('first version\n')
+        self.store.snapshot(self.identity, workspace, baseline)
+        with open(os.path.join(workspace, 'notes.txt'), 'w') as f:
+            f.write('second version\n')
+        self.store.snapshot(self.identity, workspace, baseline)
+        other = 'b' * 32
+        self.store.snapshot(other, workspace, baseline)
+
+        blobs = lambda: sorted(  # noqa: E731
+            os.path.join(d, f) for d in os.listdir(self.store.objects_dir)
+            for f in os.listdir(os.path.join(self.store.objects_dir, d))
+        )
+        self.assertEqual(len(blobs()), 2)
+        # Young blobs survive even when unreferenced
+        self.assertEqual(self.store.collect_garbage(), (0, 0))
+
+        later = time.time() + snapshots.GC_GRACE_SECONDS + 1
+        self.assertEqual(self.store.collect_garbage(now=later), (0, 1))
+        self.assertEqual(len(blobs()), 1)
+
+        # Let the other identity's snapshot expire; the blob it shares stays
+        last_visit = time.time() - self.store.retention_days * 86400 - 60
+        os.utime(self.store._manifest_path(other), (last_visit, last_visit))
+        self.assertEqual(self.store.collect_garbage(), (1, 0))
+        self.assertIsNone(self.store.load_manifest(other))
+
+        fresh, fresh_baseline = self.template('second')
+        self.store.restore(self.identity, fresh, fresh_baseline)
+        self.assertEqual(self.read(os.path.join(fresh, 'notes.txt')), 'second version\n')
+
+
+@override_settings(TERMINAL_SCROLLBACK_DIR='', TERMINAL_AUDIT_DB='', TERMINAL_TRACE_EXPORT='')
+class LiveSessionTestCase(SimpleTestCase):
+    """Drives real (development mode, unsandboxed) shells through TerminalConsumer"""
+
+    def setUp(self):
+        patcher = mock.patch.dict(os.environ, {'DJANGO_DEVELOPMENT': 'True'})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def connect(self, session, query='', ready=lambda m: 'Welcome' in m.get('data', '')):
+        """An open communicator whose shell is ready; its tokens are in communicator.session_info"""
+        communicator = WebsocketCommunicator(TerminalConsumer.as_asgi(), f"/ws/terminal/?session={session}{query}")
+        connected, _ = await communicator.connect(timeout=10)
+        self.assertTrue(connected)
+        messages = await self.receive_until(communicator, ready)
+        communicator.session_info = next(m for m in messages if m.get('type') == 'session')
+        return communicator
+
+    async def receive_until(self, communicator, predicate, timeout=10):
+        """Messages up to and including the first one predicate accepts"""
+        received = []
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self.fail(f"Expected message never arrived; got {received}")
+            try:
+                message = await communicator.receive_json_from(timeout=remaining)
+            except asyncio.TimeoutError:
+                continue
+            received.append(message)
+            if predicate(message):
+                return received
+
+
+class ChannelMultiplexTests(LiveSessionTestCase):
+    def output_on(self, channel, text):
+        return lambda m: m.get('type') == 'output' and m.get('channel') == channel and text in m.get('data', '')
+
+    async def test_channels_are_separate_shells_in_one_workspace(self):
+        communicator = await self.connect('mux-test')
+        try:
+            await communicator.send_json_to({"type": "open", "channel": "side"})
+            await self.receive_until(communicator, lambda m: m == {"type": "opened", "channel": "side"})
+
+            # Shell state such as the working directory is per channel, files are shared
+            await communicator.send_json_to({"input": "cd projects && touch from-main.txt"})
+            await communicator.send_json_to({"input": "echo side-cwd=$(basename $PWD) && ls projects", "channel": "side"})
+            messages = await self.receive_until(communicator, self.output_on('side', 'from-main.txt'))
+            side = ''.join(m['data'] for m in messages if m.get('channel') == 'side')
+            self.assertNotIn('side-cwd=projects', side)
+
+            await communicator.send_json_to({"input": "echo main-cwd=$(basename $PWD)"})
+            messages = await self.receive_until(communicator, lambda m: 'main-cwd=projects' in m.get('data', ''))
+            self.assertNotIn('channel', messages[-1])
+
+            await communicator.send_json_to({"type": "close", "channel": "side"})
+            await self.receive_until(communicator, lambda m: m == {"type": "closed", "channel": "side"})
+            await communicator.send_json_to({"input": "echo hi", "channel": "side"})
+            await self.receive_until(communicator, lambda m: m.get('type') == 'error' and m.get('channel') == 'side')
+        finally:
+            await communicator.disconnect()
+
+    async def test_channel_limit(self):
+        communicator = await self.connect('mux-limit-test')
+        try:
+            with self.settings(TERMINAL_MAX_CHANNELS=2):
+                await communicator.send_json_to({"type": "open", "channel": "two"})
+                await self.receive_until(communicator, lambda m: m.get('type') == 'opened')
+                await communicator.send_json_to({"type": "open", "channel": "three"})
+                messages = await self.receive_until(communicator, lambda m: m.get('type') == 'error')
+                self.assertEqual(messages[-1]["channel"], 'three')
+        finally:
+            await communicator.disconnect()
+
+
+class BroadcastTests(SimpleTestCase):
+    def setUp(self):
+        self.broadcaster = broadcast.open_session('broadcast-test')
+        self.addCleanup(broadcast.close_session, self.broadcaster)
+
+    async def drain(self, observer):
+        frames = []
+        while not observer.queue.empty():
+            frames.append(await observer.get())
+        return frames
+
+    async def test_frames_are_shared_and_slow_observers_drop(self):
+        fast = self.broadcaster.subscribe(10)
+        slow = self.broadcaster.subscribe(2)
+        frames = [f'{{"type": "output", "data": "{i}"}}' for i in range(5)]
+        for i, frame in enumerate(frames):
+            self.broadcaster.publish(frame, str(i))
+
+        received = await self.drain(fast)
+        self.assertEqual(received, frames)
+        # Encoded once: every observer gets the very same string
+        self.assertTrue(all(a is b for a, b in zip(received, frames)))
+        self.assertEqual(fast.dropped, 0)
+
+        self.assertEqual(slow.dropped, 3)
+        self.assertEqual(slow.queued_bytes, len(frames[0]) + len(frames[1]))
+        self.assertEqual(await self.drain(slow), frames[:2])
+        self.assertEqual(slow.queued_bytes, 0)
+
+    async def test_end_reaches_a_full_queue(self):
+        observer = self.broadcaster.subscribe(1)
+        self.broadcaster.publish('frame', 'text')
+        broadcast.close_session(self.broadcaster)
+        self.assertEqual(await self.drain(observer), [None])
+        self.assertEqual(observer.dropped, 1)
+        self.assertIsNone(broadcast.get_broadcaster('broadcast-test'))
+
+    def test_thumbnail_strips_escapes_and_is_rate_limited(self):
+        self.broadcaster.publish('f', '\x1b[01;34mprojects\x1b[0m\r\n')
+        self.broadcaster.publish('f', '$ ' + 'x' * 200)
+        self.assertEqual(self.broadcaster.thumbnail(0), 'projects\n$ ' + 'x' * (broadcast.THUMBNAIL_COLUMNS - 2))
+        self.broadcaster.publish('f', '\nnewer')
+        self.assertNotIn('newer', self.broadcaster.thumbnail(60))
+
+    def test_tail_is_bounded(self):
+        for _ in range(broadcast.TAIL_BYTES // 100 + 10):
+            self.broadcaster.publish('f', 'y' * 100)
+        self.assertLessEqual(len(self.broadcaster.tail()), broadcast.TAIL_BYTES)
+
+    @override_settings(TERMINAL_INSTRUCTOR_TOKEN='instructor-secret')
+    async def test_dashboard_requires_the_instructor_token(self):
+        self.broadcaster.publish('f', 'hello from the student')
+        response = await self.async_client.get('/dashboard/')
+        self.assertEqual(response.status_code, 403)
+        response = await self.async_client.get('/dashboard/', headers={'Authorization': 'Bearer instructor-secret'})
+        self.assertEqual(response.status_code, 200)
+        session = next(s for s in response.json()["sessions"] if s["session"] == 'broadcast-test')
+        self.assertEqual(session["thumbnail"], 'hello from the student')
+
+
+@override_settings(TERMINAL_INSTRUCTOR_TOKEN='instructor-secret')
+class ObserverTests(LiveSessionTestCase):
+    async def test_observer_sees_the_students_output(self):
+        student = await self.connect('observed-test')
+        observer = WebsocketCommunicator(ObserverConsumer.as_asgi(), "/ws/terminal/observe/?session=observed-test&token=instructor-secret")
+        try:
+            connected, _ = await observer.connect(timeout=10)
+            self.assertTrue(connected)
+            # Catch-up from the tail first, then live frames
+            await self.receive_until(observer, lambda m: m.get('type') == 'output')
+            await student.send_json_to({"input": "echo observed-$((40+2))"})
+            await self.receive_until(observer, lambda m: 'observed-42' in m.get('data', ''))
+            # Observers are read-only
+            await observer.send_json_to({"input": "touch observer-was-here"})
+            await student.send_json_to({"input": "ls"})
+            messages = await self.receive_until(student, lambda m: 'welcome.txt' in m.get('data', ''))
+            self.assertNotIn('observer-was-here', ''.join(m.get('data', '') for m in messages))
+        finally:
+            await observer.disconnect()
+            await student.disconnect()
+
+    async def test_observer_needs_the_token(self):
+        observer = WebsocketCommunicator(ObserverConsumer.as_asgi(), "/ws/terminal/observe/?session=any&token=wrong")
+        connected, code = await observer.connect(timeout=10)
+        self.assertFalse(connected)
+        self.assertEqual(code, 4003)
+
+
+class PrefixIndexTests(SimpleTestCase):
+    def test_queries_and_incremental_updates(self):
+        index = completion.PrefixIndex(['gcc', 'git', 'grep', 'ls', 'git'])
+        self.assertEqual(index.query('g'), ['gcc', 'git', 'grep'])
+        self.assertEqual(index.query('g', limit=2), ['gcc', 'git'])
+        self.assertEqual(index.query('x'), [])
+
+        generation = index.generation
+        index.add('gzip')
+        index.add('gzip')
+        index.discard('missing')
+        self.assertEqual(index.generation, generation + 1)
+        index.update(['docs/', 'docs/a.txt', 'docs/b/', 'docs/b/c.txt', 'ls'])
+        index.discard_prefix('docs/b/')
+        self.assertEqual(index.query('docs'), ['docs/', 'docs/a.txt'])
+        index.discard('gcc')
+        self.assertEqual(index.query('g'), ['git', 'grep', 'gzip'])
+
+    def test_cache_expires_and_follows_the_generation(self):
+        cache = completion.CompletionCache(ttl=60, size=2)
+        cache.put(('command', 'g'), 1, ['git'])
+        self.assertEqual(cache.get(('command', 'g'), 1), ['git'])
+        self.assertIsNone(cache.get(('command', 'g'), 2))
+        cache.put(('command', 'l'), 1, ['ls'])
+        cache.put(('command', 'p'), 1, ['pwd'])
+        self.assertIsNone(cache.get(('command', 'g'), 1))
+        with mock.patch.object(completion.time, 'monotonic', return_value=time.monotonic() + 61):
+            self.assertIsNone(cache.get(('command', 'p'), 1))
+
+
+class SessionCompleterTests(SimpleTestCase):
+    def setUp(self):
+        self.workspace = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.workspace, True)
+        os.makedirs(os.path.join(self.workspace, 'projects'))
+        for name in ('projects/hello.c', 'projects/hello.py', 'welcome.txt'):
+            open(os.path.join(self.workspace, name), 'w').close()
+
+    async def wait_for(self, completer, prefix, expected, timeout=10):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            completer.cache = completion.CompletionCache()
+            matches, partial = completer.complete('path', prefix)
+            if not partial and expected(matches):
+                return matches
+            await asyncio.sleep(0.05)
+        self.fail(f"Completions for {prefix!r} never matched; last got {matches}")
+
+    async def test_workspace_paths_follow_the_filesystem(self):
+        completer = completion.SessionCompleter(self.workspace)
+        try:
+            matches = await self.wait_for(completer, 'projects/hello', lambda m: m)
+            self.assertEqual(matches, ['projects/hello.c', 'projects/hello.py'])
+
+            if completion.watchfiles is None:
+                return
+            open(os.path.join(self.workspace, 'projects', 'hello.sh'), 'w').close()
+            os.unlink(os.path.join(self.workspace, 'projects', 'hello.py'))
+            await self.wait_for(completer, 'projects/hello', lambda m: m == ['projects/hello.c', 'projects/hello.sh'])
+
+            # A directory moved in from elsewhere arrives as a single event
+            outside = tempfile.mkdtemp()
+            os.makedirs(os.path.join(outside, 'lesson', 'part1'))
+            open(os.path.join(outside, 'lesson', 'part1', 'task.md'), 'w').close()
+            os.rename(os.path.join(outside, 'lesson'), os.path.join(self.workspace, 'lesson'))
+            os.rmdir(outside)
+            await self.wait_for(completer, 'lesson/', lambda m: 'lesson/part1/task.md' in m)
+        finally:
+            completer.close()
+
+    def test_commands_come_from_the_sandbox_path(self):
+        matches, partial = completion.SessionCompleter(self.workspace).complete('command', 'ec')
+        self.assertFalse(partial)
+        self.assertIn('echo', matches)
+
+
+@override_settings(TERMINAL_SCROLLBACK_DIR='')
+class HandoffClaimTests(SimpleTestCase):
+    def adopted(self, session_id, resume_token, expires=None):
+        """An inherited session with one real shell, as adopt_from_previous_worker builds it"""
+        workspace = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, workspace, True)
+        master_fd, slave_fd = pty.openpty()
+        proc = subprocess.Popen(['sleep', '60'], stdin=slave_fd, stdout=slave_fd, stderr=slave_fd, start_new_session=True)
+        os.close(slave_fd)
+        self.addCleanup(proc.wait)
+        self.addCleanup(proc.kill)
+        channel = handoff.AdoptedChannel('main', master_fd, handoff.AdoptedProcess(proc.pid, os.pidfd_open(proc.pid)))
+        meta = {'session_id': session_id, 'workspace': workspace, 'sandbox_name': f'learnlinux-{session_id}', 'identity': None,
+                'baseline': None, 'resume_token': resume_token}
+        session = handoff.AdoptedSession(meta, [channel], expires or time.monotonic() + 60)
+        with handoff._adopted_lock:
+            handoff._adopted[session_id] = session
+        self.addCleanup(handoff._adopted.pop, session_id, None)
+        return session, proc
+
+    def test_claim_needs_the_resume_token(self):
+        session, _ = self.adopted('claim-test', 'right-token')
+        self.assertIsNone(handoff.claim('other-session', 'right-token'))
+        for token in (None, '', 'wrong-token'):
+            with self.assertRaises(handoff.ResumeRefused):
+                handoff.claim('claim-test', token)
+        # A refused attempt leaves the session for its owner
+        self.assertIs(handoff.claim('claim-test', 'right-token'), session)
+        self.assertIsNone(handoff.claim('claim-test', 'right-token'))
+        session.discard()
+
+    def test_sessions_without_a_token_cannot_be_claimed(self):
+        session, _ = self.adopted('tokenless-test', None)
+        with self.assertRaises(handoff.ResumeRefused):
+            handoff.claim('tokenless-test', 'anything')
+        session.discard()
+
+    def test_unclaimed_sessions_expire(self):
+        session, proc = self.adopted('expired-test', 'token', expires=time.monotonic() - 1)
+        kept, kept_proc = self.adopted('pending-test', 'token')
+        handoff._expire_unclaimed()
+        self.assertEqual(proc.wait(timeout=5), -9)
+        self.assertFalse(os.path.exists(session.workspace))
+        self.assertIsNone(handoff.claim('expired-test', 'token'))
+        self.assertIsNone(kept_proc.poll())
+        self.assertIs(handoff.claim('pending-test', 'token'), kept)
+        kept.discard()
+
+    def test_descriptors_cross_the_wire(self):
+        left, right = socket.socketpair()
+        self.addCleanup(left.close)
+        self.addCleanup(right.close)
+        read_fd, write_fd = os.pipe()
+        handoff._send_message(left, {'session_id': 's', 'fd_count': 1}, [write_fd])
+        os.close(write_fd)
+        payload, fds = handoff._recv_message(right)
+        self.assertEqual(payload['session_id'], 's')
+        os.write(fds[0], b'through the copy')
+        os.close(fds[0])
+        self.assertEqual(os.read(read_fd, 100), b'through the copy')
+        os.close(read_fd)
+
+
+class RollingRestartTests(LiveSessionTestCase):
+    async def shell_pid(self, communicator):
+        await communicator.send_json_to({"input": "echo shell-pid=$$"})
+        messages = await self.receive_until(communicator, lambda m: re.search(r'shell-pid=\d+', m.get('data', '')))
+        return re.search(r'shell-pid=(\d+)', messages[-1]['data']).group(1)
+
+    async def test_reconnect_reclaims_the_same_shell(self):
+        path = os.path.join(tempfile.mkdtemp(), 'handoff.sock')
+        self.addCleanup(shutil.rmtree, os.path.dirname(path), True)
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(path)
+        server.listen(1)
+        self.addCleanup(server.close)
+
+        student = await self.connect('restart-test')
+        pid = await self.shell_pid(student)
+        resume_token = student.session_info['resume_token']
+
+        def serve():
+            conn, _ = server.accept()
+            with conn:
+                handoff._serve_handoff(conn)
+
+        loop = asyncio.get_running_loop()
+        with mock.patch.object(handoff.os, 'kill') as kill:
+            serving = loop.run_in_executor(None, serve)
+            adopted = await loop.run_in_executor(None, handoff.adopt_from_previous_worker, path)
+            await serving
+        self.assertEqual(adopted, 1)
+        kill.assert_called_once()
+        closed = await student.receive_output(timeout=5)
+        self.assertEqual(closed, {"type": "websocket.close", "code": handoff.HANDOFF_CLOSE_CODE})
+        await student.disconnect()
+
+        # Knowing the session id is not enough to take the shell
+        intruder = WebsocketCommunicator(TerminalConsumer.as_asgi(), "/ws/terminal/?session=restart-test&resume=guess")
+        connected, code = await intruder.connect(timeout=10)
+        self.assertEqual((connected, code), (False, 4003))
+
+        resumed = await self.connect(
+            'restart-test', f'&resume={resume_token}', ready=lambda m: 'Reconnected' in m.get('data', ''))
+        try:
+            self.assertEqual(await self.shell_pid(resumed), pid)
+            self.assertNotEqual(resumed.session_info['resume_token'], resume_token)
+        finally:
+            await resumed.disconnect()
+
+
+def _profiled_busy_loop(stop):
+    """Recognisable frame for the sampler to find"""
+    while not stop.is_set():
+        sum(range(1000))
+
+
+class ProfilerTests(SimpleTestCase):
+    async def test_samples_threads_and_measures_loop_lag(self):
+        stop = threading.Event()
+        worker = threading.Thread(target=_profiled_busy_loop, args=(stop,), name='busy-worker')
+        worker.start()
+        try:
+            loop = asyncio.get_running_loop()
+            # Stall the event loop for a while partway through the profile
+            loop.call_later(0.2, time.sleep, 0.3)
+            result = await profiler.profile(0.8, interval=0.005)
+        finally:
+            stop.set()
+            worker.join()
+
+        self.assertGreater(result["samples"], 10)
+        self.assertGreaterEqual(result["loop_lag_ms"]["max"], 200)
+        busy = [line for line in result["stacks"].splitlines() if line.startswith('busy-worker;')]
+        self.assertTrue(busy)
+        self.assertIn('tests.py:_profiled_busy_loop', busy[0])
+        self.assertRegex(busy[0], r' \d+$')
+
+    async def test_one_profile_at_a_time(self):
+        running = asyncio.ensure_future(profiler.profile(0.3))
+        await asyncio.sleep(0.05)
+        with self.assertRaises(profiler.ProfilerBusy):
+            await profiler.profile(0.1)
+        await running
+        await profiler.profile(0.05)
+
+    @override_settings(TERMINAL_ADMIN_TOKEN='admin-secret')
+    async def test_endpoint_requires_the_admin_token(self):
+        response = await self.async_client.get('/ops/profile/?seconds=0.1')
+        self.assertEqual(response.status_code, 403)
+        response = await self.async_client.get(
+            '/ops/profile/?seconds=0.1&format=collapsed', headers={'Authorization': 'Bearer admin-secret'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/plain')
+        self.assertRegex(response.content.decode(), r'(?m)^MainThread;\S.* \d+$')
+
+
+@override_settings(TERMINAL_HEARTBEAT_INTERVAL=0.1, TERMINAL_HEARTBEAT_TIMEOUT=0.5, TERMINAL_ADMIN_TOKEN='admin-secret')
+class HeartbeatTests(LiveSessionTestCase):
+    async def test_silent_session_is_reaped(self):
+        reaped_before = heartbeat.stats()["reaped_total"]
+        communicator = await self.connect('silent-test')
+        workspace = sessions.get_session('silent-test').workspace
+        # Never answer the pings, like a laptop whose lid closed behind a NAT
+        pings = 0
+        while True:
+            message = await communicator.receive_output(timeout=5)
+            if message["type"] == "websocket.close":
+                break
+            pings += '"ping"' in message.get("text", "")
+        self.assertGreater(pings, 0)
+        self.assertEqual(heartbeat.stats()["reaped_total"], reaped_before + 1)
+        self.assertFalse(os.path.exists(workspace))
+        self.assertIsNone(sessions.get_session('silent-test'))
+        await communicator.wait()
+
+        response = await self.async_client.get('/ops/stats/', headers={'Authorization': 'Bearer admin-secret'})
+        self.assertEqual(response.json()["heartbeat"]["reaped_total"], reaped_before + 1)
+        self.assertEqual((await self.async_client.get('/ops/stats/')).status_code, 403)
+
+    async def test_answering_pings_keeps_the_session(self):
+        communicator = await self.connect('pong-test')
+        try:
+            deadline = time.monotonic() + 1.5
+            pings = 0
+            while time.monotonic() < deadline:
+                try:
+                    message = await communicator.receive_json_from(timeout=0.2)
+                except asyncio.TimeoutError:
+                    continue
+                if message.get("type") == "ping":
+                    pings += 1
+                    await communicator.send_json_to({"type": "pong", "ts": message["ts"]})
+            self.assertGreater(pings, 3)
+            await communicator.send_json_to({"input": "echo still-$((1+1))"})
+            await self.receive_until(communicator, lambda m: 'still-2' in m.get('data', ''))
+        finally:
+            await communicator.disconnect()
+
+
+class ShellSpawnTests(SimpleTestCase):
+    def setUp(self):
+        self.consumer = TerminalConsumer()
+        self.consumer.workspace = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.consumer.workspace, True)
+
+    async def spawn(self, script):
+        master_fd, proc, output = await self.consumer._start_pty_process(['/bin/sh', '-c', script], self.consumer.workspace)
+        self.addCleanup(os.close, master_fd)
+        self.addCleanup(proc.wait)
+        self.addCleanup(proc.kill)
+        return proc, output
+
+    async def test_ready_as_soon_as_the_prompt_appears(self):
+        started = time.monotonic()
+        _, output = await self.spawn('printf "starting up\\n"; sleep 0.2; printf "\\$ "; exec sleep 30')
+        self.assertLess(time.monotonic() - started, 2)
+        self.assertTrue(output.endswith(b'$ '))
+        self.assertIn(b'starting up', output)
+
+    @override_settings(TERMINAL_SPAWN_TIMEOUT=0.3)
+    async def test_missing_prompt_times_out_but_keeps_the_shell(self):
+        started = time.monotonic()
+        proc, output = await self.spawn('printf "no prompt here"; exec sleep 30')
+        self.assertGreaterEqual(time.monotonic() - started, 0.3)
+        self.assertEqual(output, b'no prompt here')
+        self.assertIsNone(proc.poll())
+
+    async def test_shell_that_dies_during_startup(self):
+        with self.assertRaisesRegex(RuntimeError, 'boom'):
+            await self.consumer._start_pty_process(['/bin/sh', '-c', 'echo boom; exit 3'], self.consumer.workspace)
+
+    async def test_child_runs_in_its_own_session_with_the_sandbox_environment(self):
+        _, output = await self.spawn('echo "sid=$(cut -d" " -f6 /proc/$$/stat) pid=$$ home=$HOME"; printf "\\$ "; exec sleep 30')
+        fields = dict(part.split('=', 1) for part in output.decode().split('\r\n')[0].split())
+        self.assertEqual(fields['sid'], fields['pid'])
+        self.assertEqual(fields['home'], self.consumer.workspace)
+
+
+class OutputBenchTests(SimpleTestCase):
+    def test_results_are_relative_to_a_baseline_from_the_same_run(self):
+        trace = Trace('tiny', [(i * 0.01, f"line {i}\r\n".encode()) for i in range(200)])
+        result = replay.run_trace(trace)
+        self.assertEqual(result['reads'], 200)
+        self.assertGreater(result['speed_ratio'], 0)
+        self.assertGreater(result['p99_ratio'], 0)
+
+    def test_thresholds_apply_per_trace_over_the_default(self):
+        thresholds = {"default": {"max_p99_ratio": 10}, "tiny": {"min_speed_ratio": 0.5}}
+        ok = {"name": "tiny", "speed_ratio": 0.6, "p99_ratio": 9}
+        self.assertEqual(replay.check_thresholds(ok, thresholds), [])
+        slow = {"name": "tiny", "speed_ratio": 0.2, "p99_ratio": 12}
+        self.assertEqual(replay.check_thresholds(slow, thresholds), [
+            "tiny: p99_ratio 12 > 10", "tiny: speed_ratio 0.2 < 0.5",
+        ])
+        self.assertEqual(replay.check_thresholds(dict(slow, name="other"), thresholds), ["other: p99_ratio 12 > 10"])
+
+    def test_shipped_thresholds_are_machine_independent(self):
+        with open(os.path.join(os.path.dirname(replay.__file__), 'thresholds.json')) as f:
+            thresholds = json.load(f)
+        for limits in thresholds.values():
+            for key in limits:
+                self.assertTrue(key.endswith(('_ratio', '_per_kb')), key)
+
+
+class AuditStoreSearchTests(SimpleTestCase):
+    def setUp(self):
+        self.store = audit.AuditStore(':memory:')
+        self.now = time.time()
+        rows = [
+            (self.now - 7200, 's1', 'alice', None, audit.ACTION_MONITORED, 'r', 'rm -rf old_project'),
+            (self.now - 60, 's1', 'alice', None, audit.ACTION_BLOCKED, 'r', 'sudo rm -rf /'),
+            (self.now - 30, 's2', 'bob', None, audit.ACTION_MONITORED, 'r', 'echo 100%_done'),
+            (self.now - 10, 's2', 'bob', None, audit.ACTION_MONITORED, 'r', 'echo 100 percent done'),
+        ]
+        self.store.insert_many(rows)
+
+    def commands(self, **kwargs):
+        return [row['command'] for row in self.store.search(**kwargs)]
+
+    def test_full_text_matches_substrings_newest_first(self):
+        self.assertEqual(self.commands(text='rm -rf'), ['sudo rm -rf /', 'rm -rf old_project'])
+        self.assertEqual(self.commands(text='d_pro'), ['rm -rf old_project'])
+
+    def test_full_text_respects_the_time_window(self):
+        self.assertEqual(self.commands(text='rm -rf', since=self.now - 3600), ['sudo rm -rf /'])
+
+    def test_short_queries_scan_with_like_and_escape_wildcards(self):
+        self.assertEqual(self.commands(text='%_'), ['echo 100%_done'])
+        self.assertEqual(self.commands(text='rm'), ['sudo rm -rf /', 'rm -rf old_project'])
+
+    def test_filters(self):
+        self.assertEqual(self.commands(identity='bob', text='echo'), ['echo 100 percent done', 'echo 100%_done'])
+        self.assertEqual(self.commands(action=audit.ACTION_BLOCKED), ['sudo rm -rf /'])
+        self.assertEqual(self.commands(session='s1', until=self.now - 3600), ['rm -rf old_project'])
+
+    def test_limit_is_clamped(self):
+        self.assertEqual(len(self.commands(limit=2)), 2)
+        # SQLite reads LIMIT -1 as unlimited; the store must not
+        self.assertEqual(len(self.commands(limit=-1)), 1)
+        self.assertEqual(len(self.commands(limit=0)), 1)
+        self.store.insert_many([(self.now, 's3', None, None, 'monitored', 'r', 'ls')] * (audit.MAX_RESULTS + 5))
+        self.assertEqual(len(self.commands(limit=audit.MAX_RESULTS * 10)), audit.MAX_RESULTS)
+
+
+class AuditLogTests(SimpleTestCase):
+    def setUp(self):
+        self.log = audit.AuditLog(audit.AuditStore(':memory:'), flush_interval=3600)
+
+    def test_events_are_buffered_until_flushed(self):
+        self.log.record('s1', audit.ACTION_BLOCKED, 'r', 'sudo reboot', identity='alice')
+        self.assertEqual(self.log.store.search(), [])
+        self.log.flush()
+        [row] = self.log.store.search()
+        self.assertEqual((row['session'], row['identity'], row['command']), ('s1', 'alice', 'sudo reboot'))
+
+    @override_settings(TERMINAL_ADMIN_TOKEN='admin-secret')
+    def test_search_endpoint_rejects_out_of_range_limits(self):
+        self.log.record('s1', audit.ACTION_MONITORED, 'r', 'ls -la')
+        auth = {'Authorization': 'Bearer admin-secret'}
+        with mock.patch.object(audit, 'get_audit_log', return_value=self.log):
+            self.assertEqual(self.client.get('/ops/audit/', {'limit': 0}, headers=auth).status_code, 400)
+            self.assertEqual(self.client.get('/ops/audit/', {'limit': audit.MAX_RESULTS + 1}, headers=auth).status_code, 400)
+            self.assertEqual(self.client.get('/ops/audit/', {'q': 'ls'}).status_code, 403)
+            response = self.client.get('/ops/audit/', {'q': 'ls'}, headers=auth)
+        self.assertEqual([row['command'] for row in response.json()['results']], ['ls -la'])
+
+
+class CompressionDictionaryTests(SimpleTestCase):
+    frames = [
+        '{"type": "output", "data": "total 12\\r\\ndrwxr-xr-x 2 learner learner 4096 Documents\\r\\n"}',
+        '{"type": "output", "data": "\\u001b[01;34mprojects\\u001b[0m  \\u001b[01;34mDocuments\\u001b[0m\\r\\n$ "}',
+        '{"type": "ping"}',
+        '{"type": "output", "data": "total 12\\r\\ndrwxr-xr-x 2 learner learner 4096 Documents\\r\\n"}',
+    ]
+
+    def inflate(self, compressor_frames, dictionary):
+        inflater = zlib.decompressobj(-15, zdict=dictionary) if dictionary else zlib.decompressobj(-15)
+        stream = b''.join(inflater.decompress(frame) for frame in compressor_frames)
+        return stream.decode('utf-8').split('\n')[:-1]
+
+    def round_trip(self, dictionary):
+        compressor = compression.FrameCompressor(min_size=32, dictionary=dictionary)
+        sent, plain = [], []
+        for frame in self.frames:
+            text, data = compressor.encode(frame)
+            if data is None:
+                plain.append(text)
+            else:
+                sent.append(data)
+        self.assertEqual(plain, ['{"type": "ping"}'])
+        self.assertEqual(self.inflate(sent, dictionary), [f for f in self.frames if len(f) >= 32])
+        return compressor
+
+    def test_round_trip_with_the_shipped_dictionary(self):
+        dictionary = compression.load_dictionary()
+        self.assertTrue(dictionary)
+        self.assertLessEqual(len(dictionary), compression.MAX_DICTIONARY_SIZE)
+        compressor = self.round_trip(dictionary)
+        self.assertEqual(compressor.stats()["dictionary"], compression.dictionary_id(dictionary))
+        self.assertLess(compressor.wire_bytes, compressor.raw_bytes)
+
+    def test_round_trip_without_a_dictionary(self):
+        self.assertIsNone(self.round_trip(b'').stats()["dictionary"])
+
+    def test_negotiate_uses_the_dictionary_only_when_ids_match(self):
+        dictionary_id = compression.dictionary_id(compression.load_dictionary())
+        matched = compression.negotiate({'compress': ['deflate'], 'dict': [dictionary_id]})
+        mismatched = compression.negotiate({'compress': ['deflate'], 'dict': ['0123456789abcdef']})
+        self.assertEqual(matched.dictionary_id, dictionary_id)
+        self.assertEqual(mismatched.dictionary_id, '')
+        self.assertIsNone(compression.negotiate({}))
+
+    def test_trained_dictionary_round_trips(self):
+        trained = compression.train_dictionary(self.frames * 20, size=1024)
+        self.assertTrue(trained)
+        self.round_trip(trained)
+
+
+class CompressedSessionTests(LiveSessionTestCase):
+    async def test_large_frames_arrive_deflated_on_one_stream(self):
+        dictionary = compression.load_dictionary()
+        query = f"&compress=deflate&dict={compression.dictionary_id(dictionary)}"
+        communicator = WebsocketCommunicator(TerminalConsumer.as_asgi(), f"/ws/terminal/?session=deflate-test{query}")
+        connected, _ = await communicator.connect(timeout=10)
+        self.assertTrue(connected)
+        inflater = zlib.decompressobj(-15, zdict=dictionary)
+        pending = output = ''
+        compressed_frames = 0
+        sent_input = False
+        try:
+            deadline = time.monotonic() + 10
+            while time.monotonic() < deadline:
+                frame = await communicator.receive_output(timeout=10)
+                if frame.get('bytes') is not None:
+                    compressed_frames += 1
+                    pending += inflater.decompress(frame['bytes']).decode('utf-8')
+                else:
+                    pending += frame['text'] + '\n'
+                lines = pending.split('\n')
+                pending = lines.pop()
+                output += ''.join(json.loads(line).get('data', '') for line in lines if line)
+                if not sent_input and 'Welcome' in output:
+                    sent_input = True
+                    await communicator.send_json_to({"input": "ls -la /usr/bin | head -40; echo end-of-$((6*7))"})
+                elif sent_input and 'end-of-42' in output:
+                    break
+            else:
+                self.fail("command output never arrived")
+            self.assertGreater(compressed_frames, 0)
+        finally:
+            await communicator.disconnect()
+
+
+class SessionRecordTests(SimpleTestCase):
+    def test_counters_and_activity(self):
+        record = sessions.SessionRecord('s1', identity='alice')
+        idle_since = record.last_activity
+        record.sent(10)
+        record.sent(5)
+        self.assertEqual((record.bytes_out, record.frames_out), (15, 2))
+        self.assertEqual(record.last_activity, idle_since)
+        record.received(3)
+        self.assertEqual((record.bytes_in, record.frames_in), (3, 1))
+        self.assertGreaterEqual(record.last_activity, idle_since)
+        # Fixed layout: no per-record dict to grow
+        with self.assertRaises(AttributeError):
+            record.extra = 1
+
+    def test_unregister_leaves_a_newer_connection_in_place(self):
+        old, new = mock.Mock(session_id='s-reconnect'), mock.Mock(session_id='s-reconnect')
+        sessions.register(old)
+        sessions.register(new)
+        sessions.unregister(old)
+        self.assertIs(sessions.get_session('s-reconnect'), new)
+        sessions.unregister(new)
+        self.assertIsNone(sessions.get_session('s-reconnect'))
+
+
+@override_settings(TERMINAL_ADMIN_TOKEN='admin-secret')
+class SessionOpsTests(LiveSessionTestCase):
+    auth = {'Authorization': 'Bearer admin-secret'}
+
+    async def list_sessions(self, **params):
+        response = await self.async_client.get('/ops/sessions/', params, headers=self.auth)
+        self.assertEqual(response.status_code, 200)
+        return {info["session"]: info for info in response.json()["sessions"]}
+
+    async def test_list_describes_live_sessions(self):
+        busy = await self.connect('ops-busy')
+        quiet = await self.connect('ops-quiet')
+        try:
+            await busy.send_json_to({"input": "echo counted-$((2*3))"})
+            await self.receive_until(busy, lambda m: 'counted-6' in m.get('data', ''))
+            listed = await self.list_sessions()
+            info = listed['ops-busy']
+            self.assertEqual(info["frames_in"], 1)
+            self.assertGreater(info["bytes_out"], 0)
+            self.assertTrue(info["reader_running"])
+            [channel] = info["channels"]
+            self.assertEqual((channel["reader"], channel["exit_code"]), ("running", None))
+            self.assertEqual(info["memory"]["total"], sum(v for k, v in info["memory"].items() if k != "total"))
+            self.assertIn('ops-quiet', listed)
+
+            self.assertEqual(list(await self.list_sessions(sort='bytes_in', limit=1)), ['ops-busy'])
+            self.assertNotIn('ops-busy', await self.list_sessions(idle_over=3600))
+            response = await self.async_client.get('/ops/sessions/', {'sort': 'name'}, headers=self.auth)
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual((await self.async_client.get('/ops/sessions/')).status_code, 403)
+        finally:
+            await busy.disconnect()
+            await quiet.disconnect()
+
+    async def test_kill_tears_the_session_down(self):
+        communicator = await self.connect('ops-kill')
+        workspace = sessions.get_session('ops-kill').workspace
+        self.assertEqual((await self.async_client.post('/ops/sessions/ops-kill/kill/')).status_code, 403)
+        response = await self.async_client.post('/ops/sessions/ops-kill/kill/', headers=self.auth)
+        self.assertEqual(response.json(), {"session": "ops-kill", "killed": True})
+        await self.receive_until(communicator, lambda m: m.get('type') == 'error')
+        message = await communicator.receive_output(timeout=5)
+        while message["type"] != "websocket.close":
+            message = await communicator.receive_output(timeout=5)
+        self.assertEqual(message["code"], 1000)
+        self.assertIsNone(sessions.get_session('ops-kill'))
+        self.assertFalse(os.path.exists(workspace))
+        await communicator.wait()
+        response = await self.async_client.post('/ops/sessions/ops-kill/kill/', headers=self.auth)
+        self.assertEqual(response.status_code, 404)
+
+
+class CompileCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        for name, value in (('_seeded', False), ('_seeding', False)):
+            patcher = mock.patch.object(buildcache, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    @override_settings(TERMINAL_COMPILE_CACHE_DIR='')
+    def test_disabled_without_a_cache_dir(self):
+        self.assertEqual(buildcache.sandbox_env('/home/learner', '/usr/bin'), {})
+        self.assertEqual(buildcache.sandbox_read_only_paths(), [])
+
+    def test_sandbox_env_uses_the_paths_the_shell_sees(self):
+        with override_settings(TERMINAL_COMPILE_CACHE_DIR=self.root), \
+                mock.patch.object(buildcache, 'ccache_available', return_value=True):
+            env = buildcache.sandbox_env('/home/learner', '/usr/bin')
+            self.assertEqual(buildcache.sandbox_read_only_paths(), [self.root])
+        self.assertEqual(env['PATH'], f"{buildcache.CCACHE_MASQUERADE_DIR}:/usr/bin")
+        self.assertEqual(env['CCACHE_DIR'], '/home/learner/.cache/ccache')
+        self.assertEqual(env['CCACHE_BASEDIR'], '/home/learner')
+        self.assertEqual(env['PYTHONPYCACHEPREFIX'], '/home/learner/.cache/pycache')
+        # The shared layer is never writable from a sandbox
+        self.assertEqual(env['CCACHE_REMOTE_STORAGE'], f"file:{self.root}/ccache|read-only")
+
+    def test_without_ccache_only_bytecode_is_cached(self):
+        with override_settings(TERMINAL_COMPILE_CACHE_DIR=self.root), \
+                mock.patch.object(buildcache, 'ccache_available', return_value=False):
+            self.assertEqual(buildcache.sandbox_env('/home/learner', '/usr/bin'), {
+                'PYTHONPYCACHEPREFIX': '/home/learner/.cache/pycache',
+            })
+
+    def seed(self, workspace, returncode):
+        result = subprocess.CompletedProcess([], returncode, b'', b'gcc: error')
+        with override_settings(TERMINAL_COMPILE_CACHE_DIR=self.root), \
+                mock.patch.object(buildcache, 'ccache_available', return_value=True), \
+                mock.patch.object(buildcache.subprocess, 'run', return_value=result) as run:
+            buildcache.seed_from_workspace(workspace)
+            deadline = time.monotonic() + 5
+            while buildcache._seeding and time.monotonic() < deadline:
+                time.sleep(0.01)
+        return run
+
+    def test_seeds_once_and_retries_after_a_failure(self):
+        workspace = os.path.join(self.root, 'workspace')
+        os.makedirs(os.path.join(workspace, 'projects'))
+        with open(os.path.join(workspace, 'projects', 'hello.c'), 'w') as f:
+            f.write('int main(void) { return 0; }\n')
+
+        failed = self.seed(workspace, 1)
+        self.assertEqual(failed.call_count, 1)
+        self.assertFalse(buildcache._seeded)
+        # Compiled from a private copy, which is removed afterwards
+        staging = failed.call_args.kwargs['cwd']
+        self.assertFalse(staging.startswith(workspace))
+        self.assertFalse(os.path.exists(staging))
+
+        self.assertEqual(self.seed(workspace, 0).call_count, 1)
+        self.assertTrue(buildcache._seeded)
+        self.assertEqual(self.seed(workspace, 0).call_count, 0)
+
+    def test_missing_template_source_is_not_seeded(self):
+        run = self.seed(os.path.join(self.root, 'empty'), 0)
+        self.assertEqual(run.call_count, 0)
+        self.assertFalse(buildcache._seeding)
+        self.assertFalse(buildcache._seeded)
+
+
+def _addrinfo(*addresses):
+    return [(socket.AF_INET6 if ':' in a else socket.AF_INET, socket.SOCK_STREAM, 6, '', (a, 80)) for a in addresses]
+
+
+class MirrorAddressTests(SimpleTestCase):
+    def test_refuses_private_loopback_and_metadata_addresses(self):
+        for address in ('127.0.0.1', '10.0.0.5', '192.168.1.1', '169.254.169.254', '::1', 'fe80::1%eth0'):
+            with self.subTest(address=address), \
+                    mock.patch.object(mirror.socket, 'getaddrinfo', return_value=_addrinfo(address)):
+                with self.assertRaisesRegex(ValueError, 'non-public'):
+                    mirror.public_address('lesson.example', 80)
+
+    def test_one_private_answer_taints_the_host(self):
+        with mock.patch.object(mirror.socket, 'getaddrinfo', return_value=_addrinfo('93.184.215.14', '10.0.0.5')):
+            with self.assertRaises(ValueError):
+                mirror.public_address('lesson.example', 80)
+        with mock.patch.object(mirror.socket, 'getaddrinfo', return_value=_addrinfo('93.184.215.14')):
+            self.assertEqual(mirror.public_address('lesson.example', 80), '93.184.215.14')
+
+    def test_public_only_fetch_never_connects_to_a_private_address(self):
+        with mock.patch.object(mirror.socket, 'getaddrinfo', return_value=_addrinfo('127.0.0.1')), \
+                mock.patch.object(mirror.socket, 'create_connection') as connect:
+            with self.assertRaises(ValueError):
+                mirror.fetch('http://lesson.example/', public_only=True)
+        connect.assert_not_called()
+
+
+class MirrorProxyTests(SimpleTestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        self.cache = mirror.MirrorCache(os.path.join(self.root, 'cache'))
+        self.cache.put('https://example.com/', 200, 'OK', [('Content-Type', 'text/html')], b'<h1>Example</h1>')
+        self.cache.put('http://google.com/', 301, 'Moved', [('Location', 'http://www.google.com/')], b'')
+        self.ca_cert = os.path.join(self.root, 'ca.pem')
+        self.authority = mirror.CertificateAuthority(
+            self.ca_cert, os.path.join(self.root, 'ca-key.pem'), os.path.join(self.root, 'leaf'),
+        )
+        self.proxy = mirror.MirrorProxy(self.cache, self.authority, fetch_hosts={'lessons.example'})
+        self.socket_path = os.path.join(self.root, 'mirror.sock')
+
+    async def request(self, head, tls_host=None, inner=None):
+        """Raw response to one proxy request, optionally tunnelled over TLS"""
+        server = await asyncio.start_unix_server(self.proxy.handle, path=self.socket_path)
+        async with server:
+            reader, writer = await asyncio.open_unix_connection(self.socket_path)
+            writer.write(head)
+            if tls_host:
+                established = await reader.readuntil(b"\r\n\r\n")
+                if not established.startswith(b"HTTP/1.1 200"):
+                    writer.close()
+                    return established
+                await writer.start_tls(ssl.create_default_context(cafile=self.ca_cert), server_hostname=tls_host)
+                writer.write(inner)
+            response = await reader.read()
+            writer.close()
+            return response
+
+    async def test_serves_cached_urls_over_http_and_https(self):
+        response = await self.request(b"GET http://google.com HTTP/1.1\r\nHost: google.com\r\n\r\n")
+        self.assertTrue(response.startswith(b"HTTP/1.1 301 Moved"))
+        self.assertIn(b"Location: http://www.google.com/", response)
+        response = await self.request(
+            b"CONNECT example.com:443 HTTP/1.1\r\n\r\n", tls_host='example.com',
+            inner=b"GET / HTTP/1.1\r\nHost: example.com\r\n\r\n",
+        )
+        self.assertTrue(response.startswith(b"HTTP/1.1 200 OK"))
+        self.assertTrue(response.endswith(b"<h1>Example</h1>"))
+        self.assertEqual(self.proxy.hits, 2)
+
+    async def test_connect_to_another_host_is_refused_before_any_certificate(self):
+        with mock.patch.object(self.authority, 'server_context', wraps=self.authority.server_context) as mint:
+            response = await self.request(b"CONNECT internal.example:443 HTTP/1.1\r\n\r\n", tls_host='internal.example')
+            self.assertTrue(response.startswith(b"HTTP/1.1 403"))
+            mint.assert_not_called()
+            # Fetch hosts may be tunnelled to even before anything of theirs is cached
+            response = await self.request(
+                b"CONNECT lessons.example:443 HTTP/1.1\r\n\r\n", tls_host='lessons.example',
+                inner=b"GET /missing HTTP/1.1\r\n\r\n",
+            )
+            self.assertTrue(response.startswith(b"HTTP/1.1 502"))
+            mint.assert_called_once_with('lessons.example')
+
+    def test_newly_cached_hosts_are_allowed(self):
+        self.assertFalse(self.proxy.serves_host('docs.python.org'))
+        # As seed_mirror would, from another process
+        mirror.MirrorCache(self.cache.directory).put('https://docs.python.org/3/', 200, 'OK', [], b'docs')
+        self.assertTrue(self.proxy.serves_host('docs.python.org'))
+
+    def test_leaf_contexts_are_bounded(self):
+        with mock.patch.object(mirror, 'MAX_LEAF_CONTEXTS', 2):
+            first = self.authority.server_context('example.com')
+            self.authority.server_context('google.com')
+            self.assertIs(self.authority.server_context('example.com'), first)
+            self.authority.server_context('lessons.example')
+        self.assertEqual(list(self.authority._contexts), ['example.com', 'lessons.example'])
+
+
+class TraceSummaryTests(SimpleTestCase):
+    def span(self, trace, span_id, parent, name, ms, error=False):
+        return {"trace": trace, "id": span_id, "parent": parent, "name": name, "ms": ms, "error": error}
+
+    def test_summarize_by_phase(self):
+        spans = [
+            self.span('t1', 'r1', None, 'terminal.connect', 100),
+            self.span('t1', 's1', 'r1', 'shell.spawn', 60),
+            self.span('t1', 'p1', 's1', 'pty.spawn', 10),
+            self.span('t2', 'r2', None, 'terminal.connect', 300),
+            self.span('t2', 's2', 'r2', 'shell.spawn', 240, error=True),
+            # Parent never exported: skipped rather than filed as a root
+            self.span('t3', 'x', 'missing', 'shell.spawn', 999),
+        ]
+        rows = tracing.summarize(spans, percentiles=(0.5,))
+        self.assertEqual(
+            [row["phase"] for row in rows],
+            [('terminal.connect',), ('terminal.connect', 'shell.spawn'),
+             ('terminal.connect', 'shell.spawn', 'pty.spawn')],
+        )
+        connect, spawn, pty = rows
+        self.assertEqual((connect["count"], connect["mean_ms"], connect["max_ms"]), (2, 200.0, 300))
+        self.assertEqual(connect["share"], 100.0)
+        self.assertEqual((spawn["count"], spawn["errors"], spawn["p50_ms"]), (2, 1, 240))
+        self.assertEqual(spawn["share"], 75.0)
+        self.assertEqual(pty["share"], 2.5)
+
+    def test_spans_round_trip_through_otlp_json(self):
+        root = tracing.Span('terminal.connect', 'a' * 32, None, {"channels": 1}, start_ns=1_000_000)
+        root.end_ns = 5_000_000
+        child = root.child('pty.spawn', {}, start_ns=2_000_000)
+        child.end_ns = 3_000_000
+        child.error = 'OSError: boom'
+        path = os.path.join(tempfile.mkdtemp(), 'spans.jsonl')
+        self.addCleanup(shutil.rmtree, os.path.dirname(path), True)
+        with open(path, 'w') as f:
+            f.write(tracing.encode_batch([child, root]))
+        spans = tracing.read_spans(path)
+        self.assertEqual({s["name"]: (s["ms"], s["error"]) for s in spans},
+                         {'terminal.connect': (4.0, False), 'pty.spawn': (1.0, True)})
+        self.assertEqual([row["phase"][-1] for row in tracing.summarize(spans)], ['terminal.connect', 'pty.spawn'])
+
+
+@override_settings(TERMINAL_HEARTBEAT_INTERVAL=0.1, TERMINAL_HEARTBEAT_TIMEOUT=0.5)
+class HeartbeatTracingTests(LiveSessionTestCase):
+    def setUp(self):
+        super().setUp()
+        self.exported = []
+        exporter = mock.Mock(sample_rate=1.0, export=self.exported.append)
+        patcher = mock.patch.object(tracing, 'get_exporter', return_value=exporter)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def test_sweeper_starts_outside_the_connect_trace(self):
+        seen = []
+
+        async def sweep():
+            seen.append(tracing._current.get())
+
+        with mock.patch.object(heartbeat, '_sweeper', None), mock.patch.object(heartbeat, '_sweep_forever', sweep):
+            with tracing.trace('terminal.connect') as connect:
+                self.assertIsNotNone(connect)
+                heartbeat.ensure_sweeper()
+                await heartbeat._sweeper
+        self.assertEqual(seen, [None])
+
+    async def test_reap_is_its_own_disconnect_trace(self):
+        communicator = await self.connect('reap-trace')
+        while (await communicator.receive_output(timeout=5))["type"] != "websocket.close":
+            pass
+        await communicator.wait()
+
+        [connect] = [s for s in self.exported if s.name == 'terminal.connect']
+        [reap] = [s for s in self.exported if s.name == 'terminal.disconnect']
+        self.assertIsNone(reap.parent_id)
+        self.assertNotEqual(reap.trace_id, connect.trace_id)
+        self.assertEqual((reap.attributes["session"], reap.attributes["reason"]), ('reap-trace', 'heartbeat'))
+        teardown = [s for s in self.exported if s.name in ('channels.close', 'workspace.remove')]
+        self.assertEqual(len(teardown), 2)
+        self.assertTrue(all(s.trace_id == reap.trace_id for s in teardown))
+
+
+class ScrollbackSearchTests(SimpleTestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, True)
+        # Small blocks, so matches and their context straddle block boundaries
+        patcher = mock.patch.object(scrollback, 'BLOCK_SIZE', 200)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.lines = [f"line {i}" + (" needle" if i % 7 == 3 else "") for i in range(300)]
+
+    def open(self):
+        return scrollback.open_log(self.root, 'sandbox', 'main', 1 << 20)
+
+    def settle(self):
+        """Wait for the writer thread to finish everything queued so far"""
+        scrollback.writer().submit(scrollback._written).result()
+
+    def expected(self, lines, context):
+        return [
+            {
+                "line": i,
+                "text": text,
+                "before": lines[max(0, i - context):i],
+                "after": lines[i + 1:i + 1 + context],
+            }
+            for i, text in enumerate(lines) if 'needle' in text
+        ]
+
+    def search_all(self, snapshot, matcher, context, page_size):
+        found, cursor, pages = [], 0, 0
+        while cursor is not None:
+            matches, cursor = snapshot.search(matcher, cursor, context, page_size)
+            self.assertLessEqual(len(matches), page_size)
+            found.extend(matches)
+            pages += 1
+        return found, pages
+
+    def test_paging_with_context_across_blocks(self):
+        log = self.open()
+        for line in self.lines:
+            log.append(line)
+        self.settle()
+        snapshot = log.snapshot()
+        self.assertGreater(snapshot.blocks, 5)
+        self.assertTrue(snapshot.tail)
+
+        found, pages = self.search_all(snapshot, scrollback.compile_matcher('NEEDLE'), 2, 4)
+        self.assertEqual(found, self.expected(self.lines, 2))
+        self.assertGreater(pages, 5)
+        log.close().result()
+
+    def test_resuming_from_a_cursor_does_not_repeat_matches(self):
+        log = self.open()
+        for line in self.lines:
+            log.append(line)
+        snapshot = log.snapshot()
+        matcher = scrollback.compile_matcher('needle')
+        first, cursor = snapshot.search(matcher, 0, 1, 3)
+        second, _ = snapshot.search(matcher, cursor, 1, 3)
+        self.assertEqual([m["line"] for m in first + second], [3, 10, 17, 24, 31, 38])
+        self.assertEqual(second[0]["before"], [self.lines[23]])
+        log.close().result()
+
+    def test_history_survives_a_reopen(self):
+        log = self.open()
+        for line in self.lines[:150]:
+            log.append(line)
+        log.close().result()
+
+        # A new worker (after a handoff) carries on where the last checkpoint left off
+        reopened = self.open()
+        self.assertEqual(reopened.flushed_lines, 150)
+        for line in self.lines[150:]:
+            reopened.append(line)
+        found, _ = self.search_all(reopened.snapshot(), scrollback.compile_matcher('needle'), 3, 5)
+        self.assertEqual(found, self.expected(self.lines, 3))
+        reopened.close().result()
+
+    def test_regex_search(self):
+        log = self.open()
+        for line in self.lines:
+            log.append(line)
+        matcher = scrollback.compile_matcher(r'^line 1\d needle$', regex=True)
+        found, _ = self.search_all(log.snapshot(), matcher, 0, 10)
+        self.assertEqual([m["line"] for m in found], [10, 17])
+        log.close().result()
+
+    def test_escape_sequences_are_not_searched(self):
+        log = self.open()
+        log.append("\x1b[31mred\x1b[0m alert\r\n")
+        found, _ = self.search_all(log.snapshot(), scrollback.compile_matcher('red alert'), 0, 10)
+        self.assertEqual([m["text"] for m in found], ['red alert'])
+        log.close().result()
+
+    def test_rejects_nested_quantifiers_and_backreferences(self):
+        for pattern in (r'(a*)*b', r'(a|aa)+$', r'(x)\1', r'(', 'x' * (scrollback.MAX_QUERY_LENGTH + 1)):
+            with self.assertRaises(ValueError):
+                scrollback.compile_matcher(pattern, regex=True)
+        for pattern in (r'error.*line \d+', r'[A-Z]\w+Error:', r'(error|warning): ', r'a{2,5}'):
+            scrollback.compile_matcher(pattern, regex=True)
+
+    def test_slow_regex_page_is_killed(self):
+        log = self.open()
+        log.append('a' * 2000)
+        matcher = scrollback.compile_matcher('a*a*a*z', regex=True)
+        with mock.patch.object(scrollback, 'REGEX_KILL_SECONDS', 1.0):
+            started = time.monotonic()
+            with self.assertRaises(ValueError):
+                scrollback.search_page(log.snapshot(), matcher, 0, 0, 10)
+        self.assertLess(time.monotonic() - started, 10)
+        log.close().result()
+
+    def test_remove_session(self):
+        log = self.open()
+        log.append('x')
+        log.close().result()
+        scrollback.remove_session(self.root, 'sandbox')
+        self.assertFalse(os.path.exists(os.path.dirname(log.log_path)))
+
+    def test_queued_blocks_are_searched_before_they_are_written(self):
+        log = self.open()
+        release = threading.Event()
+        self.addCleanup(release.set)
+        # Hold the writer, as a slow disk would
+        scrollback.writer().submit(release.wait)
+        for line in self.lines:
+            log.append(line)
+        snapshot = log.snapshot()
+        self.assertEqual(snapshot.blocks, 0)
+        self.assertGreater(log.buffered_bytes(), scrollback.BLOCK_SIZE)
+        found, _ = self.search_all(snapshot, scrollback.compile_matcher('needle'), 1, 10)
+        self.assertEqual(found, self.expected(self.lines, 1))
+        release.set()
+        log.close().result()
+        self.assertEqual(log.flushed_lines, len(self.lines))
+
+    def test_regex_pages_reuse_one_worker_process(self):
+        log = self.open()
+        for line in self.lines:
+            log.append(line)
+        matcher = scrollback.compile_matcher(r'line \d+ needle', regex=True)
+        snapshot = log.snapshot()
+        first, cursor = scrollback.search_page(snapshot, matcher, 0, 0, 5)
+        worker = scrollback._workers.worker
+        pid = worker.proc.pid
+        second, _ = scrollback.search_page(snapshot, matcher, cursor, 0, 5)
+        self.assertEqual(worker.proc.pid, pid)
+        self.assertEqual([m["line"] for m in first + second], list(range(3, 70, 7)))
+
+        # A killed worker is replaced by the next page
+        with mock.patch.object(scrollback, 'REGEX_KILL_SECONDS', 1.0):
+            log.append('a' * 2000)
+            with self.assertRaises(ValueError):
+                scrollback.search_page(log.snapshot(), scrollback.compile_matcher('a*a*a*z', regex=True), 0, 0, 10)
+        self.assertIsNone(worker.proc)
+        found, _ = scrollback.search_page(snapshot, matcher, 0, 0, 1)
+        self.assertEqual([m["line"] for m in found], [3])
+        self.assertNotEqual(worker.proc.pid, pid)
+        log.close().result()
+
+
+class ScrollbackSessionTests(LiveSessionTestCase):
+    async def test_search_over_a_live_channel(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root, True)
+        with override_settings(TERMINAL_SCROLLBACK_DIR=root):
+            communicator = await self.connect('scrollback-test')
+            try:
+                await communicator.send_json_to({"input": "for i in 1 2 3; do echo found-$i; done"})
+                await self.receive_until(communicator, lambda m: 'found-3' in m.get('data', ''))
+                await communicator.send_json_to({"type": "search", "id": "s1", "query": r"^found-[23]$", "regex": True, "context": 0})
+                [*_, results] = await self.receive_until(communicator, lambda m: m.get('type') == 'search_results')
+                self.assertEqual([m["text"] for m in results["matches"]], ['found-2', 'found-3'])
+                self.assertTrue(results["done"])
+            finally:
+                await communicator.disconnect()
+        self.assertEqual(os.listdir(root), [])
 
-# Create your tests here.
@@ -0,0 +1,370 @@
+"""Per-phase timing spans for connecting and disconnecting sessions.
+
+A sampled connect or disconnect becomes a trace: a root span with one child
+span per phase (workspace creation, sandbox spawn, first prompt, ...). The
+current span lives in a context variable, so phases nest without passing
+anything around, and tasks started by ``asyncio.gather`` inherit it. When a
+trace isn't sampled, or TERMINAL_TRACE_EXPORT is empty, every call is a
+context variable lookup and nothing else.
+
+Finished spans are buffered and written by a background thread. Each batch
+is one line of OTLP/JSON (an ExportTraceServiceRequest), appended to a file
+or sent to a ``unix:/path`` stream socket. That is the format the
+OpenTelemetry Collector's otlpjsonfile receiver and file exporter use.
+``manage.py trace_report`` turns those lines into per-phase percentiles.
+"""
+import atexit
+import contextvars
+import gzip
+import json
+import logging
+import os
+import random
+import socket
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+SERVICE_NAME = 'learnlinux-terminal'
+SCOPE_NAME = 'terminal'
+SPAN_KIND_INTERNAL = 1
+STATUS_ERROR = 2
+
+_current = contextvars.ContextVar('terminal_trace_span', default=None)
+# perf_counter is monotonic and precise; this pins it to the Unix epoch OTLP wants
+_EPOCH_OFFSET_NS = time.time_ns() - time.perf_counter_ns()
+
+
+def now():
+    """Current time in Unix nanoseconds, on the same clock as span timestamps"""
+    return time.perf_counter_ns() + _EPOCH_OFFSET_NS
+
+
+class Span:
+    """One timed phase; ``end_ns`` is set when it finishes"""
+
+    __slots__ = ('trace_id', 'span_id', 'parent_id', 'name', 'start_ns', 'end_ns', 'attributes', 'error')
+
+    def __init__(self, name, trace_id, parent_id, attributes, start_ns=None):
+        self.trace_id = trace_id
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_id = parent_id
+        self.name = name
+        self.start_ns = now() if start_ns is None else start_ns
+        self.end_ns = None
+        self.attributes = attributes
+        self.error = None
+
+    def child(self, name, attributes, start_ns=None):
+        return Span(name, self.trace_id, self.span_id, attributes, start_ns)
+
+    def to_otlp(self):
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": SPAN_KIND_INTERNAL,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": _attributes(self.attributes),
+            "status": {"code": STATUS_ERROR, "message": self.error} if self.error else {},
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+
+def _attributes(values):
+    attributes = []
+    for key, value in values.items():
+        if value is None:
+            continue
+        if isinstance(value, bool):
+            encoded = {"boolValue": value}
+        elif isinstance(value, int):
+            encoded = {"intValue": str(value)}
+        elif isinstance(value, float):
+            encoded = {"doubleValue": value}
+        else:
+            encoded = {"stringValue": str(value)}
+        attributes.append({"key": key, "value": encoded})
+    return attributes
+
+
+class _Scope:
+    """Makes a span current for the duration of a ``with`` block and exports it at the end"""
+
+    __slots__ = ('span', 'token')
+
+    def __init__(self, span):
+        self.span = span
+        self.token = None
+
+    def __enter__(self):
+        if self.span is not None:
+            self.token = _current.set(self.span)
+        return self.span
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.span is None:
+            return False
+        _current.reset(self.token)
+        if exc_type is not None:
+            self.span.error = f"{exc_type.__name__}: {exc}" if str(exc) else exc_type.__name__
+        _finish(self.span)
+        return False
+
+
+_NOT_TRACED = _Scope(None)
+
+
+def trace(name, **attributes):
+    """Start a new trace, if this one is sampled: ``with tracing.trace('terminal.connect'):``"""
+    exporter = get_exporter()
+    if exporter is None or random.random() >= exporter.sample_rate:
+        return _NOT_TRACED
+    return _Scope(Span(name, f"{random.getrandbits(128):032x}", None, attributes))
+
+
+def span(name, **attributes):
+    """Time a phase of the current trace; does nothing outside a sampled trace"""
+    parent = _current.get()
+    if parent is None:
+        return _NOT_TRACED
+    return _Scope(parent.child(name, attributes))
+
+
+def record(name, start_ns, end_ns, **attributes):
+    """Add an already measured phase (timestamps from ``now()``) to the current trace"""
+    parent = _current.get()
+    if parent is not None:
+        finished = parent.child(name, attributes, start_ns)
+        finished.end_ns = end_ns
+        _export(finished)
+
+
+def annotate(**attributes):
+    """Set attributes on the current span, if there is one"""
+    current = _current.get()
+    if current is not None:
+        current.attributes.update(attributes)
+
+
+def fail(message):
+    """Mark the current span as failed, for errors that are handled rather than raised"""
+    current = _current.get()
+    if current is not None:
+        current.error = message
+
+
+def _finish(finished):
+    finished.end_ns = now()
+    _export(finished)
+
+
+def _export(finished):
+    exporter = get_exporter()
+    if exporter is not None:
+        exporter.export(finished)
+
+
+def encode_batch(spans):
+    """One OTLP/JSON ExportTraceServiceRequest line for a batch of finished spans"""
+    return json.dumps({
+        "resourceSpans": [{
+            "resource": {"attributes": _attributes({
+                "service.name": SERVICE_NAME,
+                "host.name": socket.gethostname(),
+                "process.pid": os.getpid(),
+            })},
+            "scopeSpans": [{
+                "scope": {"name": SCOPE_NAME},
+                "spans": [s.to_otlp() for s in spans],
+            }],
+        }],
+    }, separators=(',', ':')) + "\n"
+
+
+class SpanExporter:
+    """Buffers finished spans in memory and writes them in batches from a background thread"""
+
+    def __init__(self, target, sample_rate=1.0, flush_interval=2.0, batch_size=256, max_queue=10000):
+        self.target = target
+        self.sample_rate = sample_rate
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.max_queue = max_queue
+        self.dropped = 0
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._socket = None
+        self._thread = threading.Thread(target=self._run, name='terminal-tracing', daemon=True)
+        self._thread.start()
+
+    def export(self, finished):
+        """Queue a finished span; never blocks on I/O, drops spans if the writer falls behind"""
+        with self._lock:
+            if len(self._buffer) >= self.max_queue:
+                self.dropped += 1
+                return
+            self._buffer.append(finished)
+            full = len(self._buffer) >= self.batch_size
+        if full:
+            self._wake.set()
+
+    def flush(self):
+        """Write everything buffered so far"""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._buffer = self._buffer, []
+                dropped, self.dropped = self.dropped, 0
+            if dropped:
+                logger.warning(f"Dropped {dropped} trace spans: the exporter fell behind")
+            for start in range(0, len(batch), self.batch_size):
+                line = encode_batch(batch[start:start + self.batch_size]).encode()
+                try:
+                    self._write(line)
+                except OSError as e:
+                    logger.warning(f"Failed to export {len(batch)} trace spans to {self.target}: {e}")
+                    return
+
+    def _write(self, line):
+        if not self.target.startswith('unix:'):
+            with open(self.target, 'ab') as f:
+                f.write(line)
+            return
+        if self._socket is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                sock.settimeout(5)
+                sock.connect(self.target[len('unix:'):])
+            except OSError:
+                sock.close()
+                raise
+            self._socket = sock
+        try:
+            self._socket.sendall(line)
+        except OSError:
+            # Reconnect on the next batch; a collector restart shouldn't need a worker restart
+            self._socket.close()
+            self._socket = None
+            raise
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+
+_exporter = None
+_exporter_lock = threading.Lock()
+_configured = False
+
+
+def get_exporter():
+    """The worker's span exporter, or None when TERMINAL_TRACE_EXPORT is empty"""
+    global _exporter, _configured
+    if _configured:
+        return _exporter
+    from django.conf import settings
+    with _exporter_lock:
+        if not _configured:
+            target = getattr(settings, 'TERMINAL_TRACE_EXPORT', '')
+            if target:
+                _exporter = SpanExporter(
+                    target,
+                    sample_rate=getattr(settings, 'TERMINAL_TRACE_SAMPLE_RATE', 0.1),
+                    flush_interval=getattr(settings, 'TRACE_FLUSH_INTERVAL', 2.0),
+                    batch_size=getattr(settings, 'TRACE_BATCH_SIZE', 256),
+                    max_queue=getattr(settings, 'TRACE_MAX_QUEUE', 10000),
+                )
+                atexit.register(_exporter.flush)
+            _configured = True
+    return _exporter
+
+
+def read_spans(path):
+    """Spans from an OTLP/JSON lines file (optionally gzipped), as plain dicts"""
+    opener = gzip.open if path.endswith('.gz') else open
+    spans = []
+    with opener(path, 'rt') as f:
+        for number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line)
+            except ValueError as e:
+                raise ValueError(f"line {number}: {e}")
+            for resource in request.get("resourceSpans", []):
+                for scope in resource.get("scopeSpans", []):
+                    for s in scope.get("spans", []):
+                        spans.append({
+                            "trace": s["traceId"],
+                            "id": s["spanId"],
+                            "parent": s.get("parentSpanId") or None,
+                            "name": s["name"],
+                            "ms": (int(s["endTimeUnixNano"]) - int(s["startTimeUnixNano"])) / 1e6,
+                            "error": s.get("status", {}).get("code") == STATUS_ERROR,
+                        })
+    return spans
+
+
+def _percentile(ordered, fraction):
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def summarize(spans, percentiles=(0.5, 0.9, 0.99)):
+    """Per-phase duration statistics, one row per path from the root, in tree order.
+
+    ``share`` is the phase's total time as a percentage of its root's total,
+    i.e. how much of a typical connect it accounts for.
+    """
+    by_id = {(s["trace"], s["id"]): s for s in spans}
+    durations = {}
+    errors = {}
+
+    def path_of(s):
+        names = [s["name"]]
+        seen = 0
+        while s["parent"] and seen < 64:
+            s = by_id.get((s["trace"], s["parent"]))
+            if s is None:
+                return None  # Parent not exported (yet); skip rather than misfile it
+            names.append(s["name"])
+            seen += 1
+        return tuple(reversed(names))
+
+    for s in spans:
+        path = path_of(s)
+        if path is None:
+            continue
+        durations.setdefault(path, []).append(s["ms"])
+        errors[path] = errors.get(path, 0) + s["error"]
+
+    # Children sort under their parent; siblings in the order they first finished
+    first_seen = {path: i for i, path in enumerate(durations)}
+
+    def tree_order(path):
+        return tuple(first_seen.get(path[:depth], -1) for depth in range(1, len(path) + 1))
+
+    rows = []
+    for path in sorted(durations, key=tree_order):
+        ordered = sorted(durations[path])
+        root_total = sum(durations.get(path[:1], [])) or 1.0
+        rows.append({
+            "phase": path,
+            "count": len(ordered),
+            "errors": errors[path],
+            "mean_ms": round(sum(ordered) / len(ordered), 3),
+            **{f"p{round(p * 100):g}_ms": round(_percentile(ordered, p), 3) for p in percentiles},
+            "max_ms": round(ordered[-1], 3),
+            "share": round(100 * sum(ordered) / root_total, 1),
+        })
+    return rows
+
@@ -0,0 +1,231 @@
+"""Streaming tar import/export of session workspaces.
+
+Archives are produced and consumed one chunk at a time so memory use stays
+constant regardless of workspace or upload size.
+"""
+import os
+import stat
+import tarfile
+import zlib
+import logging
+
+from asgiref.sync import sync_to_async
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+
+# Output formats supported by the export endpoint: name -> (content type, zlib wbits)
+EXPORT_FORMATS = {
+    'tar': ('application/x-tar', None),
+    'gz': ('application/gzip', 31),  # wbits=31 produces a gzip container
+}
+
+
+class WorkspaceTransferError(Exception):
+    """Raised when an uploaded archive is rejected"""
+
+
+def _tar_header(name, arcname, dir_fd):
+    """Build a TarInfo and the lstat result for a workspace entry, or None for unsupported file types"""
+    st = os.stat(name, dir_fd=dir_fd, follow_symlinks=False)
+    info = tarfile.TarInfo(arcname)
+    info.mode = stat.S_IMODE(st.st_mode)
+    info.mtime = int(st.st_mtime)
+    if stat.S_ISDIR(st.st_mode):
+        info.type = tarfile.DIRTYPE
+    elif stat.S_ISREG(st.st_mode):
+        info.type = tarfile.REGTYPE
+        info.size = st.st_size
+    elif stat.S_ISLNK(st.st_mode):
+        info.type = tarfile.SYMTYPE
+        info.linkname = os.readlink(name, dir_fd=dir_fd)
+    else:
+        return None, st  # Sockets, FIFOs and devices are not exported
+    return info, st
+
+
+def _open_exported_file(name, dir_fd, expected):
+    """Open a workspace file for reading, refusing anything but the regular file we just lstat'ed.
+
+    The sandbox can swap entries for symlinks, FIFOs or other files at any
+    moment, so the check is made on the open descriptor, not the path.
+    """
+    fd = os.open(name, os.O_RDONLY | os.O_NOFOLLOW | os.O_NONBLOCK | os.O_CLOEXEC, dir_fd=dir_fd)
+    try:
+        st = os.fstat(fd)
+        if not stat.S_ISREG(st.st_mode) or (st.st_dev, st.st_ino) != (expected.st_dev, expected.st_ino):
+            raise OSError(f"{name} was replaced during export")
+        if st.st_size < expected.st_size:
+            raise OSError(f"{name} shrank from {expected.st_size} to {st.st_size} bytes during export")
+    except BaseException:
+        os.close(fd)
+        raise
+    return fd
+
+
+def _iter_file_data(name, dir_fd, expected):
+    """Yield exactly `expected.st_size` bytes of a file plus tar block padding"""
+    size = expected.st_size
+    remaining = size
+    try:
+        fd = _open_exported_file(name, dir_fd, expected)
+        with open(fd, 'rb', buffering=0) as f:
+            while remaining > 0:
+                data = f.read(min(CHUNK_SIZE, remaining))
+                if not data:
+                    break
+                remaining -= len(data)
+                yield data
+    except OSError as e:
+        logger.warning(f"Could not read {name} for export: {e}")
+    # Keep the archive well-formed if the file could not be read in full
+    while remaining > 0:
+        pad = min(CHUNK_SIZE, remaining)
+        remaining -= pad
+        yield tarfile.NUL * pad
+    remainder = size % tarfile.BLOCKSIZE
+    if remainder:
+        yield tarfile.NUL * (tarfile.BLOCKSIZE - remainder)
+
+
+def _iter_raw_tar(workspace):
+    """Yield an uncompressed tar stream of the workspace
+
+    fwalk keeps a descriptor on each directory, so entries are resolved
+    relative to it and a directory swapped for a symlink mid-walk can't lead
+    the export outside the workspace.
+    """
+    written = 0
+    for root, dirs, files, root_fd in os.fwalk(workspace, follow_symlinks=False):
+        dirs.sort()
+        for name in dirs + sorted(files):
+            arcname = os.path.relpath(os.path.join(root, name), workspace)
+            try:
+                info, st = _tar_header(name, arcname, root_fd)
+            except OSError:
+                continue  # Removed while we were walking
+            if info is None:
+                continue
+            header = info.tobuf(tarfile.PAX_FORMAT, tarfile.ENCODING, 'surrogateescape')
+            written += len(header)
+            yield header
+            if info.isreg():
+                for data in _iter_file_data(name, root_fd, st):
+                    written += len(data)
+                    yield data
+    # End-of-archive marker, padded to a full record like tarfile does
+    trailer = tarfile.BLOCKSIZE * 2
+    written += trailer
+    remainder = written % tarfile.RECORDSIZE
+    if remainder:
+        trailer += tarfile.RECORDSIZE - remainder
+    yield tarfile.NUL * trailer
+
+
+def iter_workspace_archive(workspace, fmt='tar'):
+    """Yield the workspace as a tar archive, optionally gzip-compressed"""
+    wbits = EXPORT_FORMATS[fmt][1]
+    if wbits is None:
+        yield from _iter_raw_tar(workspace)
+        return
+
+    compressor = zlib.compressobj(6, zlib.DEFLATED, wbits)
+    pending = []
+    pending_size = 0
+    for data in _iter_raw_tar(workspace):
+        out = compressor.compress(data)
+        if out:
+            pending.append(out)
+            pending_size += len(out)
+            # Coalesce small deflate outputs into reasonably sized chunks
+            if pending_size >= CHUNK_SIZE:
+                yield b''.join(pending)
+                pending = []
+                pending_size = 0
+    pending.append(compressor.flush())
+    yield b''.join(pending)
+
+
+async def aiter_workspace_archive(workspace, fmt='tar'):
+    """Async wrapper so Django's ASGI handler streams instead of buffering"""
+    chunks = iter_workspace_archive(workspace, fmt)
+    next_chunk = sync_to_async(next, thread_sensitive=False)
+    while True:
+        chunk = await next_chunk(chunks, None)
+        if chunk is None:
+            break
+        yield chunk
+
+
+def _safe_destination(workspace, name):
+    """Resolve an archive member name to a path that is guaranteed to stay inside the workspace"""
+    normalized = os.path.normpath(name.lstrip('/'))
+    if normalized in ('', '.') or normalized == '..' or normalized.startswith('../'):
+        raise WorkspaceTransferError(f"Unsafe path in archive: {name}")
+    dest = os.path.join(workspace, normalized)
+    # The workspace is writable from inside the sandbox, so symlinks planted there
+    # must not be able to redirect our writes elsewhere on the host
+    root = os.path.realpath(workspace)
+    parent = os.path.realpath(os.path.dirname(dest))
+    if parent != root and not parent.startswith(root + os.sep):
+        raise WorkspaceTransferError(f"Archive path escapes workspace: {name}")
+    return dest
+
+
+def _copy_member(src, dest, size, mode):
+    """Stream one regular file out of the archive without following symlinks"""
+    flags = os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, 'O_NOFOLLOW', 0)
+    fd = os.open(dest, flags, 0o644)
+    try:
+        remaining = size
+        while remaining > 0:
+            data = src.read(min(CHUNK_SIZE, remaining))
+            if not data:
+                break
+            _write_all(fd, data)
+            remaining -= len(data)
+        os.fchmod(fd, mode & 0o755 | 0o600)
+    finally:
+        os.close(fd)
+
+
+def _write_all(fd, data):
+    """os.write until every byte has been written"""
+    view = memoryview(data)
+    while view:
+        written = os.write(fd, view)
+        view = view[written:]
+
+
+def extract_workspace_archive(stream, workspace, max_file_size, max_total_size):
+    """Extract a (possibly compressed) tar stream into the workspace.
+
+    Only regular files and directories are created; links and special files are
+    skipped. Returns (files_written, bytes_written).
+    """
+    files_written = 0
+    bytes_written = 0
+    try:
+        with tarfile.open(fileobj=stream, mode='r|*', bufsize=CHUNK_SIZE) as tar:
+            for member in tar:
+                if not (member.isdir() or member.isfile()):
+                    logger.info(f"Skipping non-regular archive member: {member.name}")
+                    continue
+                dest = _safe_destination(workspace, member.name)
+                if member.isdir():
+                    os.makedirs(dest, exist_ok=True)
+                    continue
+                if member.size > max_file_size:
+                    raise WorkspaceTransferError(
+                        f"{member.name} is {member.size} bytes, which exceeds the {max_file_size} byte file size limit"
+                    )
+                if bytes_written + member.size > max_total_size:
+                    raise WorkspaceTransferError(f"Archive exceeds the {max_total_size} byte import limit")
+                os.makedirs(os.path.dirname(dest), exist_ok=True)
+                _copy_member(tar.extractfile(member), dest, member.size, member.mode)
+                files_written += 1
+                bytes_written += member.size
+    except tarfile.TarError as e:
+        raise WorkspaceTransferError(f"Invalid archive: {e}")
+    return files_written, bytes_written
@@ -1,6 +1,269 @@
-from rest_framework.decorators import api_view
+import hmac
+import json
+import logging
+import os
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 
+from . import audit, broadcast, compression, heartbeat, profiler, sessions, transfer
+from .permissions import HasAdminToken, bearer_token, token_matches
+from .consumers import SANDBOX_RLIMIT_FSIZE
+
+logger = logging.getLogger(__name__)
+
+
 @api_view()
 def index(request):
-    return Response({"message": "API is working!"})
\ No newline at end of file
+    return Response({"message": "API is working!"})
+
+
+@require_GET
+async def dashboard(request):
+    """Live sessions with a low-rate text thumbnail of each terminal
+
+    Async so the broadcasters' output tails and observer sets are read on the
+    event loop that updates them, not from a worker thread.
+    """
+    if not token_matches(bearer_token(request), 'TERMINAL_INSTRUCTOR_TOKEN'):
+        return JsonResponse({"error": "Instructor token required"}, status=403)
+    interval = getattr(settings, 'DASHBOARD_THUMBNAIL_INTERVAL', 5)
+    return JsonResponse({
+        "refresh_interval": interval,
+        "sessions": [
+            {
+                "session": b.session_id,
+                "started": b.started,
+                "observers": len(b.observers),
+                "thumbnail": b.thumbnail(interval),
+            }
+            for b in sorted(broadcast.all_broadcasters(), key=lambda b: b.started)
+        ],
+    })
+
+
+@require_GET
+async def ops_stats(request):
+    """Worker health: live sessions, heartbeat reaping and bandwidth saved by output compression
+
+    Async so the live sessions and their compressors are read on the event
+    loop that updates them, not from a worker thread.
+    """
+    if not token_matches(bearer_token(request), 'TERMINAL_ADMIN_TOKEN'):
+        return JsonResponse({"error": "Admin token required"}, status=403)
+    live = {
+        consumer.session_id: consumer.compressor
+        for consumer in sessions.live_sessions()
+        if getattr(consumer, 'compressor', None)
+    }
+    return JsonResponse({"heartbeat": heartbeat.stats(), "compression": compression.report(live)})
+
+
+SESSION_SORT_KEYS = {
+    "started": lambda s: s["started_at"],
+    "idle": lambda s: s["idle_seconds"],
+    "bytes_in": lambda s: s["bytes_in"],
+    "bytes_out": lambda s: s["bytes_out"],
+    "memory": lambda s: s["memory"]["total"],
+}
+
+
+@require_GET
+async def session_list(request):
+    """Live sessions on this worker: ?identity=&client=&idle_over=<s>&memory_over=<bytes>&sort=memory&limit=100
+
+    Async so it reads consumer and task state (and polls shells) on the event
+    loop that owns them, not from a worker thread.
+    """
+    if not token_matches(bearer_token(request), 'TERMINAL_ADMIN_TOKEN'):
+        return JsonResponse({"error": "Admin token required"}, status=403)
+    sort = request.GET.get('sort', 'started')
+    if sort not in SESSION_SORT_KEYS:
+        return JsonResponse({"error": f"sort must be one of {', '.join(SESSION_SORT_KEYS)}"}, status=400)
+    try:
+        idle_over = float(request.GET.get('idle_over', 0))
+        memory_over = int(request.GET.get('memory_over', 0))
+        limit = int(request.GET.get('limit', 100))
+    except ValueError:
+        return JsonResponse({"error": "idle_over, memory_over and limit must be numbers"}, status=400)
+    identity = request.GET.get('identity')
+    client = request.GET.get('client')
+
+    now = time.monotonic()
+    found = []
+    for consumer in sessions.live_sessions():
+        if consumer.record is None:
+            continue
+        info = sessions.describe(consumer, now)
+        if identity and info["identity"] != identity:
+            continue
+        if client and not (info["client"] or "").startswith(client):
+            continue
+        if info["idle_seconds"] < idle_over or info["memory"]["total"] < memory_over:
+            continue
+        found.append(info)
+    # Oldest first by start time; biggest first for everything else
+    found.sort(key=SESSION_SORT_KEYS[sort], reverse=sort != 'started')
+    return JsonResponse({"count": len(found), "sessions": found[:max(0, limit)]})
+
+
+@csrf_exempt
+@require_POST
+async def session_kill(request, session_id):
+    """Tear a live session down: stop its shells, delete its workspace and close the socket"""
+    if not token_matches(bearer_token(request), 'TERMINAL_ADMIN_TOKEN'):
+        return JsonResponse({"error": "Admin token required"}, status=403)
+    consumer = sessions.get_session(session_id)
+    if consumer is None:
+        return JsonResponse({"error": "Session not found"}, status=404)
+
+    logger.warning(f"Killing session {session_id} on operator request")
+    try:
+        await consumer.send(text_data=json.dumps({"type": "error", "data": "Session ended by an administrator"}))
+    except Exception as e:
+        logger.debug(f"Could not notify session {session_id} before killing it: {e}")
+    # A normal close, so the client doesn't reconnect straight into a new session
+    await consumer.reap('operator', code=1000)
+    return JsonResponse({"session": session_id, "killed": True})
+
+
+@api_view()
+@permission_classes([HasAdminToken])
+def audit_search(request):
+    """Search audited commands: ?q=<substring>&days=7&session=&identity=&action=blocked|monitored&limit=100"""
+    log = audit.get_audit_log()
+    if log is None:
+        return Response({"error": "Auditing is disabled"}, status=404)
+    try:
+        days = float(request.GET.get('days', 7))
+        limit = int(request.GET.get('limit', 100))
+    except ValueError:
+        return Response({"error": "days and limit must be numbers"}, status=400)
+    if not 1 <= limit <= audit.MAX_RESULTS:
+        return Response({"error": f"limit must be between 1 and {audit.MAX_RESULTS}"}, status=400)
+
+    # Include events still waiting in the buffer
+    log.flush()
+    started = time.perf_counter()
+    results = log.store.search(
+        text=request.GET.get('q'),
+        session=request.GET.get('session'),
+        identity=request.GET.get('identity'),
+        action=request.GET.get('action'),
+        since=time.time() - days * 86400,
+        limit=limit,
+    )
+    return Response({
+        "results": results,
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 3),
+    })
+
+
+def _live_workspace(request, session_id):
+    """(workspace path, error response) for a live session the request may transfer files for
+
+    The session's own client holds its transfer token; instructors use TERMINAL_INSTRUCTOR_TOKEN.
+    """
+    consumer = sessions.get_session(session_id)
+    workspace = getattr(consumer, 'workspace', None)
+    if not workspace or not os.path.isdir(workspace):
+        return None, JsonResponse({"error": "Session not found"}, status=404)
+    provided = bearer_token(request)
+    expected = getattr(consumer, 'transfer_token', None)
+    if token_matches(provided, 'TERMINAL_INSTRUCTOR_TOKEN'):
+        return workspace, None
+    if not provided or not expected or not hmac.compare_digest(provided.encode(), expected.encode()):
+        return None, JsonResponse({"error": "A valid transfer token is required"}, status=403)
+    return workspace, None
+
+
+@require_GET
+async def workspace_export(request, session_id):
+    """Stream the session workspace out as a tar archive (?format=tar|gz)
+
+    Requires 'Authorization: Bearer <token>' with the transfer token from the
+    session's websocket, or the instructor token.
+    """
+    workspace, error = _live_workspace(request, session_id)
+    if error:
+        return error
+
+    fmt = request.GET.get('format', 'tar')
+    if fmt not in transfer.EXPORT_FORMATS:
+        return JsonResponse({"error": f"Unsupported format: {fmt}"}, status=400)
+
+    content_type, _ = transfer.EXPORT_FORMATS[fmt]
+    extension = 'tar.gz' if fmt == 'gz' else 'tar'
+    response = StreamingHttpResponse(
+        transfer.aiter_workspace_archive(workspace, fmt),
+        content_type=content_type,
+    )
+    response['Content-Disposition'] = f'attachment; filename="workspace.{extension}"'
+    return response
+
+
+# The bearer transfer token is the CSRF defence: browsers never attach it to cross-site requests
+@csrf_exempt
+@require_POST
+async def workspace_import(request, session_id):
+    """Extract an uploaded tar archive (raw request body, optionally compressed) into the session workspace
+
+    Requires 'Authorization: Bearer <token>' with the transfer token from the
+    session's websocket, or the instructor token.
+    """
+    workspace, error = _live_workspace(request, session_id)
+    if error:
+        return error
+
+    max_total = getattr(settings, 'WORKSPACE_IMPORT_MAX_BYTES', SANDBOX_RLIMIT_FSIZE)
+    try:
+        content_length = int(request.META.get('CONTENT_LENGTH') or 0)
+    except ValueError:
+        content_length = 0
+    if content_length <= 0:
+        return JsonResponse({"error": "Request body must be a tar archive"}, status=400)
+    if content_length > max_total:
+        return JsonResponse({"error": f"Upload exceeds the {max_total} byte import limit"}, status=413)
+
+    # The ASGI handler has already spooled the body to a temporary file, so
+    # reading it incrementally keeps memory flat for large uploads
+    try:
+        files, size = await sync_to_async(transfer.extract_workspace_archive, thread_sensitive=False)(
+            request, workspace, SANDBOX_RLIMIT_FSIZE, max_total
+        )
+    except transfer.WorkspaceTransferError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+    return JsonResponse({"files": files, "bytes": size})
+
+
+@require_GET
+async def profile_worker(request):
+    """Sample this worker for ?seconds=N; returns stacks, event loop lag and executor backlog
+
+    ?format=collapsed returns only the stacks, ready for flamegraph.pl.
+    """
+    if not token_matches(bearer_token(request), 'TERMINAL_ADMIN_TOKEN'):
+        return JsonResponse({"error": "Admin token required"}, status=403)
+
+    max_seconds = getattr(settings, 'PROFILER_MAX_SECONDS', 60)
+    try:
+        seconds = min(max(float(request.GET.get('seconds', 10)), 0.1), max_seconds)
+        interval_ms = min(max(float(request.GET.get('interval_ms', 5)), 1), 100)
+    except ValueError:
+        return JsonResponse({"error": "seconds and interval_ms must be numbers"}, status=400)
+
+    try:
+        result = await profiler.profile(seconds, interval_ms / 1000)
+    except profiler.ProfilerBusy as e:
+        return JsonResponse({"error": str(e)}, status=409)
+
+    if request.GET.get('format') == 'collapsed':
+        return HttpResponse(result["stacks"] + "\n", content_type='text/plain')
+    return JsonResponse(result)
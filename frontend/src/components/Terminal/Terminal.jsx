@@ -6,6 +6,8 @@ import useCommandHistory from '../../hooks/useCommandHistory';
 import useKeyboardHandler from '../../hooks/useKeyboardHandler';
 import TerminalOutput from './TerminalOutput';
 import { WEBSOCKET_URL } from '../../utils/constants';
+import { getWorkspaceIdentity } from '../../utils/terminalUtils';
+import { exportWorkspace, importWorkspace } from '../../utils/workspaceTransfer';
 
 const Terminal = ({ 
   width = 80, 
@@ -20,15 +22,19 @@ const Terminal = ({
     console.log('Generated session ID:', id);
     return id;
   });
+  const [identity] = useState(getWorkspaceIdentity);
   const [hasSelection, setHasSelection] = useState(false);
   const [selectedText, setSelectedText] = useState('');
   const lastProcessedMessageRef = useRef(null);
+  const uploadInputRef = useRef(null);
 
   // Initialize hooks
-  const { connectionStatus, sendMessage, lastMessage, reconnect } = useWebSocket(WEBSOCKET_URL, sessionId);
+  const { connectionStatus, sendMessage, lastMessage, transferToken, reconnect } = useWebSocket(WEBSOCKET_URL, sessionId, identity);
   
   const {
-    lines,
+    lineStore,
+    version,
+    isAtBottomRef,
     currentLine,
     cursorPosition,
     addOutput,
@@ -187,6 +193,28 @@ const Terminal = ({
     }
   }, []);
 
+  // Workspace download/upload handlers
+  const handleExport = useCallback(async (event) => {
+    event.stopPropagation();
+    try {
+      await exportWorkspace(sessionId, transferToken);
+    } catch (error) {
+      addOutput(`Error: ${error.message}`, 'error');
+    }
+  }, [sessionId, transferToken, addOutput]);
+
+  const handleImport = useCallback(async (event) => {
+    const file = event.target.files?.[0];
+    event.target.value = '';
+    if (!file) return;
+    try {
+      const { files } = await importWorkspace(sessionId, transferToken, file);
+      addOutput(`Uploaded ${files} file${files === 1 ? '' : 's'} from ${file.name}`, 'output');
+    } catch (error) {
+      addOutput(`Error: ${error.message}`, 'error');
+    }
+  }, [sessionId, transferToken, addOutput]);
+
   // Initialize keyboard handler
   const { handleKeyDown, handleKeyPress, handlePaste } = useKeyboardHandler({
     onCommand: handleCommand,
@@ -272,11 +300,38 @@ const Terminal = ({
             Retry
           </button>
         )}
+        {connectionStatus === 'connected' && transferToken && (
+          <>
+            <button
+              onClick={handleExport}
+              className="ml-2 px-2 py-1 bg-gray-700 hover:bg-gray-600 text-white text-xs rounded"
+              title="Download workspace as .tar.gz"
+            >
+              Download
+            </button>
+            <button
+              onClick={(event) => { event.stopPropagation(); uploadInputRef.current?.click(); }}
+              className="ml-2 px-2 py-1 bg-gray-700 hover:bg-gray-600 text-white text-xs rounded"
+              title="Upload a .tar or .tar.gz into the workspace"
+            >
+              Upload
+            </button>
+            <input
+              ref={uploadInputRef}
+              type="file"
+              accept=".tar,.tar.gz,.tgz"
+              className="hidden"
+              onChange={handleImport}
+            />
+          </>
+        )}
       </div>
 
       {/* Terminal output */}
       <TerminalOutput
-        lines={lines}
+        lineStore={lineStore}
+        version={version}
+        isAtBottomRef={isAtBottomRef}
         currentLine={currentLine}
         cursorPosition={cursorPosition}
         showCursor={connectionStatus === 'connected'}
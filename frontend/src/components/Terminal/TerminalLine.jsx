@@ -1,6 +1,7 @@
 // Enhanced terminal line component with improved text formatting and readability
 import React, { memo } from 'react';
 import { parseAnsi, segmentsToReactStyles } from '../../utils/ansiParser';
+import { formatOutputText } from '../../utils/terminalUtils';
 import TerminalCursor from './TerminalCursor';
 
 const TerminalLine = memo(({ 
@@ -9,32 +10,14 @@ const TerminalLine = memo(({
   isCurrentLine = false,
   cursorPosition = 0,
   showCursor = false,
+  segments = null,
+  rowHeight = null,
+  rows = 1,
+  columns = 0,
   onTextSelect,
   className = ''
 }) => {
   
-  // Format content for better readability
-  const formatContent = (text) => {
-    if (!text) return text;
-    
-    // Handle long text with better word wrapping and spacing
-    return text
-      // Add proper spacing around punctuation for better readability
-      .replace(/([.!?])\s*([A-Z])/g, '$1\n\n$2')
-      // Add spacing after colons in structured text
-      .replace(/([a-zA-Z]):\s*([A-Z])/g, '$1:\n  $2')
-      // Handle bullet points and lists better
-      .replace(/^\s*[-•]\s+/gm, '\n• ')
-      // Handle numbered lists
-      .replace(/^\s*(\d+\.)\s+/gm, '\n$1 ')
-      // Improve spacing around headers or important sections
-      .replace(/^([A-Z][A-Z\s]+):$/gm, '\n$1:\n')
-      // Add breathing room around key sections
-      .replace(/(Key Ingredients|How the|Stage \d+|Condition [AB])/g, '\n$1')
-      // Clean up excessive newlines
-      .replace(/\n{3,}/g, '\n\n');
-  };
-
   const renderContent = () => {
     if (!content && !isCurrentLine) {
       return <span style={{ height: '1.4em', display: 'inline-block' }}>&nbsp;</span>;
@@ -67,21 +50,32 @@ const TerminalLine = memo(({
       );
     }
 
-    // Format content for better readability
-    const formattedContent = type === 'output' ? formatContent(content) : content;
-    
-    // For output lines, parse ANSI sequences and apply proper styling
-    const segments = parseAnsi(formattedContent);
-    
-    if (segments.length === 0) {
-      return <span style={{ height: '1.4em', display: 'inline-block' }}>&nbsp;</span>;
-    }
+    // Scrollback rows arrive with segments already parsed and cached by the line store
+    let styledSegments = segments;
+    if (!styledSegments) {
+      // Format content for better readability
+      const formattedContent = type === 'output' ? formatOutputText(content) : content;
+      
+      // For output lines, parse ANSI sequences and apply proper styling
+      const parsed = parseAnsi(formattedContent);
+      
+      if (parsed.length === 0) {
+        return <span style={{ height: '1.4em', display: 'inline-block' }}>&nbsp;</span>;
+      }
 
-    // Convert segments to React-compatible styles
-    const styledSegments = segmentsToReactStyles(segments);
+      // Convert segments to React-compatible styles
+      styledSegments = segmentsToReactStyles(parsed);
+    }
     
     return (
-      <div style={{ 
+      <div style={rowHeight ? {
+        // Wrap at exactly `columns` characters, spaces included, so the line
+        // fills the number of rows the line store counted for it
+        whiteSpace: 'break-spaces',
+        wordBreak: 'break-all',
+        width: columns ? `${columns}ch` : 'auto',
+        lineHeight: 'inherit'
+      } : {
         whiteSpace: 'pre-wrap',
         wordBreak: 'break-word',
         overflowWrap: 'break-word',
@@ -100,6 +94,9 @@ const TerminalLine = memo(({
           const isHeader = /^[A-Z][A-Z\s]+:$|^Stage \d+:|^Condition [AB]:/.test(text);
           const isBulletPoint = /^•\s/.test(text);
           const isNumberedPoint = /^\d+\.\s/.test(text);
+          // Fixed-height scrollback rows keep header and list colors but not the extra size and spacing
+          const isBlockHeader = isHeader && !rowHeight;
+          const isIndented = (isBulletPoint || isNumberedPoint) && !rowHeight;
           
           return (
             <span 
@@ -107,16 +104,16 @@ const TerminalLine = memo(({
               style={{
                 ...segment.reactStyle,
                 fontFamily: 'inherit',
-                fontSize: isHeader ? '16px' : 'inherit',
+                fontSize: isBlockHeader ? '16px' : 'inherit',
                 fontWeight: isHeader ? 'bold' : segment.reactStyle?.fontWeight || 'normal',
                 color: isHeader ? '#00d4ff' : 
                        isBulletPoint || isNumberedPoint ? '#90ee90' : 
                        segment.reactStyle?.color || '#e5e5e5',
                 lineHeight: 'inherit',
-                marginLeft: (isBulletPoint || isNumberedPoint) ? '16px' : '0',
-                display: isHeader ? 'block' : 'inline',
-                marginTop: isHeader ? '12px' : '0',
-                marginBottom: isHeader ? '8px' : '0'
+                marginLeft: isIndented ? '16px' : '0',
+                display: isBlockHeader ? 'block' : 'inline',
+                marginTop: isBlockHeader ? '12px' : '0',
+                marginBottom: isBlockHeader ? '8px' : '0'
               }}
             >
               {text || '\u00A0'}
@@ -128,6 +125,22 @@ const TerminalLine = memo(({
   };
 
   const getLineStyles = () => {
+    const styles = getTypeStyles();
+    if (!rowHeight) return styles;
+
+    // Virtualized lines must be exactly as many rows tall as the line store counted
+    return {
+      ...styles,
+      height: `${rowHeight * rows}px`,
+      minHeight: 0,
+      lineHeight: `${rowHeight}px`,
+      paddingTop: 0,
+      paddingBottom: 0,
+      overflow: 'hidden'
+    };
+  };
+
+  const getTypeStyles = () => {
     const baseStyles = {
       minHeight: '1.6em',
       lineHeight: '1.6',
@@ -202,6 +215,10 @@ export default React.memo(TerminalLine, (prevProps, nextProps) => {
     prevProps.isCurrentLine === nextProps.isCurrentLine &&
     prevProps.cursorPosition === nextProps.cursorPosition &&
     prevProps.showCursor === nextProps.showCursor &&
+    prevProps.segments === nextProps.segments &&
+    prevProps.rowHeight === nextProps.rowHeight &&
+    prevProps.rows === nextProps.rows &&
+    prevProps.columns === nextProps.columns &&
     prevProps.className === nextProps.className
   );
 });
\ No newline at end of file
@@ -1,57 +1,88 @@
-// Enhanced output display component with better styling and optimized scrolling
-import React, { useRef, useEffect, useCallback, useMemo } from 'react';
+// Enhanced output display component with windowed rendering of the scrollback
+import React, { useRef, useState, useEffect, useLayoutEffect, useCallback, useMemo } from 'react';
 import TerminalLine from './TerminalLine';
+import { getLineSegments } from '../../utils/lineStore';
+
+// Every scrollback row has the same height; long lines wrap onto several rows
+const ROW_HEIGHT = 22; // px
+const OVERSCAN_ROWS = 10;
+// Container padding (16px a side) plus the widest line style's padding and border
+const CONTENT_INSET = 32 + 20; // px
+const MEASURE_CHARS = 100;
 
 const TerminalOutput = ({ 
-  lines = [],
+  lineStore,
+  version = 0,
   currentLine = '',
   cursorPosition = 0,
   showCursor = true,
+  isAtBottomRef,
   onScroll,
   onTextSelect,
   className = ''
 }) => {
   const outputRef = useRef(null);
-  const isUserScrollingRef = useRef(false);
-  const scrollTimeoutRef = useRef(null);
-  const lastLinesLength = useRef(lines.length);
+  const scrollFrameRef = useRef(null);
+  const [scrollTop, setScrollTop] = useState(0);
+  const measureRef = useRef(null);
+  const [viewportHeight, setViewportHeight] = useState(0);
+  const [columns, setColumns] = useState(0);
+  const totalRows = lineStore ? lineStore.rowCount : 0;
+
+  // Track the viewport size so we know how many rows fit, and how many characters fit in a row
+  useEffect(() => {
+    const element = outputRef.current;
+    if (!element) return undefined;
+
+    const measure = () => {
+      setViewportHeight(element.clientHeight);
+      const charWidth = measureRef.current.getBoundingClientRect().width / MEASURE_CHARS;
+      if (charWidth > 0 && lineStore) {
+        const fit = Math.max(1, Math.floor((element.clientWidth - CONTENT_INSET) / charWidth));
+        lineStore.setColumns(fit);
+        setColumns(fit);
+      }
+    };
+    measure();
+    const observer = new ResizeObserver(measure);
+    observer.observe(element);
+    return () => observer.disconnect();
+  }, [lineStore]);
+
+  useEffect(() => () => {
+    if (scrollFrameRef.current !== null) {
+      cancelAnimationFrame(scrollFrameRef.current);
+    }
+  }, []);
 
   const handleScroll = useCallback((event) => {
     const element = event.target;
-    const { scrollTop, scrollHeight, clientHeight } = element;
-    
-    // Mark that user is manually scrolling
-    isUserScrollingRef.current = true;
-    
-    // Clear existing timeout
-    if (scrollTimeoutRef.current) {
-      clearTimeout(scrollTimeoutRef.current);
-    }
-    
-    // Reset user scrolling flag after a delay
-    scrollTimeoutRef.current = setTimeout(() => {
-      isUserScrollingRef.current = false;
-    }, 200); // Increased delay to prevent premature auto-scroll
+    const { scrollTop: top, scrollHeight, clientHeight } = element;
 
     // Only call onScroll if it's provided
     if (onScroll) {
-      onScroll(scrollTop, scrollHeight, clientHeight);
+      onScroll(top, scrollHeight, clientHeight);
     }
-  }, [onScroll]);
 
-  const scrollToBottom = useCallback(() => {
-    if (outputRef.current && !isUserScrollingRef.current) {
-      outputRef.current.scrollTop = outputRef.current.scrollHeight;
+    // Re-window at most once per frame however fast the wheel fires
+    if (scrollFrameRef.current === null) {
+      scrollFrameRef.current = requestAnimationFrame(() => {
+        scrollFrameRef.current = null;
+        if (outputRef.current) {
+          setScrollTop(outputRef.current.scrollTop);
+        }
+      });
     }
-  }, []);
+  }, [onScroll]);
 
-  // Only auto-scroll when new lines are actually added
-  useEffect(() => {
-    if (lines.length > lastLinesLength.current) {
-      lastLinesLength.current = lines.length;
-      scrollToBottom();
-    }
-  }, [lines.length, scrollToBottom]);
+  // Stick to the bottom when new output arrives, unless the user scrolled up
+  useLayoutEffect(() => {
+    const element = outputRef.current;
+    if (!element || (isAtBottomRef && !isAtBottomRef.current)) return;
+
+    element.scrollTop = element.scrollHeight;
+    setScrollTop(element.scrollTop);
+  }, [version, columns, isAtBottomRef]);
 
   // Handle text selection across multiple lines
   const handleTextSelect = useCallback((event, content) => {
@@ -60,17 +91,37 @@ const TerminalOutput = ({
     }
   }, [onTextSelect]);
 
-  // Memoize rendered lines to prevent unnecessary re-renders
-  const renderedLines = useMemo(() => {
-    return lines.map((line) => (
-      <TerminalLine
-        key={line.id}
-        content={line.content}
-        type={line.type}
-        onTextSelect={handleTextSelect}
-      />
-    ));
-  }, [lines, handleTextSelect]);
+  // Only the lines intersecting the viewport (plus overscan) are rendered
+  const firstRow = Math.max(0, Math.floor(scrollTop / ROW_HEIGHT) - OVERSCAN_ROWS);
+  const lastRow = Math.ceil((scrollTop + viewportHeight) / ROW_HEIGHT) + OVERSCAN_ROWS;
+
+  const { renderedLines, offsetRows } = useMemo(() => {
+    const lines = [];
+    if (!lineStore || lineStore.length === 0) {
+      return { renderedLines: lines, offsetRows: 0 };
+    }
+
+    // The first line may start above firstRow if it wraps onto several rows
+    const firstLine = lineStore.indexAtRow(firstRow);
+    for (let index = firstLine; index < lineStore.length && lineStore.rowOf(index) < lastRow; index++) {
+      const line = lineStore.get(index);
+      lines.push(
+        <TerminalLine
+          key={line.id}
+          content={line.content}
+          type={line.type}
+          segments={getLineSegments(line)}
+          rowHeight={ROW_HEIGHT}
+          rows={line.rows}
+          columns={columns}
+          onTextSelect={handleTextSelect}
+        />
+      );
+    }
+    return { renderedLines: lines, offsetRows: lineStore.rowOf(firstLine) };
+    // version changes whenever the store's contents do
+    // eslint-disable-next-line react-hooks/exhaustive-deps
+  }, [lineStore, version, columns, firstRow, lastRow, handleTextSelect]);
 
   // Memoize current line to prevent unnecessary re-renders
   const currentLineComponent = useMemo(() => (
@@ -85,6 +136,7 @@ const TerminalOutput = ({
   ), [currentLine, cursorPosition, showCursor, handleTextSelect]);
 
   const outputStyles = {
+    position: 'relative',
     width: '100%',
     height: '100%',
     overflowY: 'auto',
@@ -96,8 +148,7 @@ const TerminalOutput = ({
     fontSize: '14px',
     lineHeight: '1.4',
     scrollbarWidth: 'thin',
-    scrollbarColor: '#333 #000',
-    scrollBehavior: 'smooth'
+    scrollbarColor: '#333 #000'
   };
 
   // Custom scrollbar styles for webkit browsers
@@ -126,8 +177,21 @@ const TerminalOutput = ({
         style={outputStyles}
         onScroll={handleScroll}
       >
-        {/* Render all output lines with memoization */}
-        {renderedLines}
+        {/* Sets the width of one character, so we know how many fit in a row */}
+        <span
+          ref={measureRef}
+          aria-hidden="true"
+          style={{ position: 'absolute', top: 0, left: 0, visibility: 'hidden', whiteSpace: 'pre', pointerEvents: 'none' }}
+        >
+          {'0'.repeat(MEASURE_CHARS)}
+        </span>
+
+        {/* Full-height spacer keeps the scrollbar honest; only visible lines are mounted */}
+        <div style={{ position: 'relative', height: `${totalRows * ROW_HEIGHT}px` }}>
+          <div style={{ position: 'absolute', top: `${offsetRows * ROW_HEIGHT}px`, left: 0, right: 0 }}>
+            {renderedLines}
+          </div>
+        </div>
         
         {/* Render current input line */}
         {currentLineComponent}
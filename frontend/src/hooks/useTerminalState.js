@@ -1,82 +1,83 @@
 // Enhanced terminal state management hook with better ANSI handling
 import { useState, useCallback, useRef, useEffect } from 'react';
 import { MAX_OUTPUT_LINES } from '../utils/constants';
-import { parseAnsi, stripAnsi } from '../utils/ansiParser';
+import { stripAnsi } from '../utils/ansiParser';
+import { LineStore } from '../utils/lineStore';
+import { formatOutputText } from '../utils/terminalUtils';
+
+const CLEAR_SCREEN_RE = /\x1b\[2J/;
+// Formatting may add line breaks, and a carriage return is displayed as one too
+const ROW_BREAK_RE = /\r\n|\r|\n/;
+
+// Turn one raw output message into display rows
+const toRows = (output, type) => {
+  // Split output by newlines to create separate lines
+  const outputLines = output.split('\n');
+  // Skip empty last line from splitting
+  if (outputLines.length > 1 && outputLines[outputLines.length - 1] === '') outputLines.pop();
+
+  const rows = [];
+  for (const line of outputLines) {
+    // Format content for better readability, then break it into fixed-height rows
+    const formatted = type === 'output' ? formatOutputText(line) : line;
+    for (const row of formatted.split(ROW_BREAK_RE)) {
+      rows.push(row);
+    }
+  }
+  return rows;
+};
 
 const useTerminalState = () => {
-  const [lines, setLines] = useState([]);
+  // Scrollback lives in a mutable store; `version` is the only React state it drives
+  const storeRef = useRef(null);
+  if (storeRef.current === null) {
+    storeRef.current = new LineStore(MAX_OUTPUT_LINES);
+  }
+  const [version, setVersion] = useState(0);
   const [currentLine, setCurrentLine] = useState('');
   const [cursorPosition, setCursorPosition] = useState(0);
-  const [scrollPosition, setScrollPosition] = useState(0);
-  const [isAtBottom, setIsAtBottom] = useState(true);
-  const lineIdCounter = useRef(0);
+  const scrollPositionRef = useRef(0);
+  const isAtBottomRef = useRef(true);
+  const pendingRef = useRef([]);
+  const frameRef = useRef(null);
+
+  // Apply everything received since the last frame in one pass and one render
+  const flushPending = useCallback(() => {
+    frameRef.current = null;
+    const store = storeRef.current;
+    const pending = pendingRef.current;
+    pendingRef.current = [];
+
+    for (const { output, type } of pending) {
+      // Handle control sequences that might clear the screen
+      if (CLEAR_SCREEN_RE.test(output)) {
+        store.clear();
+        const cleanOutput = stripAnsi(output.replace(/\x1b\[2J|\x1b\[H\x1b\[2J/g, ''));
+        if (cleanOutput.trim()) {
+          store.append(toRows(cleanOutput, type), type);
+        }
+        continue;
+      }
+      store.append(toRows(output, type), type);
+    }
 
-  const generateLineId = () => {
-    return `line-${lineIdCounter.current++}`;
-  };
+    setVersion(store.version);
+  }, []);
 
   const addOutput = useCallback((output, type = 'output') => {
     if (!output && output !== '') return;
 
-    // Handle control sequences that might clear the screen
-    const segments = parseAnsi(output);
-    const hasScreenClear = segments.some(seg => seg.controls?.clearScreen);
-
-    if (hasScreenClear) {
-      // Clear the screen and continue with remaining output
-      setLines([]);
-      const cleanOutput = stripAnsi(output.replace(/\x1b\[2J|\x1b\[H\x1b\[2J/g, ''));
-      if (cleanOutput.trim()) {
-        const newLine = {
-          id: generateLineId(),
-          content: cleanOutput,
-          type: type,
-          timestamp: new Date()
-        };
-        setLines([newLine]);
-      }
-      return;
+    pendingRef.current.push({ output, type });
+    if (frameRef.current === null) {
+      frameRef.current = requestAnimationFrame(flushPending);
     }
+  }, [flushPending]);
 
-    // Split output by newlines to create separate lines
-    const outputLines = output.split('\n');
-    
-    const newLines = [];
-    
-    outputLines.forEach((lineContent, index) => {
-      // Skip empty last line from splitting
-      if (index === outputLines.length - 1 && lineContent === '') return;
-      
-      const newLine = {
-        id: generateLineId(),
-        content: lineContent,
-        type: type,
-        timestamp: new Date()
-      };
-      newLines.push(newLine);
-    });
-
-    if (newLines.length > 0) {
-      setLines(prevLines => {
-        const updatedLines = [...prevLines, ...newLines];
-        // Limit the number of lines to prevent memory issues
-        if (updatedLines.length > MAX_OUTPUT_LINES) {
-          return updatedLines.slice(-MAX_OUTPUT_LINES);
-        }
-        return updatedLines;
-      });
-
-      // Auto-scroll to bottom if user was already at bottom
-      if (isAtBottom) {
-        setTimeout(() => {
-          const terminalOutput = document.querySelector('.terminal-output');
-          if (terminalOutput) {
-            terminalOutput.scrollTop = terminalOutput.scrollHeight;
-          }
-        }, 10);
-      }
+  useEffect(() => () => {
+    if (frameRef.current !== null) {
+      cancelAnimationFrame(frameRef.current);
     }
-  }, [isAtBottom]);
+  }, []);
 
   const addPrompt = useCallback((prompt) => {
     if (prompt && prompt.trim()) {
@@ -85,11 +86,13 @@ const useTerminalState = () => {
   }, [addOutput]);
 
   const clearScreen = useCallback(() => {
-    setLines([]);
+    pendingRef.current = [];
+    storeRef.current.clear();
+    setVersion(storeRef.current.version);
     setCurrentLine('');
     setCursorPosition(0);
-    setScrollPosition(0);
-    setIsAtBottom(true);
+    scrollPositionRef.current = 0;
+    isAtBottomRef.current = true;
   }, []);
 
   const updateCurrentLine = useCallback((line) => {
@@ -161,45 +164,26 @@ const useTerminalState = () => {
     return command.trim();
   }, []);
 
-  // Handle scroll position tracking
+  // Handle scroll position tracking; refs only, so scrolling never re-renders the terminal
   const handleScroll = useCallback((scrollTop, scrollHeight, clientHeight) => {
-    setScrollPosition(scrollTop);
-    const isNearBottom = scrollTop + clientHeight >= scrollHeight - 10;
-    setIsAtBottom(isNearBottom);
+    scrollPositionRef.current = scrollTop;
+    isAtBottomRef.current = scrollTop + clientHeight >= scrollHeight - 10;
   }, []);
 
+  // TerminalOutput sticks to the bottom on its own; this just re-arms that behaviour
   const scrollToBottom = useCallback(() => {
-    const terminalOutput = document.querySelector('.terminal-output');
-    if (terminalOutput) {
-      terminalOutput.scrollTop = terminalOutput.scrollHeight;
-      setIsAtBottom(true);
-    }
+    isAtBottomRef.current = true;
+    storeRef.current.touch();
+    setVersion(storeRef.current.version);
   }, []);
 
-  // Auto-scroll when new content is added and user is at bottom
-  // Use ref to avoid re-triggering effect on every scroll
-  const linesLengthRef = useRef(lines.length);
-  
-  useEffect(() => {
-    // Only trigger scroll if lines actually changed
-    if (linesLengthRef.current !== lines.length) {
-      linesLengthRef.current = lines.length;
-      
-      if (isAtBottom && lines.length > 0) {
-        const timer = setTimeout(() => {
-          scrollToBottom();
-        }, 50);
-        return () => clearTimeout(timer);
-      }
-    }
-  }, [lines.length, isAtBottom, scrollToBottom]);
-
   return {
-    lines,
+    lineStore: storeRef.current,
+    version,
     currentLine,
     cursorPosition,
-    scrollPosition,
-    isAtBottom,
+    scrollPositionRef,
+    isAtBottomRef,
     addOutput,
     addPrompt,
     clearScreen,
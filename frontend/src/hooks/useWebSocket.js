@@ -1,14 +1,21 @@
 // WebSocket connection management hook
 import { useState, useEffect, useRef, useCallback } from 'react';
-import { RECONNECT_INTERVAL, MAX_RECONNECT_ATTEMPTS } from '../utils/constants';
+import { flushSync } from 'react-dom';
+import { RECONNECT_INTERVAL, MAX_RECONNECT_ATTEMPTS, SERVER_RESTART_CLOSE_CODE } from '../utils/constants';
+import { COMPRESSION_DICTIONARY_ID } from '../utils/compressionDictionary';
+import { FrameInflater, isCompressionSupported } from '../utils/frameInflater';
 
-const useWebSocket = (url, sessionId) => {
+const useWebSocket = (url, sessionId, identity = null) => {
   const [connectionStatus, setConnectionStatus] = useState('disconnected');
   const [lastMessage, setLastMessage] = useState(null);
+  // Secret the server issues each connection for workspace export/import
+  const [transferToken, setTransferToken] = useState(null);
   const wsRef = useRef(null);
   const reconnectTimeoutRef = useRef(null);
   const reconnectAttemptsRef = useRef(0);
   const shouldReconnectRef = useRef(true);
+  // Proves to the next server that this tab owns the session after a rolling restart
+  const resumeTokenRef = useRef(null);
 
   const connect = useCallback(() => {
     // Don't create multiple connections
@@ -27,9 +34,24 @@ const useWebSocket = (url, sessionId) => {
     setConnectionStatus('connecting');
     
     try {
-      const wsUrl = sessionId ? `${url}?session=${sessionId}` : url;
+      let wsUrl = sessionId ? `${url}?session=${sessionId}` : url;
+      if (sessionId && identity) {
+        wsUrl += `&identity=${encodeURIComponent(identity)}`;
+      }
+      // Large frames then arrive as binary pieces of one deflate stream
+      const inflater = sessionId && isCompressionSupported() ? new FrameInflater() : null;
+      if (inflater) {
+        wsUrl += `&compress=deflate&dict=${COMPRESSION_DICTIONARY_ID}`;
+      }
       console.log('Creating WebSocket connection to:', wsUrl);
+      if (sessionId && resumeTokenRef.current) {
+        // Added after logging: the token is a secret
+        wsUrl += `&resume=${encodeURIComponent(resumeTokenRef.current)}`;
+      }
       wsRef.current = new WebSocket(wsUrl);
+      wsRef.current.binaryType = 'arraybuffer';
+      // Inflating is async; chain messages so a small text frame can't overtake a compressed one
+      let pending = Promise.resolve();
 
       wsRef.current.onopen = () => {
         setConnectionStatus('connected');
@@ -37,24 +59,55 @@ const useWebSocket = (url, sessionId) => {
         console.log('WebSocket connected successfully');
       };
 
-      wsRef.current.onmessage = (event) => {
+      const handleMessage = async (raw) => {
         try {
-          const data = JSON.parse(event.data);
+          const text = typeof raw === 'string' ? raw : await inflater.push(raw);
+          const data = JSON.parse(text);
+          // Answer heartbeats directly; they are not terminal output
+          if (data.type === 'ping') {
+            wsRef.current?.send(JSON.stringify({ type: 'pong', ts: data.ts }));
+            return;
+          }
+          if (data.type === 'session') {
+            setTransferToken(data.transfer_token || null);
+            resumeTokenRef.current = data.resume_token || null;
+            return;
+          }
           console.log('Received WebSocket message:', data);
-          setLastMessage(data);
+          // Several inflated frames can resolve in one tick; render each, or all but the last are lost
+          flushSync(() => setLastMessage(data));
         } catch (error) {
-          console.error('Failed to parse WebSocket message:', error, 'Raw data:', event.data);
+          console.error('Failed to parse WebSocket message:', error, 'Raw data:', raw);
           setLastMessage({ error: 'Failed to parse message' });
         }
       };
 
+      wsRef.current.onmessage = (event) => {
+        pending = pending.then(() => handleMessage(event.data));
+      };
+
       wsRef.current.onclose = (event) => {
         console.log('WebSocket closed:', event.code, event.reason, 'Was clean:', event.wasClean);
         
+        // Release the inflater once frames already received have been handled
+        pending.then(() => inflater?.close());
+        
         // Clear the reference immediately
         const wasOpen = wsRef.current !== null;
         wsRef.current = null;
         setConnectionStatus('disconnected');
+        setTransferToken(null);
+        
+        // A rolling restart: the session is waiting for us on the new server, so don't back off
+        if (event.code === SERVER_RESTART_CLOSE_CODE && shouldReconnectRef.current) {
+          reconnectAttemptsRef.current = 0;
+          reconnectTimeoutRef.current = setTimeout(() => {
+            if (shouldReconnectRef.current) {
+              connect();
+            }
+          }, 250);
+          return;
+        }
         
         // Only attempt to reconnect if the connection was established and we should reconnect
         if (wasOpen && shouldReconnectRef.current && event.code !== 1000 && reconnectAttemptsRef.current < MAX_RECONNECT_ATTEMPTS) {
@@ -85,7 +138,7 @@ const useWebSocket = (url, sessionId) => {
       setConnectionStatus('error');
       setLastMessage({ error: 'Failed to create connection' });
     }
-  }, [url, sessionId]);
+  }, [url, sessionId, identity]);
 
   const sendMessage = useCallback((message) => {
     if (wsRef.current?.readyState === WebSocket.OPEN) {
@@ -159,6 +212,7 @@ const useWebSocket = (url, sessionId) => {
     connectionStatus,
     sendMessage,
     lastMessage,
+    transferToken,
     reconnect,
     disconnect
   };
@@ -0,0 +1,4 @@
+// Generated by `python manage.py build_compression_dict`; do not edit.
+// Must match backend/terminal/compression_dict.txt byte for byte.
+export const COMPRESSION_DICTIONARY_ID = 'f2748fb17e387411';
+export const COMPRESSION_DICTIONARY = ".5   0:\\n      |                                     [01   1.  (use \\\"git <file>...\\\"<file>...\\\" }' token\\n     3.-1: processed .4   0:.7   0:31mmodified:   Makefile[m[31mmodified:   Makefile[\\n      |                                      [01\\n      |                       [01 INFO worker-\"tail log.txt.txt\\n2024-05txt\\n2024-05- ';' before before '}' you mean '' before '}';' before '}' token\\n;' before 'Kerror: [m[[Kerror: [mbefore '}'       |                                        [01;.3   0:K\\n      |                                        [[31mmodified:   data.[K[J\"}[m[K[Jm[K[J\"01;34mMakefile[0m\\n      |                      [01; a cast\\n  K\\n      |                      [.1   0:\\n      |                                        [01\\t[31mmodified:   Makefilels -la\\ntotal|                                            [01;31m|                             [01;31m      |                    [01; (first use  [m[Kunused  use in this' [-Wunused-: [m[KunusedK\\n      |                    [use in this \\n      |                      [01\\t[31mmodified:   data commit:\\n  ( what will be: \"git status\\\" to update add <file>...file>...\\\" togit add <fileuse \\\"git addwhat will be  log.txt\\n2024-3: processed log.txt\\n2024-tail log.txt\\n|                              [01;31m 'printf'?\\n'prinf'; did\\n      |                    [01prinf'; did       |                                            [01;.8   0:K\\n      |                                            [[m[K[s):[1m |                           [01;31m31mmodified:   data.csv\\n      |                                            [01|                                         [01;31m 2 learner learner 3 learner learner 4 learner learner of 'strlen'1 of 'strlen2 learner learner 3 learner learner 36m[Knote: [4 learner learner ;36m[Knote: of 'strlen' .2   0:      |                             [01; WARNING worker-K\\n      |                             ['printf'?\\n  (first use infirst use in  items\\n2024-05items\\n2024-05- \"git status\\n for commit:\\n      |                              [01;K\\n      |                              [\\n      |                             [01 1 learner learner1 learner learner [m\\n\\t[31mmodifiedm\\n\\t[31mmodified:      |                                         [01; did you mean31m[Kerror: [;31m[Kerror: K\\n      |                                         [did you mean       |                           [01;K\\n      |                           [(s):[1m.9   0:K\\n[01m[Ksrc[m[K\\n      \\n      |                              [01\\n[01m[Ksrc/int count = m[K\\n      |\\n      |                                         [01.6   0: [m[Kpassing 01;36m[Knote:: [m[KpassingKwarning: [m[[01;36m[Knote[Kwarning: [m\\n      |                           [01tmp' [-Wunused not staged for to update what\"git status\\nOn...\\\" to updatecommit:\\n  (usefor commit:\\n  git status\\nOn not staged for to update what |                                [01;31m[m[K\\n    [m[Kimplicit  mean 'printf' of function '01;31m[Kerror:: [m[KimplicitKexpected ';' [01;31m[Kerror[Kexpected ';'mean 'printf'?Ksrc/module0.c:(value[01;31mvalue[01;31m[worker-2: processedworker-4: processed|                                           [01;31m [m[Kexpected  argument 1 of: [m[Kexpected[m[Kexpected 'argument 1 of m[Kexpected '; be committed)\\n committed)\\n\\t[On branch main\\n\\nOn branch main variable 'tmp'[Ksrc/module0.cvariable 'tmp'       |                                [01;K\\n      |                                [worker-1: processed learner learner  - 10:00%Cpu(s):- 10:00:Cpu(s):[Ksrc/module6.c:[Ksrc/module6.c\\n      |                                [01      |                                           [01;K\\n      |                                           [|                                 [01;31m update what willbe committed)\\n\\tupdate what will  'strlen' makes without a cast'strlen' makes 35m[Kwarning: [;35m[Kwarning: Ksrc/module1.c:Ksrc/module2.c:Ksrc/module5.c:[Ksrc/module1.c[Ksrc/module2.c[Ksrc/module5.c\\n      |                                           [01\\n$\"}this function)\\n  Ksrc/module3.c:[Ksrc/module3.cyou mean 'printfworker-3: processed main\\nChanges not staged for commit status\\nOn branch will be committed)\\n\\t[31mmodified:main\\nChanges not staged for commit:status\\nOn branch will be committed)Ksrc/module4.c:[Ksrc/module4.c in this function this function)\\n01m[Ksrc/module0.[01m[Ksrc/module0in this function)      |                                 [01;' makes pointer 01;35m[Kwarning:K\\n      |                                 [[01;35m[Kwarningwithout a cast\\nm[K\\n[1m \"[mtop - Mem :[1m [msy[K\\n [mus,[1m\": \"[mtop\"[mtop - ,[1m   1 : \"[mtop K\\n%Cpu(s[1m   1 [[K\\n%Cpu(\\n      |                                 [01\\n%Cpu(s) function 'prinf'01m[Ksrc/module6.[01m[Ksrc/module6function 'prinf';|                                  [01;31mChanges not staged      int count = = compute(value count = compute |     int count= compute(value[count = compute(|     int count 01m[Ksrc/module1.01m[Ksrc/module2.01m[Ksrc/module5.[01m[Ksrc/module1[01m[Ksrc/module2[01m[Ksrc/module5of function 'prinf01m[Ksrc/module3.[01m[Ksrc/module3\\nChanges not staged\\n\\t[31mmodified:   [m[K\\n        |                                  [01;K\\n      |                                  [Wunused-variable]\\n   [-Wunused-variable undeclared (first ' undeclared (first'count' undeclared K'count' undeclared[-Wunused-variable][Kunused variable '[m[Kunused variablecount' undeclared (m[Kunused variable  integer without a[K\\n[1m  [m[24;integer without a  compute(value[0101m[Ksrc/module4.[01m[Ksrc/module4compute(value[01;\\n      |                                  [01 3 days,   S  %CPU   days,  1  up 3 days\": \"[?,  1 user,3 days,  1Mem :[1m  MiB Mem :[S  %CPU  %[38;5;[mtop - 10[mus,[1m  mtop - 10:up 3 days, branch main\\nChangesbranch main\\nChanges -Wunused-variable]\\n makes pointer frommakes pointer from |                                   [01;31mKunused variable 'tmpundeclared (first use  1 user,    15927.4 [ [mfree[K\\n.4 [mtotal,4 [mtotal,[K\\nMiB Mem Kpassing argument 1 SHR S  %CPU[K\\nMiB Mem[K\\nTasks:[[K\\n[7m    [Kpassing argument 1[m[Kpassing argument[mfree[K\\n[[msy[K\\nMiB\\nMiB Mem :m[Kpassing argument msy[K\\nMiB  top      [m[top      [m[K                                             [01;31m[ node     [m[ sshd     [m[node     [m[Ksshd     [m[K|                                             [01;31m      |                                   [01;K\\n      |                                   [ from integer without pointer from integerfrom integer without pointer from integer strlen' makes pointer[?25h\"} bash     [m[ cc1      [m[ python3  [m[bash     [m[Kcc1      [m[Kpython3  [m[K\\n      |                                   [01[m[K\\n[ gcc      [m[ vim      [m[vim      [m[K    SHR S  %  %CPU  %MEM :[1m  15927 [mtotal,[1m1m  15927.4 :[1m  15927.K\\nTasks:[1m[1m  15927.4\\nTasks:[1m mfree[K\\n[7m      |                                             [01;K\\n      |                                             [[K\\n      |                                             gcc      [m[K\\n      |                                             [01 make     [m[committed)\\n\\t[31mmodifiedmake     [m[K daphne   [m[daphne   [m[K declaration of function[m[Kimplicit declarationdeclaration of function m[Kimplicit declaration  user,  load 1 [mrunning[K1 user,  loadK\\n[7m    PID\\n[7m    PID days,  1 user \"[?25l[: \"[?25lKimplicit declaration of [Kimplicit declaration of COMMAND   [m[ [mrunning[K\\n+ COMMAND   [mCOMMAND   [m[KRES    SHR S  [mrunning[K\\n%[mtotal,[1m   mtotal,[1m   1      [m[K\\n   1 [mrunning[%CPU  %MEM     %MEM     TIME+ 15927.4 [mtotal[7m    PID USERlearner   20   0       RES    SHR S  %MEM     TIME+  load average: ,  load average:1m   1 [mrunningmrunning[K\\n%Cpu USER      PR  NITIME+ COMMAND   [CPU  %MEM     TIMEPID USER      PR  PR  NI    VIRT      NI    VIRT    RESVIRT    RES    SHR user,  load average      PR  NI    VIRT    PID USER      PR7m    PID USER      USER      PR  NI         TIME+ COMMAND   MEM     TIME+ COMMANDNI    VIRT    RES     learner   20   0    VIRT    RES    SHRlearner   20   0  data\": \"[ \"data\": \", \"data\"\"data\": \"\"type\": \", \"data\":{\"type\":  \"output\", \": \"output\"\"output\", \": \"output\",output\", \"datatype\": \"output";
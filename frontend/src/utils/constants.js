@@ -2,14 +2,19 @@
 
 // WebSocket configuration
 export const WEBSOCKET_URL = import.meta.env.VITE_WS_URL;
+// HTTP API base; defaults to the host serving the WebSocket
+export const API_URL = import.meta.env.VITE_API_URL ||
+  (WEBSOCKET_URL ? WEBSOCKET_URL.replace(/^ws/, 'http').replace(/\/ws\/terminal\/?$/, '') : '');
 export const RECONNECT_INTERVAL = 3000; // 3 seconds
 export const MAX_RECONNECT_ATTEMPTS = 5;
+// Close code sent when the server hands the session to a new worker; reconnect straight away
+export const SERVER_RESTART_CLOSE_CODE = 4001;
 
 // Terminal configuration
 export const DEFAULT_TERMINAL_WIDTH = 80;
 export const DEFAULT_TERMINAL_HEIGHT = 24;
 export const MAX_HISTORY_SIZE = 1000;
-export const MAX_OUTPUT_LINES = 10000;
+export const MAX_OUTPUT_LINES = 100000;
 
 // Terminal colors (ANSI color codes)
 export const TERMINAL_COLORS = {
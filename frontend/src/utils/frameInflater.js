@@ -0,0 +1,76 @@
+// Inflates compressed terminal frames (see backend/terminal/compression.py)
+import { COMPRESSION_DICTIONARY } from './compressionDictionary';
+
+// Largest payload of one stored (uncompressed) deflate block
+const STORED_BLOCK_MAX = 65535;
+
+export const isCompressionSupported = () => typeof DecompressionStream !== 'undefined';
+
+// Raw deflate stored blocks carrying `bytes`, none marked final so the stream continues
+const storedBlocks = (bytes) => {
+  const blocks = [];
+  for (let pos = 0; pos < bytes.length; pos += STORED_BLOCK_MAX) {
+    const chunk = bytes.subarray(pos, pos + STORED_BLOCK_MAX);
+    const len = chunk.length;
+    blocks.push(new Uint8Array([0, len & 0xff, len >> 8, ~len & 0xff, (~len >> 8) & 0xff]), chunk);
+  }
+  return blocks;
+};
+
+// One connection's deflate stream: every binary message is the next piece and
+// inflates to exactly one newline-terminated JSON frame
+export class FrameInflater {
+  constructor() {
+    const stream = new DecompressionStream('deflate-raw');
+    this.writer = stream.writable.getWriter();
+    this.reader = stream.readable.getReader();
+    this.decoder = new TextDecoder();
+    this.text = '';
+    this.waiting = [];
+
+    // Preset dictionary: load it into the window, then throw away what it inflates to.
+    // Harmless if the server didn't accept our dictionary id; its stream just never refers to it.
+    const dictionary = new TextEncoder().encode(COMPRESSION_DICTIONARY);
+    this.skip = dictionary.length;
+    storedBlocks(dictionary).forEach((block) => this.writer.write(block).catch(() => {}));
+
+    this.pump();
+  }
+
+  async pump() {
+    try {
+      for (;;) {
+        const { value, done } = await this.reader.read();
+        if (done) break;
+        let bytes = value;
+        if (this.skip > 0) {
+          const dropped = Math.min(this.skip, bytes.length);
+          this.skip -= dropped;
+          bytes = bytes.subarray(dropped);
+        }
+        this.text += this.decoder.decode(bytes, { stream: true });
+        let newline;
+        while ((newline = this.text.indexOf('\n')) !== -1) {
+          const frame = this.text.slice(0, newline);
+          this.text = this.text.slice(newline + 1);
+          this.waiting.shift()?.resolve(frame);
+        }
+      }
+    } catch (error) {
+      this.waiting.splice(0).forEach(({ reject }) => reject(error));
+    }
+  }
+
+  // Resolves to the JSON text of the frame carried by one binary message
+  push(data) {
+    return new Promise((resolve, reject) => {
+      this.waiting.push({ resolve, reject });
+      this.writer.write(new Uint8Array(data)).catch(reject);
+    });
+  }
+
+  close() {
+    this.writer.abort().catch(() => {});
+    this.reader.cancel().catch(() => {});
+  }
+}
@@ -0,0 +1,152 @@
+// Append-only, chunked scrollback store for terminal output
+import { parseAnsi, segmentsToReactStyles } from './ansiParser.js';
+
+// Lines per chunk; a power of two so index lookups are a shift and a mask
+const CHUNK_BITS = 10;
+const CHUNK_SIZE = 1 << CHUNK_BITS;
+const CHUNK_MASK = CHUNK_SIZE - 1;
+const TAB_WIDTH = 8;
+
+// CSI and OSC sequences plus control characters other than tab; unlike
+// stripAnsi this keeps leading and trailing whitespace, which takes up columns
+// eslint-disable-next-line no-control-regex
+const INVISIBLE_RE = /\x1b\[[0-?]*[ -/]*[@-~]|\x1b\][^\x07\x1b]*(?:\x07|\x1b\\)?|[\x00-\x08\x0a-\x1f\x7f]/g;
+
+// Columns a line takes up once escape sequences are gone and tabs are expanded
+const displayWidth = (content) => {
+  const text = content.replace(INVISIBLE_RE, '');
+  if (!text.includes('\t')) return text.length;
+
+  let width = 0;
+  for (const char of text) {
+    width = char === '\t' ? width + TAB_WIDTH - (width % TAB_WIDTH) : width + 1;
+  }
+  return width;
+};
+
+/**
+ * Scrollback buffer that never copies existing lines.
+ *
+ * Lines are appended into fixed-size chunks and trimmed from the front once
+ * maxLines is exceeded, so adding output costs O(new lines) no matter how much
+ * history is kept. Parsed ANSI segments are computed on first render and cached
+ * on the line object.
+ *
+ * Long lines wrap onto several fixed-height rows once the view has told the
+ * store how many columns fit (setColumns). Each line records the row it starts
+ * on, counted from the last clear, so finding the line at a scroll position is
+ * a binary search.
+ */
+export class LineStore {
+  constructor(maxLines) {
+    this.maxLines = maxLines;
+    this.columns = 0; // 0 until measured: every line is one row
+    this.clear();
+  }
+
+  clear() {
+    this.chunks = [];
+    this.head = 0; // Lines already trimmed from the first chunk
+    this.length = 0;
+    this.nextRow = 0;
+    this.version = (this.version || 0) + 1;
+  }
+
+  // Mark the store changed without adding lines, so views render again
+  touch() {
+    this.version++;
+  }
+
+  rowsFor(width) {
+    return this.columns ? Math.max(1, Math.ceil(width / this.columns)) : 1;
+  }
+
+  // Re-wrap every line for a new view width; returns whether anything changed
+  setColumns(columns) {
+    if (columns === this.columns) return false;
+    this.columns = columns;
+
+    let row = this.length ? this.get(0).row : this.nextRow;
+    for (let index = 0; index < this.length; index++) {
+      const line = this.get(index);
+      line.row = row;
+      line.rows = this.rowsFor(line.width);
+      row += line.rows;
+    }
+    this.nextRow = row;
+    this.version++;
+    return true;
+  }
+
+  // Rows taken by every line still held
+  get rowCount() {
+    return this.length ? this.nextRow - this.get(0).row : 0;
+  }
+
+  // Row the line at index starts on, counted from the first line held
+  rowOf(index) {
+    return this.get(index).row - this.get(0).row;
+  }
+
+  // Index of the line covering the given row
+  indexAtRow(row) {
+    let low = 0;
+    let high = this.length - 1;
+    while (low < high) {
+      const middle = (low + high + 1) >> 1;
+      if (this.rowOf(middle) <= row) {
+        low = middle;
+      } else {
+        high = middle - 1;
+      }
+    }
+    return low;
+  }
+
+  append(contents, type = 'output') {
+    if (contents.length === 0) return;
+
+    for (const content of contents) {
+      let chunk = this.chunks[this.chunks.length - 1];
+      if (!chunk || chunk.length === CHUNK_SIZE) {
+        chunk = [];
+        this.chunks.push(chunk);
+      }
+      const width = displayWidth(content);
+      const rows = this.rowsFor(width);
+      chunk.push({ id: LineStore.nextId++, content, type, segments: null, width, row: this.nextRow, rows });
+      this.nextRow += rows;
+      this.length++;
+    }
+
+    // Trim from the front a line at a time, releasing whole chunks as they empty
+    while (this.length > this.maxLines) {
+      this.head++;
+      this.length--;
+      if (this.head === CHUNK_SIZE) {
+        this.chunks.shift();
+        this.head = 0;
+      }
+    }
+
+    this.version++;
+  }
+
+  get(index) {
+    const position = index + this.head;
+    return this.chunks[position >> CHUNK_BITS][position & CHUNK_MASK];
+  }
+}
+
+// Line ids stay unique across clears so React keys never collide
+LineStore.nextId = 0;
+
+/**
+ * Styled segments for a line, parsed once and cached
+ */
+export const getLineSegments = (line) => {
+  if (line.segments === null) {
+    line.segments = segmentsToReactStyles(parseAnsi(line.content));
+  }
+  return line.segments;
+};
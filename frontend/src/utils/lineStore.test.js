@@ -0,0 +1,64 @@
+// Run with `npm test` (node's built-in test runner, no extra dependencies)
+import { test } from 'node:test';
+import assert from 'node:assert/strict';
+import { LineStore, getLineSegments } from './lineStore.js';
+
+const contents = (store) => Array.from({ length: store.length }, (_, index) => store.get(index).content);
+
+test('appends across chunks and trims from the front', () => {
+  const store = new LineStore(1500);
+  const lines = Array.from({ length: 3000 }, (_, i) => `line ${i}`);
+  store.append(lines.slice(0, 1000));
+  store.append(lines.slice(1000));
+  assert.equal(store.length, 1500);
+  assert.deepEqual(contents(store), lines.slice(1500));
+  // Whole chunks are released once trimmed past
+  assert.ok(store.chunks.length <= Math.ceil(1500 / 1024) + 1);
+});
+
+test('ids stay unique across clears', () => {
+  const store = new LineStore(10);
+  store.append(['a', 'b']);
+  const first = store.get(1).id;
+  store.clear();
+  store.append(['c']);
+  assert.ok(store.get(0).id > first);
+  assert.equal(store.length, 1);
+});
+
+test('long lines wrap onto rows and rows map back to lines', () => {
+  const store = new LineStore(100);
+  store.append(['short', 'x'.repeat(25), '\tand a tab', '\x1b[31m' + 'y'.repeat(10) + '\x1b[0m']);
+  assert.equal(store.rowCount, 4);
+
+  assert.ok(store.setColumns(10));
+  assert.equal(store.setColumns(10), false);
+  // 5 chars, 25 chars, 8 + 9 columns after tab expansion, 10 chars once escapes are stripped
+  assert.deepEqual(Array.from({ length: store.length }, (_, i) => store.get(i).rows), [1, 3, 2, 1]);
+  assert.equal(store.rowCount, 7);
+  assert.deepEqual([0, 1, 3, 4, 5, 6].map((row) => store.indexAtRow(row)), [0, 1, 1, 2, 2, 3]);
+  assert.equal(store.rowOf(3), 6);
+
+  store.append(['z'.repeat(11)]);
+  assert.equal(store.rowCount, 9);
+});
+
+test('row positions survive trimming', () => {
+  const store = new LineStore(3);
+  store.setColumns(4);
+  store.append(['aaaaaaaa', 'b', 'cccccccc', 'd']);
+  assert.deepEqual(contents(store), ['b', 'cccccccc', 'd']);
+  assert.equal(store.rowOf(0), 0);
+  assert.equal(store.indexAtRow(2), 1);
+  assert.equal(store.rowCount, 4);
+});
+
+test('segments are parsed once and cached on the line', () => {
+  const store = new LineStore(10);
+  store.append(['\x1b[1;32mok\x1b[0m done']);
+  const line = store.get(0);
+  assert.equal(line.segments, null);
+  const segments = getLineSegments(line);
+  assert.equal(segments.map((segment) => segment.text).join(''), 'ok done');
+  assert.equal(getLineSegments(line), segments);
+});
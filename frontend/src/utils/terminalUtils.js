@@ -9,6 +9,49 @@ export const generateSessionId = () => {
   return `session_${timestamp}_${randomPart}`;
 };
 
+/**
+ * Get the browser's stable workspace identity, creating it on first use.
+ * The backend uses it to restore the workspace across visits when persistence is enabled.
+ */
+export const getWorkspaceIdentity = () => {
+  const key = 'learnlinux_workspace_identity';
+  try {
+    let identity = localStorage.getItem(key);
+    if (!identity) {
+      identity = crypto.randomUUID().replace(/-/g, '');
+      localStorage.setItem(key, identity);
+    }
+    return identity;
+  } catch (error) {
+    // Storage disabled (e.g. private mode): fall back to an ephemeral workspace
+    return null;
+  }
+};
+
+/**
+ * Reflow plain command output for readability (paragraph breaks, lists, headers)
+ */
+export const formatOutputText = (text) => {
+  if (!text) return text;
+  
+  // Handle long text with better word wrapping and spacing
+  return text
+    // Add proper spacing around punctuation for better readability
+    .replace(/([.!?])\s*([A-Z])/g, '$1\n\n$2')
+    // Add spacing after colons in structured text
+    .replace(/([a-zA-Z]):\s*([A-Z])/g, '$1:\n  $2')
+    // Handle bullet points and lists better
+    .replace(/^\s*[-•]\s+/gm, '\n• ')
+    // Handle numbered lists
+    .replace(/^\s*(\d+\.)\s+/gm, '\n$1 ')
+    // Improve spacing around headers or important sections
+    .replace(/^([A-Z][A-Z\s]+):$/gm, '\n$1:\n')
+    // Add breathing room around key sections
+    .replace(/(Key Ingredients|How the|Stage \d+|Condition [AB])/g, '\n$1')
+    // Clean up excessive newlines
+    .replace(/\n{3,}/g, '\n\n');
+};
+
 /**
  * Format terminal prompt
  */
@@ -0,0 +1,42 @@
+// Workspace export/import through the backend transfer endpoints
+import { API_URL } from './constants';
+
+const workspaceUrl = (sessionId, action) =>
+  `${API_URL}/workspace/${encodeURIComponent(sessionId)}/${action}/`;
+
+/**
+ * Download the session workspace as a gzipped tar archive.
+ * The token is the per-connection transfer token sent by the server on connect.
+ */
+export const exportWorkspace = async (sessionId, token) => {
+  const response = await fetch(`${workspaceUrl(sessionId, 'export')}?format=gz`, {
+    headers: { Authorization: `Bearer ${token}` }
+  });
+  if (!response.ok) {
+    const body = await response.json().catch(() => ({}));
+    throw new Error(body.error || `Export failed (${response.status})`);
+  }
+  const blob = await response.blob();
+  const link = document.createElement('a');
+  link.href = URL.createObjectURL(blob);
+  link.download = 'workspace.tar.gz';
+  link.click();
+  URL.revokeObjectURL(link.href);
+};
+
+/**
+ * Upload a tar (optionally compressed) archive into the session workspace.
+ * Resolves to { files, bytes } as reported by the server.
+ */
+export const importWorkspace = async (sessionId, token, file) => {
+  const response = await fetch(workspaceUrl(sessionId, 'import'), {
+    method: 'POST',
+    headers: { Authorization: `Bearer ${token}`, 'Content-Type': 'application/x-tar' },
+    body: file
+  });
+  const body = await response.json().catch(() => ({}));
+  if (!response.ok) {
+    throw new Error(body.error || `Import failed (${response.status})`);
+  }
+  return body;
+};